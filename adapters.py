@@ -1,5 +1,8 @@
-from typing import Type
+from functools import lru_cache
+from typing import Type, Iterable, List, Optional, Tuple
 from pydantic import BaseModel
+from pydantic.fields import SHAPE_SINGLETON
+from sqlalchemy import inspect
 
 from domain.domain_entity import DomainEntity
 from orm.db import Base as SAModel
@@ -11,3 +14,68 @@ def convert_model_to_schema(model: SAModel, schema: Type[BaseModel]) -> DomainEn
 
 def convert_schema_to_model(schema: BaseModel, model: Type[SAModel]) -> SAModel:
     return model(**schema.dict())
+
+
+def has_custom_validation(schema: Type[BaseModel]) -> bool:
+    config = schema.__config__
+    return bool(
+        schema.__validators__
+        or schema.__pre_root_validators__
+        or schema.__post_root_validators__
+        or config.anystr_strip_whitespace
+        or config.anystr_lower
+        or getattr(config, "anystr_upper", False)
+        or config.max_anystr_length is not None
+        or config.min_anystr_length
+    )
+
+
+def column_python_type(column_attr) -> Optional[type]:
+    try:
+        return column_attr.columns[0].type.python_type
+    except NotImplementedError:
+        return None
+
+
+@lru_cache(maxsize=None)
+def get_row_mapping(model: Type[SAModel], schema: Type[BaseModel]) -> Optional[Tuple[Tuple[str, str], ...]]:
+    """Pairs of (schema field, model column attribute).
+
+    None when constructing the schema from the column values could give something else than ``from_orm``:
+    the schema has validators, or a field is not a column of the exact same type.
+    """
+    if has_custom_validation(schema):
+        return None
+    column_types = {column_attr.key: column_python_type(column_attr) for column_attr in inspect(model).column_attrs}
+    mapping = []
+    for name, field in schema.__fields__.items():
+        if field.alias not in column_types or field.shape != SHAPE_SINGLETON or field.sub_fields:
+            return None
+        if column_types[field.alias] is not field.outer_type_:
+            return None
+        mapping.append((name, field.alias))
+    return tuple(mapping)
+
+
+def convert_rows_to_schemas(models: Iterable[SAModel], schema: Type[BaseModel]) -> List[BaseModel]:
+    """Converts a batch of rows loaded from the DB.
+
+    Column values are trusted, so schemas are constructed without type validation. Schemas which
+    :func:`get_row_mapping` cannot map go through ``from_orm`` instead.
+    """
+    models = list(models)
+    if not models:
+        return []
+    mapping = get_row_mapping(type(models[0]), schema)
+    if mapping is None:
+        return [schema.from_orm(model) for model in models]
+
+    construct = schema.construct
+    schemas = []
+    for model in models:
+        # reading the instance state directly bypasses attribute instrumentation
+        state = model.__dict__
+        schemas.append(
+            construct(**{name: state[attr] if attr in state else getattr(model, attr) for name, attr in mapping})
+        )
+    return schemas
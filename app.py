@@ -1,9 +1,23 @@
 from fastapi import FastAPI
 
 from services.user.api import router as user_router
+from services.admin.api import router as admin_router
 from exceptions import register_exceptions
+from middleware import CancelOnDisconnectMiddleware
+from orm.factories import build_existence_filters, build_search_indexes
+from tracing import TracingMiddleware
 
 app = FastAPI()
 
 app.include_router(user_router, prefix="/users")
+app.include_router(admin_router, prefix="/admin")
 register_exceptions(app)
+app.add_middleware(CancelOnDisconnectMiddleware)
+# added last, so that it wraps the other middleware
+app.add_middleware(TracingMiddleware)
+
+
+@app.on_event("startup")
+async def startup():
+    await build_search_indexes()
+    await build_existence_filters()
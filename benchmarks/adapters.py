@@ -0,0 +1,33 @@
+"""Compares row-to-schema conversion paths on a large list page.
+
+    python -m benchmarks.adapters [rows]
+"""
+import sys
+import timeit
+import uuid
+
+from adapters import convert_model_to_schema, convert_rows_to_schemas
+from orm.user.models import User
+from services.user.api import ApiUserEntity
+
+
+def make_rows(amount: int):
+    return [
+        User(id=uuid.uuid4(), email=f"user{i}@example.com", password="x", first_name=f"First{i}", last_name=f"Last{i}")
+        for i in range(amount)
+    ]
+
+
+def main(amount: int = 1000, repeat: int = 20):
+    rows = make_rows(amount)
+    from_orm = min(
+        timeit.repeat(lambda: [convert_model_to_schema(row, ApiUserEntity) for row in rows], number=1, repeat=repeat)
+    )
+    batch = min(timeit.repeat(lambda: convert_rows_to_schemas(rows, ApiUserEntity), number=1, repeat=repeat))
+    print(f"rows: {amount}")
+    print(f"convert_model_to_schema: {from_orm * 1000:.2f} ms")
+    print(f"convert_rows_to_schemas: {batch * 1000:.2f} ms ({from_orm / batch:.1f}x)")
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:2]))
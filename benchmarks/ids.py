@@ -0,0 +1,60 @@
+"""Compares insert throughput and primary key index size of the id strategies on SQLite.
+
+    python -m benchmarks.ids [rows]
+"""
+import os
+import sys
+import tempfile
+import time
+
+from sqlalchemy import create_engine, text
+
+from orm.ids import id_strategies
+from orm.user.models import User
+
+
+BATCH_SIZE = 1000
+
+
+def insert_rows(engine, strategy, amount: int) -> float:
+    started_at = time.perf_counter()
+    for offset in range(0, amount, BATCH_SIZE):
+        # a transaction per batch, so that pages get written out as they would be under live traffic
+        with engine.begin() as connection:
+            connection.execute(
+                User.__table__.insert(),
+                [
+                    {
+                        "id": strategy(),
+                        "email": f"user{i}@example.com",
+                        "password": "x",
+                        "first_name": f"First{i}",
+                        "last_name": f"Last{i}",
+                    }
+                    for i in range(offset, min(offset + BATCH_SIZE, amount))
+                ],
+            )
+    return time.perf_counter() - started_at
+
+
+def index_size(engine) -> int:
+    with engine.connect() as connection:
+        return connection.execute(
+            text("SELECT SUM(pgsize) FROM dbstat WHERE name = 'sqlite_autoindex_user_1'")
+        ).scalar_one()
+
+
+def main(amount: int = 500000):
+    print(f"rows: {amount}")
+    for name, strategy in id_strategies.items():
+        with tempfile.TemporaryDirectory() as directory:
+            engine = create_engine(f"sqlite:///{os.path.join(directory, 'ids.db')}")
+            User.__table__.create(engine)
+            elapsed = insert_rows(engine, strategy, amount)
+            size = index_size(engine)
+            engine.dispose()
+        print(f"{name}: {amount / elapsed:,.0f} rows/s, primary key index {size / 1024 / 1024:.1f} MiB")
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:2]))
@@ -1,10 +1,14 @@
 from fastapi import FastAPI, Request
 from fastapi.responses import JSONResponse
-from orm.repository import RepositoryException
+from orm.repository import NotFoundException, RepositoryException, QueryTimeoutException
+from services.crud.admission import AdmissionRejected
 
 
 def register_exceptions(app: FastAPI):
     app.exception_handler(RepositoryException)(repository_exception_handler)
+    app.exception_handler(QueryTimeoutException)(query_timeout_exception_handler)
+    app.exception_handler(NotFoundException)(not_found_exception_handler)
+    app.exception_handler(AdmissionRejected)(admission_rejected_handler)
 
 
 async def repository_exception_handler(request: Request, exc: RepositoryException):
@@ -12,3 +16,25 @@ async def repository_exception_handler(request: Request, exc: RepositoryExceptio
         status_code=422,
         content={"message": f"An error occured: {exc}"},
     )
+
+
+async def not_found_exception_handler(request: Request, exc: NotFoundException):
+    return JSONResponse(
+        status_code=404,
+        content={"message": str(exc)},
+    )
+
+
+async def query_timeout_exception_handler(request: Request, exc: QueryTimeoutException):
+    return JSONResponse(
+        status_code=504,
+        content={"message": f"A query has timed out: {exc}"},
+    )
+
+
+async def admission_rejected_handler(request: Request, exc: AdmissionRejected):
+    return JSONResponse(
+        status_code=503,
+        content={"message": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
@@ -0,0 +1,84 @@
+import threading
+
+from typing import Dict, Union
+
+
+class Counter:
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: Union[int, float] = 1):
+        with self._lock:
+            self.value += amount
+
+    def snapshot(self) -> Dict[str, Union[int, float]]:
+        return {"value": self.value}
+
+
+class Summary:
+    """Keeps count, sum, min and max of the observed values."""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+        self._lock = threading.Lock()
+
+    def observe(self, value: Union[int, float]):
+        with self._lock:
+            self.count += 1
+            self.total += value
+            self.min = value if self.min is None else min(self.min, value)
+            self.max = value if self.max is None else max(self.max, value)
+
+    def snapshot(self) -> Dict[str, Union[int, float, None]]:
+        return {
+            "count": self.count,
+            "sum": self.total,
+            "avg": self.total / self.count if self.count else None,
+            "min": self.min,
+            "max": self.max,
+        }
+
+
+class Gauge:
+    def __init__(self):
+        self.value: Union[int, float] = 0
+
+    def set(self, value: Union[int, float]):
+        self.value = value
+
+    def snapshot(self) -> Dict[str, Union[int, float]]:
+        return {"value": self.value}
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, Union[Counter, Summary, Gauge]] = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, name: str, metric_type):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = metric_type()
+            elif not isinstance(metric, metric_type):
+                raise ValueError(f"Metric {name} is already registered as {type(metric).__name__}.")
+        return metric
+
+    def counter(self, name: str) -> Counter:
+        return self._get_or_create(name, Counter)
+
+    def summary(self, name: str) -> Summary:
+        return self._get_or_create(name, Summary)
+
+    def gauge(self, name: str) -> Gauge:
+        return self._get_or_create(name, Gauge)
+
+    def snapshot(self) -> Dict[str, dict]:
+        return {name: metric.snapshot() for name, metric in sorted(self._metrics.items())}
+
+
+registry = MetricsRegistry()
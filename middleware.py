@@ -0,0 +1,56 @@
+import asyncio
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+
+class CancelOnDisconnectMiddleware:
+    """Cancels request handling as soon as the client disconnects.
+
+    The request messages are consumed eagerly so that a disconnect is noticed even while the handler is
+    awaiting a DB query. Cancellation propagates into the query, which closes the session and returns its
+    connection to the pool instead of holding it until the query completes.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        messages: asyncio.Queue = asyncio.Queue()
+        response_complete = False
+        client_disconnected = False
+
+        async def send_wrapper(message: Message):
+            nonlocal response_complete
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                response_complete = True
+            await send(message)
+
+        app_task = asyncio.ensure_future(self.app(scope, messages.get, send_wrapper))
+
+        async def watch_disconnect():
+            nonlocal client_disconnected
+            while True:
+                message = await receive()
+                await messages.put(message)
+                if message["type"] == "http.disconnect":
+                    if not response_complete:
+                        client_disconnected = True
+                        app_task.cancel()
+                    return
+
+        watcher = asyncio.ensure_future(watch_disconnect())
+        try:
+            await app_task
+        except asyncio.CancelledError:
+            if not client_disconnected:
+                raise
+        finally:
+            # when this task is cancelled itself, the handler must not keep running orphaned
+            for task in (app_task, watcher):
+                if not task.done():
+                    task.cancel()
+            await asyncio.gather(app_task, watcher, return_exceptions=True)
@@ -0,0 +1,68 @@
+import asyncio
+
+from typing import Any, Awaitable, Callable, List, Optional, Set, Tuple
+
+from metrics import registry
+
+
+BatchHandler = Callable[[List[Any]], Awaitable[List[Any]]]
+
+
+class WriteBatcher:
+    """Coalesces concurrent submissions into batches.
+
+    A batch is flushed once ``max_size`` items are pending or ``window`` seconds have passed since the first
+    pending item arrived. ``handler`` receives the items of a batch and must return a list of the same length
+    holding a result or an exception instance per item; every submitter gets back its own entry.
+    """
+
+    def __init__(self, name: str, handler: BatchHandler, window: float, max_size: int):
+        self.name = name
+        self.handler = handler
+        self.window = window
+        self.max_size = max_size
+        self._pending: List[Tuple[Any, asyncio.Future, float]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        # the loop references tasks weakly only, a batch task must not be garbage collected while running
+        self._tasks: Set[asyncio.Future] = set()
+        self._batch_size = registry.summary(f"{name}.batch_size")
+        self._added_latency = registry.summary(f"{name}.added_latency_seconds")
+
+    async def submit(self, item: Any) -> Any:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future, loop.time()))
+        if len(self._pending) >= self.max_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.ensure_future(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: List[Tuple[Any, asyncio.Future, float]]):
+        now = asyncio.get_running_loop().time()
+        self._batch_size.observe(len(batch))
+        for _, _, submitted_at in batch:
+            self._added_latency.observe(now - submitted_at)
+
+        try:
+            results = await self.handler([item for item, _, _ in batch])
+        except Exception as exc:
+            results = [exc] * len(batch)
+
+        for (_, future, _), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, BaseException):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
@@ -0,0 +1,254 @@
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Dict, Iterable, Optional, Tuple, Union
+
+from config import Config
+from metrics import registry
+
+
+class CacheBackend(ABC):
+    """Store of byte values under (group, key), where a group is invalidated as a whole.
+
+    An invalidation also blocks, for ``invalidation_ttl`` seconds, the values read from the database before it, which
+    would otherwise be stored after it and outlive the write.
+
+    Backends count their hits and misses and report their footprint to the metrics registry, as
+    ``{name}.hits``, ``{name}.misses``, ``{name}.hit_ratio``, ``{name}.entries`` and ``{name}.bytes``.
+    """
+
+    def __init__(self, name: str, invalidation_ttl: float = 60.0):
+        self.invalidation_ttl = invalidation_ttl
+        self._hits = registry.counter(f"{name}.hits")
+        self._misses = registry.counter(f"{name}.misses")
+        self._hit_ratio = registry.gauge(f"{name}.hit_ratio")
+        self._entries = registry.gauge(f"{name}.entries")
+        self._bytes = registry.gauge(f"{name}.bytes")
+
+    def get(self, group: str, key: str) -> Optional[bytes]:
+        value = self.load(group, key)
+        (self._misses if value is None else self._hits).inc()
+        self._hit_ratio.set(self._hits.value / (self._hits.value + self._misses.value))
+        return value
+
+    def set(self, group: str, key: str, value: bytes, ttl: float, read_at: Optional[float] = None):
+        """Stores the value, unless its group has been invalidated since ``read_at``, when the value was read."""
+        self.store(group, key, value, time.time() + ttl, read_at)
+
+    @abstractmethod
+    def load(self, group: str, key: str) -> Optional[bytes]:
+        pass
+
+    @abstractmethod
+    def store(self, group: str, key: str, value: bytes, expires_at: float, read_at: Optional[float] = None):
+        pass
+
+    @abstractmethod
+    def invalidate(self, groups: Iterable[str]):
+        pass
+
+    @abstractmethod
+    def footprint(self) -> Tuple[int, int]:
+        """Number of entries and bytes taken."""
+        pass
+
+    def stats(self) -> Dict[str, Union[int, float]]:
+        entries, size = self.footprint()
+        self._entries.set(entries)
+        self._bytes.set(size)
+        return {
+            "hits": self._hits.value,
+            "misses": self._misses.value,
+            "hit_ratio": self._hit_ratio.value,
+            "entries": entries,
+            "bytes": size,
+        }
+
+
+class MemoryCacheBackend(CacheBackend):
+    """LRU cache of the process, for a single worker."""
+
+    def __init__(self, name: str = "cache", max_entries: int = 10000, invalidation_ttl: float = 60.0):
+        super().__init__(name, invalidation_ttl)
+        self.max_entries = max_entries
+        self._entries_by_key: "OrderedDict[Tuple[str, str], Tuple[bytes, float]]" = OrderedDict()
+        self._keys_by_group: Dict[str, Dict[str, None]] = {}
+        # time of the last invalidation of the groups, the oldest first
+        self._invalidated_at: "OrderedDict[str, float]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def load(self, group: str, key: str) -> Optional[bytes]:
+        with self._lock:
+            entry = self._entries_by_key.get((group, key))
+            if entry is None:
+                return None
+            if entry[1] <= time.time():
+                self._remove((group, key))
+                return None
+            self._entries_by_key.move_to_end((group, key))
+            return entry[0]
+
+    def store(self, group: str, key: str, value: bytes, expires_at: float, read_at: Optional[float] = None):
+        with self._lock:
+            if read_at is not None and self._invalidated_at.get(group, read_at - 1) >= read_at:
+                return
+            self._remove((group, key))
+            self._entries_by_key[(group, key)] = (value, expires_at)
+            self._keys_by_group.setdefault(group, {})[key] = None
+            self._size += len(group) + len(key) + len(value)
+            while len(self._entries_by_key) > self.max_entries:
+                self._remove(next(iter(self._entries_by_key)))
+
+    def invalidate(self, groups: Iterable[str]):
+        now = time.time()
+        with self._lock:
+            for group in groups:
+                self._invalidated_at.pop(group, None)
+                self._invalidated_at[group] = now
+                for key in list(self._keys_by_group.get(group, ())):
+                    self._remove((group, key))
+            while self._invalidated_at and next(iter(self._invalidated_at.values())) <= now - self.invalidation_ttl:
+                self._invalidated_at.popitem(last=False)
+
+    def footprint(self) -> Tuple[int, int]:
+        return len(self._entries_by_key), self._size
+
+    def _remove(self, entry_key: Tuple[str, str]):
+        entry = self._entries_by_key.pop(entry_key, None)
+        if entry is None:
+            return
+        group, key = entry_key
+        self._size -= len(group) + len(key) + len(entry[0])
+        keys = self._keys_by_group[group]
+        del keys[key]
+        if not keys:
+            del self._keys_by_group[group]
+
+
+class SQLiteCacheBackend(CacheBackend):
+    """Cache shared by the worker processes of a machine, in a SQLite database file in WAL mode.
+
+    Readers do not block the writer nor each other under WAL, and every worker sees the invalidations of the
+    others at once, as there is no copy of the entries in the processes. Calls are blocking, but served from
+    the page cache they take microseconds. Expired entries, then the ones expiring soonest, are pruned every
+    ``prune_every`` writes to keep the store under ``max_entries``.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        name: str = "cache",
+        max_entries: int = 100000,
+        prune_every: int = 1000,
+        invalidation_ttl: float = 60.0,
+    ):
+        super().__init__(name, invalidation_ttl)
+        self.path = path
+        self.max_entries = max_entries
+        self.prune_every = prune_every
+        self._writes = 0
+        self._local = threading.local()
+        self._connection().executescript(
+            """
+            CREATE TABLE IF NOT EXISTS cache_entry (
+                "group" TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value BLOB NOT NULL,
+                expires_at REAL NOT NULL,
+                PRIMARY KEY ("group", key)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS ix_cache_entry_expires_at ON cache_entry (expires_at);
+            CREATE TABLE IF NOT EXISTS cache_invalidation (
+                "group" TEXT PRIMARY KEY,
+                invalidated_at REAL NOT NULL
+            ) WITHOUT ROWID;
+            """
+        )
+
+    def _connection(self) -> sqlite3.Connection:
+        # connections cannot be shared between threads
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            # a crash may lose the last writes, which a cache can afford
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def load(self, group: str, key: str) -> Optional[bytes]:
+        row = (
+            self._connection()
+            .execute(
+                'SELECT value FROM cache_entry WHERE "group" = ? AND key = ? AND expires_at > ?',
+                (group, key, time.time()),
+            )
+            .fetchone()
+        )
+        return row[0] if row is not None else None
+
+    def store(self, group: str, key: str, value: bytes, expires_at: float, read_at: Optional[float] = None):
+        # checked within the write, which the invalidations of the other workers cannot interleave with
+        self._connection().execute(
+            'INSERT OR REPLACE INTO cache_entry ("group", key, value, expires_at) SELECT ?, ?, ?, ? '
+            'WHERE NOT EXISTS (SELECT 1 FROM cache_invalidation WHERE "group" = ? AND invalidated_at >= ?)',
+            (group, key, value, expires_at, group, read_at if read_at is not None else float("inf")),
+        )
+        self._writes += 1
+        if self._writes % self.prune_every == 0:
+            self.prune()
+
+    def invalidate(self, groups: Iterable[str]):
+        groups = list(groups)
+        if groups:
+            connection = self._connection()
+            # the fills of the values read before are blocked first, then the values stored before are removed
+            now = time.time()
+            connection.executemany(
+                'INSERT OR REPLACE INTO cache_invalidation ("group", invalidated_at) VALUES (?, ?)',
+                [(group, now) for group in groups],
+            )
+            placeholders = ", ".join("?" * len(groups))
+            connection.execute(f'DELETE FROM cache_entry WHERE "group" IN ({placeholders})', groups)
+
+    def prune(self):
+        connection = self._connection()
+        connection.execute("DELETE FROM cache_entry WHERE expires_at <= ?", (time.time(),))
+        connection.execute(
+            "DELETE FROM cache_invalidation WHERE invalidated_at <= ?", (time.time() - self.invalidation_ttl,)
+        )
+        surplus = connection.execute("SELECT COUNT(*) FROM cache_entry").fetchone()[0] - self.max_entries
+        if surplus > 0:
+            connection.execute(
+                "DELETE FROM cache_entry WHERE (\"group\", key) IN "
+                "(SELECT \"group\", key FROM cache_entry ORDER BY expires_at LIMIT ?)",
+                (surplus,),
+            )
+
+    def footprint(self) -> Tuple[int, int]:
+        entries = self._connection().execute("SELECT COUNT(*) FROM cache_entry").fetchone()[0]
+        size = sum(os.path.getsize(path) for path in (self.path, f"{self.path}-wal") if os.path.exists(path))
+        return entries, size
+
+
+cache_backends = {
+    "memory": lambda: MemoryCacheBackend(max_entries=int(Config.get("CACHE_MAX_ENTRIES", 10000))),
+    "sqlite": lambda: SQLiteCacheBackend(
+        Config.get("CACHE_PATH", os.path.join(tempfile.gettempdir(), "fastapi-tryout-cache.db")),
+        max_entries=int(Config.get("CACHE_MAX_ENTRIES", 100000)),
+    ),
+}
+
+
+@lru_cache
+def cache_backend() -> Optional[CacheBackend]:
+    """The backend named by CACHE_BACKEND, None when caching is off."""
+    name = Config.get("CACHE_BACKEND", "")
+    return cache_backends[name]() if name else None
@@ -0,0 +1,56 @@
+import asyncio
+import datetime
+import uuid
+
+from collections import defaultdict
+from contextlib import contextmanager
+from pydantic import BaseModel
+from typing import Any, DefaultDict, Iterator, List, Optional, Set
+
+from metrics import registry
+
+
+class ChangeEvent(BaseModel):
+    seq: int
+    entity: str
+    operation: str
+    entity_id: uuid.UUID
+    payload: Optional[Any] = None
+    created_at: datetime.datetime
+
+    class Config:
+        orm_mode = True
+
+
+class EventBus:
+    """In-process fan-out of committed change events to the subscribers of an entity.
+
+    The change log table stays the source of truth: events only wake subscribers up, and a subscriber which
+    falls behind by more than ``max_queue`` events has its queue dropped and has to catch up from the table.
+    """
+
+    def __init__(self, max_queue: int = 1000):
+        self.max_queue = max_queue
+        self._subscribers: DefaultDict[str, Set[asyncio.Queue]] = defaultdict(set)
+        self._published = registry.counter("changefeed.published")
+
+    def publish(self, events: List[ChangeEvent]):
+        for event in events:
+            self._published.inc()
+            for queue in list(self._subscribers[event.entity]):
+                try:
+                    queue.put_nowait(event)
+                except asyncio.QueueFull:
+                    self._subscribers[event.entity].discard(queue)
+
+    @contextmanager
+    def subscribe(self, entity: str) -> Iterator[asyncio.Queue]:
+        queue: asyncio.Queue = asyncio.Queue(self.max_queue)
+        self._subscribers[entity].add(queue)
+        try:
+            yield queue
+        finally:
+            self._subscribers[entity].discard(queue)
+
+
+event_bus = EventBus()
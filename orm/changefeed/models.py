@@ -0,0 +1,34 @@
+from sqlalchemy import Column, Integer, String, DateTime, JSON, event, func, select
+from sqlalchemy.orm import Session
+from sqlalchemy_utils.types.uuid import UUIDType
+
+from ..db import Base
+
+
+class ChangeLogEntry(Base):
+    __tablename__ = "change_log"
+
+    seq = Column("seq", Integer, primary_key=True, autoincrement=True)
+    entity = Column("entity", String(64), nullable=False, index=True)
+    operation = Column("operation", String(16), nullable=False)
+    entity_id = Column("entity_id", UUIDType(), nullable=False)
+    payload = Column("payload", JSON, nullable=True)
+    created_at = Column("created_at", DateTime, nullable=False)
+
+
+# key of the Postgres advisory lock taken by the transactions writing the change log
+CHANGE_LOG_LOCK = 0x6368616E6765
+
+
+@event.listens_for(Session, "before_flush")
+def lock_change_log(session, flush_context, instances):
+    """Serializes the transactions writing the change log on Postgres, from their first flushed entry to their end.
+
+    Sequence numbers are taken on insert, so concurrent transactions would otherwise commit them in any order, and a
+    reader which has moved past a higher one would never see a lower one committed later. The lock makes the entries
+    committed in sequence order. SQLite serializes the writing transactions already.
+    """
+    if any(isinstance(instance, ChangeLogEntry) for instance in session.new):
+        connection = session.connection()
+        if connection.dialect.name == "postgresql":
+            connection.execute(select(func.pg_advisory_xact_lock(CHANGE_LOG_LOCK)))
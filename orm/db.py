@@ -1,18 +1,38 @@
 from functools import lru_cache
+from typing import List
 from sqlalchemy.ext.asyncio import AsyncSession as SAAsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 
 from config import Config
+from orm.query_budget import track_queries
 
 
 @lru_cache
 def engine_factory():
-    return create_async_engine(Config.get("DB_CONNECT"))
+    engine = create_async_engine(Config.get("DB_CONNECT"))
+    track_queries(engine)
+    return engine
 
 
 def session_factory():
     return sessionmaker(engine_factory(), expire_on_commit=False, class_=SAAsyncSession)()
 
 
+def shard_urls() -> List[str]:
+    """Connection URLs of the shards, comma separated in DB_SHARDS, empty when sharding is off."""
+    return [url.strip() for url in Config.get("DB_SHARDS", "").split(",") if url.strip()]
+
+
+@lru_cache
+def shard_engine_factory(shard: int):
+    engine = create_async_engine(shard_urls()[shard])
+    track_queries(engine)
+    return engine
+
+
+def shard_session_factory(shard: int):
+    return sessionmaker(shard_engine_factory(shard), expire_on_commit=False, class_=SAAsyncSession)()
+
+
 Base = declarative_base()
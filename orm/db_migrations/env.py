@@ -21,9 +21,19 @@ fileConfig(config.config_file_name)
 # from myapp import mymodel
 # target_metadata = mymodel.Base.metadata
 from orm.user.models import Base
+import orm.idempotency.models
+import orm.changefeed.models
+import orm.stats.models
+from orm.online_migrations import checkpoint_table
 
 target_metadata = Base.metadata
 
+
+def include_object(object, name, type_, reflected, compare_to):
+    """Leaves out of autogenerate the checkpoints of the backfills, which create their table themselves."""
+    return not (type_ == "table" and name == checkpoint_table.name)
+
+
 # other values from the config, defined by the needs of env.py,
 # can be acquired:
 # my_important_option = config.get_main_option("my_important_option")
@@ -49,6 +59,7 @@ def run_migrations_offline():
     context.configure(
         url=url,
         target_metadata=target_metadata,
+        include_object=include_object,
         literal_binds=True,
         dialect_opts={"paramstyle": "named"},
     )
@@ -67,7 +78,7 @@ def run_migrations_online():
     from sqlalchemy import create_engine
 
     with create_engine(DATABASE_URL).connect() as connection:
-        context.configure(connection=connection, target_metadata=target_metadata)
+        context.configure(connection=connection, target_metadata=target_metadata, include_object=include_object)
 
         with context.begin_transaction():
             context.run_migrations()
@@ -0,0 +1,35 @@
+"""idempotency record
+
+Revision ID: 7c2f5d0e9a41
+Revises: 40670aaf713d
+Create Date: 2026-10-19 10:12:31.402117
+
+"""
+import sqlalchemy as sa
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "7c2f5d0e9a41"
+down_revision = "40670aaf713d"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "idempotency_record",
+        sa.Column("key", sa.String(length=255), nullable=False),
+        sa.Column("fingerprint", sa.String(length=64), nullable=False),
+        sa.Column("status_code", sa.Integer(), nullable=False),
+        sa.Column("content", sa.JSON(), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint("key"),
+    )
+    op.create_index(op.f("ix_idempotency_record_created_at"), "idempotency_record", ["created_at"], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f("ix_idempotency_record_created_at"), table_name="idempotency_record")
+    op.drop_table("idempotency_record")
@@ -0,0 +1,37 @@
+"""change log
+
+Revision ID: b31e8a6f2c90
+Revises: 7c2f5d0e9a41
+Create Date: 2026-10-19 15:20:07.118263
+
+"""
+import sqlalchemy as sa
+import sqlalchemy_utils
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "b31e8a6f2c90"
+down_revision = "7c2f5d0e9a41"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "change_log",
+        sa.Column("seq", sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column("entity", sa.String(length=64), nullable=False),
+        sa.Column("operation", sa.String(length=16), nullable=False),
+        sa.Column("entity_id", sqlalchemy_utils.types.uuid.UUIDType(), nullable=False),
+        sa.Column("payload", sa.JSON(), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint("seq"),
+    )
+    op.create_index(op.f("ix_change_log_entity"), "change_log", ["entity"], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f("ix_change_log_entity"), table_name="change_log")
+    op.drop_table("change_log")
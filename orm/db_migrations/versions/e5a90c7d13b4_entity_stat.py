@@ -0,0 +1,32 @@
+"""entity stat
+
+Revision ID: e5a90c7d13b4
+Revises: b31e8a6f2c90
+Create Date: 2026-10-19 18:42:51.530914
+
+"""
+import sqlalchemy as sa
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "e5a90c7d13b4"
+down_revision = "b31e8a6f2c90"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "entity_stat",
+        sa.Column("entity", sa.String(length=64), nullable=False),
+        sa.Column("dimension", sa.String(length=64), nullable=False),
+        sa.Column("value", sa.String(length=255), nullable=False),
+        sa.Column("count", sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint("entity", "dimension", "value"),
+    )
+
+
+def downgrade():
+    op.drop_table("entity_stat")
@@ -0,0 +1,33 @@
+"""user email unique
+
+Revision ID: f3c81d27a5e6
+Revises: e5a90c7d13b4
+Create Date: 2026-10-19 21:07:14.208355
+
+"""
+import sqlalchemy as sa
+
+from alembic import op
+
+from orm.online_migrations import create_index_concurrently, drop_index_concurrently
+
+
+# revision identifiers, used by Alembic.
+revision = "f3c81d27a5e6"
+down_revision = "e5a90c7d13b4"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # a failed concurrent build leaves an invalid index behind on Postgres, duplicates are reported beforehand
+    duplicates = op.get_bind().execute(
+        sa.text('SELECT email FROM "user" GROUP BY email HAVING COUNT(*) > 1 LIMIT 10')
+    ).scalars().all()
+    if duplicates:
+        raise RuntimeError(f"Emails have to be made unique before migrating, duplicated ones: {', '.join(duplicates)}")
+    create_index_concurrently("ix_user_email", "user", ["email"], unique=True)
+
+
+def downgrade():
+    drop_index_concurrently("ix_user_email", "user")
@@ -0,0 +1,157 @@
+import asyncio
+import hashlib
+import math
+import time
+import uuid
+
+from collections import OrderedDict
+from typing import AsyncIterable, Iterable, List, Optional
+
+from metrics import registry
+
+
+class BloomFilter:
+    """Set of ids answering membership with no false negatives and a bounded rate of false positives.
+
+    Sized for ``capacity`` ids at a ``false_positive_rate``; the rate goes up as more ids are added.
+    """
+
+    def __init__(self, capacity: int, false_positive_rate: float):
+        self.capacity = max(capacity, 1)
+        self.bit_count = math.ceil(-self.capacity * math.log(false_positive_rate) / math.log(2) ** 2)
+        self.hash_count = max(round(self.bit_count / self.capacity * math.log(2)), 1)
+        self.count = 0
+        self._bits = bytearray((self.bit_count + 7) // 8)
+
+    def _positions(self, entity_id: uuid.UUID) -> Iterable[int]:
+        # two hashes combined give the k positions (Kirsch and Mitzenmacher)
+        digest = hashlib.blake2b(entity_id.bytes, digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], "big"), int.from_bytes(digest[8:], "big") | 1
+        return ((first + position * second) % self.bit_count for position in range(self.hash_count))
+
+    def add(self, entity_id: uuid.UUID):
+        added = False
+        for position in self._positions(entity_id):
+            mask = 1 << (position & 7)
+            if not self._bits[position >> 3] & mask:
+                self._bits[position >> 3] |= mask
+                added = True
+        # ids added again are not counted, so that the count follows the fill of the bits
+        if added:
+            self.count += 1
+
+    def __contains__(self, entity_id: uuid.UUID) -> bool:
+        return all(self._bits[position >> 3] & 1 << (position & 7) for position in self._positions(entity_id))
+
+    @property
+    def size(self) -> int:
+        """Bytes taken by the bits."""
+        return len(self._bits)
+
+    def estimated_false_positive_rate(self) -> float:
+        return (1 - math.exp(-self.hash_count * self.count / self.bit_count)) ** self.hash_count
+
+
+class ExistenceFilter:
+    """Tells the ids which certainly do not exist, so that lookups of them can be answered without the DB.
+
+    Existing ids are kept in a Bloom filter, which is built from a scan of the table and grows with the creates.
+    Ids which have passed the filter but have not been found, deleted ones or false positives, are kept in a
+    negative cache for ``negative_ttl`` seconds. A filter holding more ids than its capacity is :attr:`full`, and
+    has to be rebuilt, at twice the number of ids at least, to keep to its false positive rate.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        capacity: int,
+        false_positive_rate: float = 0.01,
+        negative_ttl: float = 5.0,
+        negative_size: int = 10000,
+    ):
+        self.capacity = capacity
+        self.false_positive_rate = false_positive_rate
+        self.negative_ttl = negative_ttl
+        self.negative_size = negative_size
+        self.ready = False
+        # sequence number of the last change log entry applied
+        self.seq = 0
+        self.refreshed_at = 0.0
+        self._bloom = BloomFilter(capacity, false_positive_rate)
+        self._negative: "OrderedDict[uuid.UUID, float]" = OrderedDict()
+        # ids created while the filter is being built, added once it is ready
+        self._pending: Optional[List[uuid.UUID]] = None
+        self._build_lock = asyncio.Lock()
+        self._filtered = registry.counter(f"{name}.filtered")
+        # ids passing the filter which are not found, deleted ones and false positives
+        self._missed = registry.counter(f"{name}.missed")
+        self._size = registry.gauge(f"{name}.bytes")
+        self._ids = registry.gauge(f"{name}.ids")
+        self._rate = registry.gauge(f"{name}.false_positive_rate")
+
+    @property
+    def full(self) -> bool:
+        return self._bloom.count > self._bloom.capacity
+
+    async def build(
+        self, ids: AsyncIterable[uuid.UUID], seq: int = 0, force: bool = True, expected: Optional[int] = None
+    ):
+        """Rebuilds the filter from a scan of the ids, taken after the change log entry ``seq``.
+
+        The ids are added as they are scanned, to a filter sized for twice the ``expected`` number of them; one
+        growing past it meanwhile ends up :attr:`full`. Without ``force``, a filter which has got ready meanwhile
+        is left as is.
+        """
+        async with self._build_lock:
+            if self.ready and not force:
+                return
+            self._pending = []
+            bloom = BloomFilter(max(self.capacity, (expected or 0) * 2), self.false_positive_rate)
+            async for entity_id in ids:
+                bloom.add(entity_id)
+            pending, self._pending = self._pending, None
+            for entity_id in pending:
+                bloom.add(entity_id)
+            self._bloom = bloom
+            self.seq = seq
+            self.refreshed_at = time.monotonic()
+            self._negative.clear()
+            self.ready = True
+            self._report()
+
+    def add(self, ids: Iterable[uuid.UUID]):
+        for entity_id in ids:
+            if self._pending is not None:
+                self._pending.append(entity_id)
+            self._bloom.add(entity_id)
+            self._negative.pop(entity_id, None)
+        self._report()
+
+    def might_exist(self, entity_id: uuid.UUID) -> bool:
+        if not self.ready:
+            return True
+        expires_at = self._negative.get(entity_id)
+        if expires_at is not None:
+            if expires_at > time.monotonic():
+                self._filtered.inc()
+                return False
+            del self._negative[entity_id]
+        if entity_id not in self._bloom:
+            self._filtered.inc()
+            return False
+        return True
+
+    def missing(self, entity_id: uuid.UUID):
+        """Records an id which has passed the filter but has not been found."""
+        if not self.ready:
+            return
+        self._missed.inc()
+        self._negative[entity_id] = time.monotonic() + self.negative_ttl
+        self._negative.move_to_end(entity_id)
+        if len(self._negative) > self.negative_size:
+            self._negative.popitem(last=False)
+
+    def _report(self):
+        self._size.set(self._bloom.size)
+        self._ids.set(self._bloom.count)
+        self._rate.set(self._bloom.estimated_false_positive_rate())
@@ -1,6 +1,8 @@
 from typing import Dict, Type
 
+from .db import shard_urls
 from .repository import SARepository
+from .sharding import sharded
 from services.user.repository import UserRepository
 
 
@@ -10,4 +12,21 @@ repository_registry: Dict[str, Type[SARepository]] = {
 
 
 def repo_factory(name: str):
-    return repository_registry[name]
+    repo = repository_registry[name]
+    if shard_urls():
+        return sharded(repo)
+    return repo
+
+
+async def build_search_indexes():
+    for name in repository_registry:
+        repo = repo_factory(name)
+        if repo.search_fields:
+            await repo.build_search_index()
+
+
+async def build_existence_filters():
+    for name in repository_registry:
+        repo = repo_factory(name)
+        if repo.existence_filter_capacity is not None:
+            await repo.build_existence_filter()
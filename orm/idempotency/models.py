@@ -0,0 +1,13 @@
+from sqlalchemy import Column, String, Integer, DateTime, JSON
+
+from ..db import Base
+
+
+class IdempotencyRecord(Base):
+    __tablename__ = "idempotency_record"
+
+    key = Column("key", String(255), primary_key=True)
+    fingerprint = Column("fingerprint", String(64), nullable=False)
+    status_code = Column("status_code", Integer, nullable=False)
+    content = Column("content", JSON, nullable=True)
+    created_at = Column("created_at", DateTime, nullable=False, index=True)
@@ -0,0 +1,83 @@
+import asyncio
+import logging
+import time
+
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, NamedTuple, Optional
+
+from metrics import registry
+
+
+logger = logging.getLogger(__name__)
+
+
+class ListCacheEntry(NamedTuple):
+    value: Any
+    # generation of the table the value has been loaded at
+    generation: int
+    stored_at: float
+    # when a lookup has first found the generation outdated
+    stale_since: Optional[float] = None
+
+
+class ListCache:
+    """LRU of results of list queries, which writes make stale by bumping the generation of their table.
+
+    An entry is fresh while its generation is the current one and it is younger than ``ttl`` seconds. A stale entry
+    is still served for ``stale_ttl`` seconds while a single load refreshes it in the background, and concurrent
+    misses of a key wait on a single load, so that a burst of reads after a write does not run the query once per
+    read. Lookups are counted in the ``{name}.hits``, ``{name}.stale_hits`` and ``{name}.misses`` metrics.
+    """
+
+    def __init__(self, name: str, max_entries: int, ttl: float, stale_ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._entries: "OrderedDict[Hashable, ListCacheEntry]" = OrderedDict()
+        self._loading: Dict[Hashable, "asyncio.Future[Any]"] = {}
+        self._hits = registry.counter(f"{name}.hits")
+        self._stale_hits = registry.counter(f"{name}.stale_hits")
+        self._misses = registry.counter(f"{name}.misses")
+        self._size = registry.gauge(f"{name}.entries")
+
+    async def get(self, key: Hashable, generation: int, load: Callable[[], Awaitable[Any]]) -> Any:
+        now = time.monotonic()
+        entry = self._entries.get(key)
+        if entry is not None and now - entry.stored_at < self.ttl:
+            self._entries.move_to_end(key)
+            if entry.generation == generation:
+                self._hits.inc()
+                return entry.value
+            if entry.stale_since is None:
+                entry = self._entries[key] = entry._replace(stale_since=now)
+            if now - entry.stale_since < self.stale_ttl:  # type: ignore
+                self._stale_hits.inc()
+                self.refresh(key, generation, load)
+                return entry.value
+        self._misses.inc()
+        # the load goes on for the other callers waiting on it when this one is cancelled
+        return await asyncio.shield(self.refresh(key, generation, load))
+
+    def refresh(self, key: Hashable, generation: int, load: Callable[[], Awaitable[Any]]) -> "asyncio.Future[Any]":
+        """Loads the value of the key, unless a load of it is already running."""
+        future = self._loading.get(key)
+        if future is None:
+            future = asyncio.ensure_future(self._store(key, generation, load))
+            self._loading[key] = future
+            future.add_done_callback(lambda done: self._loaded(key, done))
+        return future
+
+    async def _store(self, key: Hashable, generation: int, load: Callable[[], Awaitable[Any]]) -> Any:
+        value = await load()
+        self._entries[key] = ListCacheEntry(value, generation, time.monotonic())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        self._size.set(len(self._entries))
+        return value
+
+    def _loaded(self, key: Hashable, future: "asyncio.Future[Any]"):
+        del self._loading[key]
+        # the refreshes in the background have nobody to raise to
+        if not future.cancelled() and future.exception() is not None:
+            logger.warning(f"Loading the list result {key} has failed: {future.exception()!r}")
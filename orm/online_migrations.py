@@ -0,0 +1,172 @@
+"""Helpers for migrations of large tables which have to stay online.
+
+Backfills run from a revision file in primary key order, one short transaction per batch, instead of one
+statement locking the whole table:
+
+    from orm.online_migrations import backfill, create_index_concurrently
+
+    def upgrade():
+        op.add_column("user", sa.Column("email_lower", sa.String(255), nullable=True))
+        # the shape of the table at this revision, rather than the current model
+        user = sa.Table(
+            "user",
+            sa.MetaData(),
+            sa.Column("id", sqlalchemy_utils.types.uuid.UUIDType(), primary_key=True),
+            sa.Column("email", sa.String(255)),
+            sa.Column("email_lower", sa.String(255)),
+        )
+        backfill(
+            user,
+            {"email_lower": sa.func.lower(user.c.email)},
+            where=user.c.email_lower.is_(None),
+            checkpoint="user_email_lower",
+        )
+        create_index_concurrently("ix_user_email_lower", "user", ["email_lower"])
+
+A backfill has to be idempotent: a batch interrupted between its update and its checkpoint runs again on resume.
+"""
+import datetime
+import logging
+import time
+
+from alembic import op
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, and_, func, select, update
+from sqlalchemy.engine import Connection
+from sqlalchemy.sql import ColumnElement
+from typing import Any, Callable, List, Mapping, NamedTuple, Optional, Sequence
+
+
+# under alembic's logger, so that the progress shows with the logging setup of alembic.ini
+logger = logging.getLogger("alembic.online_migrations")
+
+checkpoint_table = Table(
+    "migration_checkpoint",
+    MetaData(),
+    Column("name", String(255), primary_key=True),
+    Column("last_key", String(255), nullable=False),
+    Column("rows", Integer, nullable=False),
+    Column("updated_at", DateTime, nullable=False),
+)
+
+
+class BackfillProgress(NamedTuple):
+    name: str
+    batches: int
+    rows: int
+    # rows left to backfill when the backfill started, when counted
+    total: Optional[int]
+    last_key: Any
+    elapsed: float
+
+
+def log_progress(progress: BackfillProgress):
+    done = f"{progress.rows}/{progress.total}" if progress.total is not None else str(progress.rows)
+    rate = progress.rows / progress.elapsed if progress.elapsed else 0
+    logger.info(f"{progress.name}: {done} rows in {progress.batches} batches, {rate:.0f} rows/s")
+
+
+def load_checkpoint(connection: Connection, name: str, key_column: Column) -> Optional[Any]:
+    checkpoint_table.create(connection, checkfirst=True)
+    last_key = connection.execute(
+        select(checkpoint_table.c.last_key).where(checkpoint_table.c.name == name)
+    ).scalar_one_or_none()
+    if last_key is None:
+        return None
+    return key_column.type.python_type(last_key)
+
+
+def save_checkpoint(connection: Connection, name: str, last_key: Any, rows: int):
+    values = {"last_key": str(last_key), "rows": rows, "updated_at": datetime.datetime.utcnow()}
+    updated = connection.execute(update(checkpoint_table).where(checkpoint_table.c.name == name).values(**values))
+    if not updated.rowcount:
+        connection.execute(checkpoint_table.insert().values(name=name, **values))
+
+
+def where_conditions(where: Optional[ColumnElement]) -> List[ColumnElement]:
+    return [where] if where is not None else []
+
+
+def backfill_batches(
+    connection: Connection,
+    table: Table,
+    values: Mapping[str, Any],
+    where: Optional[ColumnElement] = None,
+    batch_size: int = 1000,
+    pause: float = 0.0,
+    checkpoint: Optional[str] = None,
+    count_total: bool = True,
+    progress: Callable[[BackfillProgress], None] = log_progress,
+) -> int:
+    """Updates the rows matching ``where`` with ``values`` in batches of ``batch_size`` rows in primary key order.
+
+    Every batch is a transaction of its own, followed by a ``pause`` of as many seconds to let other traffic through.
+    With a ``checkpoint`` name, the last key done is stored after each batch, and a rerun after a failure resumes
+    after it; the checkpoint is dropped once the backfill completes. The connection must not be within a
+    transaction. Returns the number of rows updated.
+    """
+    key_columns = list(table.primary_key.columns)
+    if len(key_columns) != 1:
+        raise ValueError(f"Backfills need a single column primary key, {table.name} has {len(key_columns)}.")
+    key_column = key_columns[0]
+    name = checkpoint or f"{table.name}.backfill"
+
+    with connection.begin():
+        last_key = load_checkpoint(connection, checkpoint, key_column) if checkpoint else None
+        total = None
+        if count_total:
+            count_query = select(func.count()).select_from(table).where(*where_conditions(where))
+            total = connection.execute(count_query).scalar_one()
+
+    started_at = time.monotonic()
+    batches = rows = 0
+    while True:
+        with connection.begin():
+            conditions = where_conditions(where) + ([key_column > last_key] if last_key is not None else [])
+            keys: List[Any] = (
+                connection.execute(select(key_column).where(*conditions).order_by(key_column).limit(batch_size))
+                .scalars()
+                .all()
+            )
+            if not keys:
+                break
+            # a key range rather than a list of keys keeps the statement small
+            batch_conditions = where_conditions(where) + [key_column >= keys[0], key_column <= keys[-1]]
+            rows += connection.execute(update(table).where(and_(*batch_conditions)).values(**values)).rowcount
+            last_key = keys[-1]
+            if checkpoint:
+                save_checkpoint(connection, checkpoint, last_key, rows)
+        batches += 1
+        progress(BackfillProgress(name, batches, rows, total, last_key, time.monotonic() - started_at))
+        if pause:
+            time.sleep(pause)
+
+    if checkpoint:
+        with connection.begin():
+            connection.execute(checkpoint_table.delete().where(checkpoint_table.c.name == checkpoint))
+    return rows
+
+
+def backfill(table: Table, values: Mapping[str, Any], where: Optional[ColumnElement] = None, **kwargs) -> int:
+    """Runs :func:`backfill_batches` from a revision, outside the transaction of the migration."""
+    with op.get_context().autocommit_block():
+        return backfill_batches(op.get_bind(), table, values, where, **kwargs)
+
+
+def create_index_concurrently(index_name: str, table_name: str, columns: Sequence[str], **kwargs):
+    """Creates an index without blocking writes where the dialect allows, ``CREATE INDEX CONCURRENTLY`` on Postgres.
+
+    Postgres leaves an invalid index behind when a concurrent build fails, which has to be dropped before a retry.
+    """
+    if op.get_bind().dialect.name != "postgresql":
+        op.create_index(index_name, table_name, columns, **kwargs)
+        return
+    with op.get_context().autocommit_block():
+        op.create_index(index_name, table_name, columns, postgresql_concurrently=True, **kwargs)
+
+
+def drop_index_concurrently(index_name: str, table_name: str):
+    if op.get_bind().dialect.name != "postgresql":
+        op.drop_index(index_name, table_name=table_name)
+        return
+    with op.get_context().autocommit_block():
+        op.drop_index(index_name, table_name=table_name, postgresql_concurrently=True)
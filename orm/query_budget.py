@@ -0,0 +1,121 @@
+import logging
+import re
+import time
+
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine
+from typing import Dict, Iterator, List, Tuple, Union
+
+from metrics import registry
+from tracing import record_span
+
+
+logger = logging.getLogger(__name__)
+
+# placeholders of the expanded IN lists and multi-row VALUES, whose number varies between runs of a statement
+PLACEHOLDER_LIST = re.compile(r"\(\s*(?:\?|%\(\w+\)s|\$\d+)(?:\s*,\s*(?:\?|%\(\w+\)s|\$\d+))*\s*\)")
+PLACEHOLDER_ROWS = re.compile(r"\(\.\.\.\)(?:\s*,\s*\(\.\.\.\))+")
+
+
+def statement_shape(statement: str) -> str:
+    """The statement with its whitespace and lists of placeholders collapsed, which its runs have in common."""
+    shape = PLACEHOLDER_LIST.sub("(...)", " ".join(statement.split()))
+    return PLACEHOLDER_ROWS.sub("(...)", shape)
+
+
+class QueryLog:
+    """Statements run within a :func:`count_queries` block."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.shapes: Counter = Counter()
+
+    def record(self, statement: str, duration: float):
+        self.count += 1
+        self.duration += duration
+        self.shapes[statement_shape(statement)] += 1
+
+    def duplicates(self) -> Dict[str, int]:
+        """Statements run more than once, which a loop of lookups, an N+1 pattern, gives away."""
+        return {shape: count for shape, count in self.shapes.most_common() if count > 1}
+
+    def describe(self) -> str:
+        lines = [f"{self.count} queries in {self.duration * 1000:.1f} ms"]
+        lines.extend(f"  {count} x {shape}" for shape, count in self.duplicates().items())
+        return "\n".join(lines)
+
+
+# logs of the blocks being run, innermost last
+current_query_logs: ContextVar[Tuple[QueryLog, ...]] = ContextVar("current_query_logs", default=())
+
+
+@contextmanager
+def count_queries() -> Iterator[QueryLog]:
+    """Records the statements run by the current task within the block, nested blocks included."""
+    log = QueryLog()
+    token = current_query_logs.set(current_query_logs.get() + (log,))
+    try:
+        yield log
+    finally:
+        current_query_logs.reset(token)
+
+
+def before_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+    connection.info.setdefault("query_started_at", []).append(time.perf_counter())
+
+
+def after_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+    duration = time.perf_counter() - connection.info["query_started_at"].pop()
+    # the event runs in a greenlet of the awaiting task, with a copy of its context
+    logs: List[QueryLog] = list(current_query_logs.get())
+    for log in logs:
+        log.record(statement, duration)
+    record_span("sql", duration, statement=statement_shape(statement))
+
+
+def handle_error(exception_context):
+    # the statement has failed, so the timing of after_cursor_execute is never taken
+    started_at = exception_context.connection.info.get("query_started_at") if exception_context.connection else None
+    if started_at:
+        duration = time.perf_counter() - started_at.pop()
+        record_span(
+            "sql",
+            duration,
+            exception_context.original_exception,
+            statement=statement_shape(exception_context.statement or ""),
+        )
+
+
+def track_queries(engine: Union[Engine, AsyncEngine]):
+    """Makes the statements of the engine show in :func:`count_queries` blocks and in the traces."""
+    sync_engine = engine.sync_engine if isinstance(engine, AsyncEngine) else engine
+    if not event.contains(sync_engine, "after_cursor_execute", after_cursor_execute):
+        event.listen(sync_engine, "before_cursor_execute", before_cursor_execute)
+        event.listen(sync_engine, "after_cursor_execute", after_cursor_execute)
+        event.listen(sync_engine, "handle_error", handle_error)
+
+
+@contextmanager
+def query_budget(name: str, budget: int) -> Iterator[QueryLog]:
+    """Counts the queries of a request to an action, logging the ones going over their budget.
+
+    Query counts and DB time are kept per action in the ``query_budget.{name}`` metrics.
+    """
+    with count_queries() as log:
+        try:
+            yield log
+        finally:
+            report_budget(name, budget, log)
+
+
+def report_budget(name: str, budget: int, log: QueryLog):
+    registry.summary(f"query_budget.{name}.queries").observe(log.count)
+    registry.summary(f"query_budget.{name}.db_seconds").observe(log.duration)
+    if log.count > budget:
+        registry.counter(f"query_budget.{name}.over_budget").inc()
+        logger.warning(f"{name} has gone over its budget of {budget} queries: {log.describe()}")
@@ -1,23 +1,226 @@
+import asyncio
+import datetime
+import functools
+import json
+import logging
+import time
 import uuid
 
 from abc import ABC, abstractmethod
-from sqlalchemy.sql.expression import Select, Delete
-from sqlalchemy import select, asc, desc, update, delete, func
+from contextlib import asynccontextmanager, contextmanager
+from collections import defaultdict
+from contextvars import ContextVar
+from sqlalchemy.orm import load_only
+from sqlalchemy.sql.expression import Select, Delete, Update
+from sqlalchemy import select, asc, desc, update, delete, false, func, literal_column, text
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.exc import SQLAlchemyError
 from pydantic import BaseModel
 from enum import Enum
-from typing import Type, Final, Optional, Any, List, Union, AsyncIterable
+from typing import (
+    AsyncIterator,
+    Callable,
+    Hashable,
+    Type,
+    Final,
+    Optional,
+    Any,
+    List,
+    Union,
+    AsyncIterable,
+    Tuple,
+    Iterator,
+    Awaitable,
+    TypeVar,
+    Mapping,
+    Dict,
+    NamedTuple,
+)
 
 from domain.domain_entity import DomainEntity
 
 from orm.db import Base as SAModel, session_factory
-from adapters import convert_model_to_schema, convert_schema_to_model
+from orm.batching import WriteBatcher
+from orm.cache import CacheBackend, cache_backend
+from orm.changefeed.bus import ChangeEvent, event_bus
+from orm.changefeed.models import ChangeLogEntry
+from orm.existence import ExistenceFilter
+from orm.ids import new_id
+from orm.list_cache import ListCache
+from orm.search import PrefixIndex
+from orm.stats.dimensions import TOTAL, Dimension
+from orm.stats.models import EntityStat
+from adapters import convert_model_to_schema, convert_schema_to_model, convert_rows_to_schemas
+from tracing import current_span, span, traced, traced_method
+
+
+logger = logging.getLogger(__name__)
 
 
 class RepositoryException(SQLAlchemyError):
     pass
 
 
+class QueryTimeoutException(RepositoryException):
+    pass
+
+
+class NotFoundException(RepositoryException):
+    pass
+
+
+T = TypeVar("T")
+
+# Seconds a single statement is allowed to run for, set per request through query_timeout().
+statement_timeout: ContextVar[Optional[float]] = ContextVar("statement_timeout", default=None)
+
+POSTGRES_QUERY_CANCELED = "57014"
+
+
+@contextmanager
+def query_timeout(seconds: Optional[float]) -> Iterator[None]:
+    token = statement_timeout.set(seconds)
+    try:
+        yield
+    finally:
+        statement_timeout.reset(token)
+
+
+async def with_timeout(awaitable: Awaitable[T]) -> T:
+    """Awaits a DB call, cancelling it once the current statement timeout is exceeded."""
+    timeout = statement_timeout.get()
+    if timeout is None:
+        return await awaitable
+    try:
+        return await asyncio.wait_for(awaitable, timeout)
+    except asyncio.TimeoutError:
+        raise QueryTimeoutException(f"Query has not completed within {timeout} seconds.")
+
+
+async def set_statement_timeout(session):
+    """Makes Postgres enforce the current statement timeout within the session transaction."""
+    timeout = statement_timeout.get()
+    if timeout is not None and session.bind.dialect.name == "postgresql":
+        await session.execute(text(f"SET LOCAL statement_timeout = {int(timeout * 1000)}"))
+
+
+# INSERT constructs supporting ON CONFLICT per dialect
+dialect_inserts = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+
+def dialect_insert(session, table):
+    dialect_name = session.bind.dialect.name
+    if dialect_name not in dialect_inserts:
+        raise RepositoryException(f"Upserts are not supported on {dialect_name}.")
+    return dialect_inserts[dialect_name](table)
+
+
+def to_repository_exception(exc: SQLAlchemyError) -> RepositoryException:
+    if isinstance(exc, RepositoryException):
+        return exc
+    if getattr(getattr(exc, "orig", None), "sqlstate", None) == POSTGRES_QUERY_CANCELED:
+        return QueryTimeoutException(exc)
+    return RepositoryException(exc)
+
+
+UNIT_OF_WORK = "unit_of_work"
+
+
+class UnitOfWork:
+    """Shares one session, and so one connection and transaction, between the repository calls made within it.
+
+    Repository writes are flushed instead of committed, and their post-commit hooks wait for :meth:`commit`.
+    A failed call leaves the transaction unusable, so calls which are allowed to fail go in a :meth:`savepoint`.
+    Like a session, a unit of work must not be used by concurrent tasks.
+    """
+
+    def __init__(self, session):
+        self.session = session
+        session.info[UNIT_OF_WORK] = self
+        self._after_commit: List[Callable[[], Awaitable[None]]] = []
+
+    def after_commit(self, callback: Callable[[], Awaitable[None]]):
+        self._after_commit.append(callback)
+
+    @property
+    def has_written(self) -> bool:
+        """Whether repository writes are waiting for the commit, which every write registers a hook for."""
+        return bool(self._after_commit)
+
+    @traced
+    async def commit(self):
+        await with_timeout(self.session.commit())
+        callbacks, self._after_commit = self._after_commit, []
+        for callback in callbacks:
+            await callback()
+
+    async def rollback(self):
+        self._after_commit = []
+        await self.session.rollback()
+
+    @asynccontextmanager
+    async def savepoint(self) -> AsyncIterator[None]:
+        """Nested transaction, rolled back on its own when the block fails."""
+        callbacks = len(self._after_commit)
+        try:
+            async with self.session.begin_nested():
+                yield
+        except BaseException:
+            del self._after_commit[callbacks:]
+            raise
+
+
+async def connect_traced(session):
+    """Takes the connection of a traced session in a span of its own, which its first statement would take otherwise."""
+    if current_span.get() is not None:
+        with span("session.connect"):
+            await session.connection()
+
+
+current_unit_of_work: ContextVar[Optional[UnitOfWork]] = ContextVar("current_unit_of_work", default=None)
+
+
+def in_unit_of_work(session) -> bool:
+    return UNIT_OF_WORK in session.info
+
+
+@asynccontextmanager
+async def unit_of_work() -> AsyncIterator[UnitOfWork]:
+    """Starts a unit of work, committed when the block exits, or joins the current one."""
+    current = current_unit_of_work.get()
+    if current is not None:
+        yield current
+        return
+
+    async with session_factory() as session:
+        await connect_traced(session)
+        uow = UnitOfWork(session)
+        token = current_unit_of_work.set(uow)
+        try:
+            try:
+                yield uow
+            except BaseException:
+                await uow.rollback()
+                raise
+            try:
+                await uow.commit()
+            except SQLAlchemyError as exc:
+                await uow.rollback()
+                raise to_repository_exception(exc)
+        finally:
+            current_unit_of_work.reset(token)
+            del session.info[UNIT_OF_WORK]
+
+
+async def without_unit_of_work(call: Callable[..., Awaitable[T]], *args) -> T:
+    """Runs the call on sessions of its own, outside of the current unit of work."""
+    token = current_unit_of_work.set(None)
+    try:
+        return await call(*args)
+    finally:
+        current_unit_of_work.reset(token)
+
+
 class FilterOps(Enum):
     EQ = "eq"
     GT = "gt"
@@ -26,6 +229,7 @@ class FilterOps(Enum):
     LTE = "lte"
     ILIKE = "ilike"
     LIKE = "like"
+    IN = "in"
 
 
 class FilterCondition(BaseModel):
@@ -51,12 +255,42 @@ class FindQueryConfig(BaseModel):
             self.order_by = self.order_by.split(",")
 
 
+class UpsertResult(NamedTuple):
+    entities: List[BaseModel]
+    inserted: int
+    updated: int
+
+
+class EntityId(BaseModel):
+    id: uuid.UUID
+
+    class Config:
+        orm_mode = True
+
+
+class BulkProgress(NamedTuple):
+    operation: str
+    chunks: int
+    rows: int
+    elapsed: float
+
+
+def log_bulk_progress(progress: BulkProgress):
+    rate = progress.rows / progress.elapsed if progress.elapsed else 0
+    logger.info(f"{progress.operation}: {progress.rows} rows in {progress.chunks} chunks, {rate:.0f} rows/s")
+
+
 class Repository(ABC):
     @classmethod
     @abstractmethod
     async def count(cls, query=None, filters: Optional[List[FilterCondition]] = None) -> int:
         pass
 
+    @classmethod
+    async def count_list(cls, filters: Optional[List[FilterCondition]] = None) -> int:
+        """Number of entities a list matches."""
+        return await cls.count(filters=filters)
+
     @classmethod
     @abstractmethod
     async def create(cls, entity: DomainEntity, response_schema: BaseModel) -> BaseModel:
@@ -67,6 +301,11 @@ class Repository(ABC):
     def find(cls, query_config: FindQueryConfig, query=None) -> AsyncIterable[BaseModel]:
         pass
 
+    @classmethod
+    async def find_list(cls, query_config: FindQueryConfig) -> List[BaseModel]:
+        """Page of entities of a list."""
+        return [entity async for entity in cls.find(query_config)]
+
     @classmethod
     @abstractmethod
     async def find_one(cls, conditions: List[FilterCondition], response_schema: Type[BaseModel]) -> BaseModel:
@@ -83,7 +322,7 @@ class Repository(ABC):
         pass
 
 
-def add_filters(model: SAModel, query: Union[Select, Delete], conditions: List[FilterCondition]):
+def add_filters(model: SAModel, query: Union[Select, Delete, Update], conditions: List[FilterCondition]):
     table = query.get_final_froms()[0] if hasattr(query, "get_final_froms") else query.table
     for filter_cnd in conditions:
         try:
@@ -105,10 +344,34 @@ def add_filters(model: SAModel, query: Union[Select, Delete], conditions: List[F
             query = query.where(col.ilike("%" + filter_cnd.value + "%"))
         elif filter_cnd.operation == FilterOps.LIKE:
             query = query.where(col.like("%" + filter_cnd.value + "%"))
+        elif filter_cnd.operation == FilterOps.IN:
+            query = query.where(col.in_(filter_cnd.value))
 
     return query
 
 
+def conditions_key(conditions: Optional[List[FilterCondition]]) -> Tuple[Tuple[str, str, str], ...]:
+    # conditions are and-ed, so their order does not matter
+    return tuple(
+        sorted(
+            (condition.field, FilterOps(condition.operation).value, repr(condition.value))
+            for condition in conditions or ()
+        )
+    )
+
+
+def find_query_key(query_config: FindQueryConfig) -> Hashable:
+    """Key of the results of a find, the same for the configs which differ only in the order of their conditions."""
+    schema = query_config.response_schema
+    return (
+        f"{schema.__module__}.{schema.__qualname__}",
+        conditions_key(query_config.conditions),
+        query_config.offset or 0,
+        query_config.limit,
+        tuple(query_config.order_by or ()),
+    )
+
+
 def config_find_query(model: SAModel, query, query_ctx: FindQueryConfig):
     query = query.execution_options(yield_per=query_ctx.page)
 
@@ -132,8 +395,97 @@ def config_find_query(model: SAModel, query, query_ctx: FindQueryConfig):
 
 class SARepository(Repository):
     model: Type[SAModel]
+    # Concurrent creates arriving within the window (seconds) are inserted in one transaction.
+    # Batching is disabled when the window is None.
+    create_batch_window: Optional[float] = None
+    create_batch_size: int = 100
+    # Writes are recorded in the change log within their transaction and published to the event bus
+    # after commit. Only change_feed_fields make it to the event payloads, so secrets must be left out.
+    change_feed: bool = False
+    change_feed_fields: Tuple[str, ...] = ()
+    # Text fields kept in an in-memory prefix index, maintained from the writes, for the search action.
+    search_fields: Tuple[str, ...] = ()
+    # Rows are counted per key of each dimension in the entity_stat table, within the transactions of the writes.
+    stats_dimensions: Mapping[str, Dimension] = {}
+    # Seconds entities found by id are kept in the cache, shared by the workers with CACHE_BACKEND=sqlite.
+    # Writes invalidate them once committed, so a read racing a write may keep the old entity for that long.
+    cache_ttl: Optional[float] = None
+    # backend of the repository, the CACHE_BACKEND one when None
+    cache: Optional[CacheBackend] = None
+    # Field with a unique index identifying the entities besides their id, which upserts are keyed on.
+    natural_key: Optional[str] = None
+    # Lookups by id are first checked against an in-memory Bloom filter of the existing ids, sized for this many
+    # ids, so that missing ones are answered without the DB. Off when None. The ids created by other processes
+    # are read from the change log, so it needs change_feed.
+    existence_filter_capacity: Optional[int] = None
+    existence_false_positive_rate: float = 0.01
+    # seconds ids which have been found missing are remembered for
+    negative_cache_ttl: float = 5.0
+    # seconds the filter may lag behind the creates of other processes
+    existence_refresh_interval: float = 0.2
+    # Pages and counts of lists are kept in an LRU of this many results per process, off when None. Writes bump the
+    # generation of the table, which makes the results stale: they are still served for list_cache_stale_ttl seconds
+    # while being loaded again in the background. Writes of other processes do not bump it, so results may lag
+    # behind them for list_cache_ttl seconds.
+    list_cache_size: Optional[int] = None
+    list_cache_ttl: float = 5.0
+    list_cache_stale_ttl: float = 1.0
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if cls.existence_filter_capacity is not None and not cls.change_feed:
+            raise RepositoryException(
+                f"The existence filter of {cls.__name__} needs change_feed to learn the ids created by other processes."
+            )
 
     @classmethod
+    def open_session(cls):
+        return session_factory()
+
+    @classmethod
+    @asynccontextmanager
+    async def session_scope(cls) -> AsyncIterator[Any]:
+        """The session of the current unit of work, or a session of the call's own."""
+        uow = current_unit_of_work.get()
+        if uow is not None:
+            yield uow.session
+            return
+        async with cls.open_session() as session:
+            await connect_traced(session)
+            yield session
+
+    @classmethod
+    @traced_method
+    async def commit(cls, session):
+        if in_unit_of_work(session):
+            # committed along with the unit of work
+            await with_timeout(session.flush())
+        else:
+            await with_timeout(session.commit())
+
+    @classmethod
+    @traced_method
+    async def rollback(cls, session):
+        # a unit of work is rolled back as a whole once the error leaves it
+        if not in_unit_of_work(session):
+            await session.rollback()
+
+    @classmethod
+    @traced_method
+    async def committed(
+        cls,
+        session,
+        operation: str,
+        rows: List[Tuple[uuid.UUID, Mapping[str, Any]]],
+        changes: List[ChangeLogEntry],
+    ):
+        if in_unit_of_work(session):
+            session.info[UNIT_OF_WORK].after_commit(functools.partial(cls.on_committed, operation, rows, changes))
+        else:
+            await cls.on_committed(operation, rows, changes)
+
+    @classmethod
+    @traced_method
     async def count(cls, query=None, filters: Optional[List[FilterCondition]] = None) -> int:
         if query is not None:
             query = query.with_only_columns(func.count()).order_by(None)
@@ -141,67 +493,833 @@ class SARepository(Repository):
             query = select(func.count()).select_from(cls.model)
         if filters is not None:
             query = add_filters(cls.model, query, filters)
-        async with session_factory() as session:
-            count_result = await session.execute(query)
+        async with cls.session_scope() as session:
+            try:
+                await set_statement_timeout(session)
+                count_result = await with_timeout(session.execute(query))
+            except SQLAlchemyError as exc:
+                raise to_repository_exception(exc)
             count = count_result.scalar_one()
         return count
 
     @classmethod
+    @traced_method
     async def find(cls, query_config: FindQueryConfig, query=None) -> AsyncIterable[BaseModel]:
         query = query if query is not None else select(cls.model)
         query = config_find_query(cls.model, query, query_config)
-        async with session_factory() as session:
+        async with cls.session_scope() as session:
             try:
-                async_result = await session.stream(query)
-                async for row in async_result:
-                    yield convert_model_to_schema(row[0], query_config.response_schema)
+                await set_statement_timeout(session)
+                async_result = await with_timeout(session.stream(query))
+                while True:
+                    rows = await with_timeout(async_result.fetchmany(query_config.page))
+                    if not rows:
+                        break
+                    for entity in convert_rows_to_schemas((row[0] for row in rows), query_config.response_schema):
+                        yield entity
             except SQLAlchemyError as exc:
-                raise RepositoryException(exc)
+                raise to_repository_exception(exc)
+
+    @classmethod
+    @traced_method
+    async def find_list(cls, query_config: FindQueryConfig) -> List[BaseModel]:
+        list_cache = cls.list_cache()
+        if list_cache is None:
+            return await super().find_list(query_config)
+        # loads run in tasks of their own, which must not use the session of the unit of work
+        load = functools.partial(without_unit_of_work, super().find_list, query_config)
+        return await list_cache.get(find_query_key(query_config), cls.list_generation(), load)
+
+    @classmethod
+    @traced_method
+    async def count_list(cls, filters: Optional[List[FilterCondition]] = None) -> int:
+        list_cache = cls.list_cache()
+        if list_cache is None:
+            return await super().count_list(filters)
+        load = functools.partial(without_unit_of_work, super().count_list, filters)
+        return await list_cache.get(("count", conditions_key(filters)), cls.list_generation(), load)
+
+    @classmethod
+    def list_cache(cls) -> Optional[ListCache]:
+        # a unit of work has to see its own writes, which only bump the generation on commit
+        uow = current_unit_of_work.get()
+        if cls.list_cache_size is None or (uow is not None and uow.has_written):
+            return None
+        list_cache = cls.__dict__.get("_list_cache")
+        if list_cache is None:
+            list_cache = ListCache(
+                f"repository.{cls.model.__tablename__}.list_cache",
+                cls.list_cache_size,
+                cls.list_cache_ttl,
+                cls.list_cache_stale_ttl,
+            )
+            setattr(cls, "_list_cache", list_cache)
+        return list_cache
+
+    @classmethod
+    def list_generation(cls) -> int:
+        return cls.__dict__.get("_list_generation", 0)
 
     @classmethod
+    @traced_method
     async def find_one(cls, conditions: List[FilterCondition], response_schema: Type[BaseModel]) -> BaseModel:
+        # a unit of work has to see its own writes, which only reach the cache and the filter on commit
+        entity_id = cls.lookup_id(conditions) if current_unit_of_work.get() is None else None
+        if entity_id is not None and not await cls.might_exist(entity_id):
+            raise NotFoundException(f"Nothing has been found for model {cls.model.__name__} and id: {entity_id}")
+        cache = cls.entity_cache() if entity_id is not None else None
+        if cache is not None:
+            schema_key = f"{response_schema.__module__}.{response_schema.__qualname__}"
+            cached = cache.get(cls.cache_group(entity_id), schema_key)  # type: ignore
+            if cached is not None:
+                return response_schema.parse_raw(cached)
+
+        # the value read is not cached when the entity is written meanwhile
+        read_at = time.time()
         query_cnf = FindQueryConfig(conditions=conditions, response_schema=response_schema)
-        async for row in cls.find(query_cnf):
-            return row
-        raise RepositoryException(f"Nothing has been found for model {cls.model.__name__} and conditions: {conditions}")
+        entities = cls.find(query_cnf)
+        entity = None
+        try:
+            async for entity in entities:
+                break
+        finally:
+            # releases the session right away instead of on garbage collection
+            await entities.aclose()  # type: ignore
+        if entity is None:
+            if entity_id is not None:
+                cls.found_missing(entity_id)
+            raise NotFoundException(
+                f"Nothing has been found for model {cls.model.__name__} and conditions: {conditions}"
+            )
+        if cache is not None:
+            cache.set(
+                cls.cache_group(entity_id), schema_key, entity.json().encode(), cls.cache_ttl, read_at  # type: ignore
+            )
+        return entity
+
+    @classmethod
+    def entity_cache(cls) -> Optional[CacheBackend]:
+        if cls.cache_ttl is None:
+            return None
+        return cls.cache if cls.cache is not None else cache_backend()
 
     @classmethod
+    def lookup_id(cls, conditions: List[FilterCondition]) -> Optional[uuid.UUID]:
+        """Id of a lookup by id alone, which is what gets cached and checked against the existence filter."""
+        if len(conditions) != 1:
+            return None
+        condition = conditions[0]
+        if condition.field != "id" or condition.operation != FilterOps.EQ or condition.value is None:
+            return None
+        try:
+            return condition.value if isinstance(condition.value, uuid.UUID) else uuid.UUID(str(condition.value))
+        except ValueError:
+            return None
+
+    @classmethod
+    def cache_group(cls, id: uuid.UUID) -> str:
+        # the entity in every response schema is invalidated together
+        return f"{cls.model.__tablename__}:{id}"
+
+    @classmethod
+    @traced_method
     async def create(cls, entity: DomainEntity, response_schema: BaseModel) -> BaseModel:
-        model = convert_schema_to_model(entity, cls.model)
-        async with session_factory() as session:
+        # a batch runs in a transaction of its own, which a unit of work would not see
+        if cls.create_batch_window is not None and current_unit_of_work.get() is None:
+            return await cls.create_batcher().submit((entity, response_schema))
+        return await cls.create_one(entity, response_schema)
+
+    @classmethod
+    def to_model(cls, entity: DomainEntity) -> SAModel:
+        return convert_schema_to_model(entity, cls.model)
+
+    @classmethod
+    @traced_method
+    async def create_one(cls, entity: DomainEntity, response_schema: BaseModel) -> BaseModel:
+        return await cls.insert_one(cls.to_model(entity), response_schema)
+
+    @classmethod
+    @traced_method
+    async def insert_one(cls, model: SAModel, response_schema: BaseModel) -> BaseModel:
+        async with cls.session_scope() as session:
             session.add(model)
             try:
-                await session.commit()
+                await set_statement_timeout(session)
+                changes = await cls.log_created(session, [model])
+                await cls.count_stats(session, added=[model.__dict__])
+                await cls.commit(session)
             except SQLAlchemyError as exc:
-                await session.rollback()
-                raise RepositoryException(exc)
+                await cls.rollback(session)
+                raise to_repository_exception(exc)
             await session.refresh(model)
             session.expunge(model)
+        await cls.committed(session, "create", cls.created_rows([model]), changes)
         return convert_model_to_schema(model, response_schema)
 
     @classmethod
+    @traced_method
+    async def create_many(cls, items: List[Tuple[DomainEntity, BaseModel]]) -> List[Union[BaseModel, Exception]]:
+        """Inserts all the items within one transaction.
+
+        If the batch fails as a whole, every item is retried on its own so that only the offending ones
+        get an error back.
+        """
+        return await cls.insert_many([cls.to_model(entity) for entity, _ in items], items)
+
+    @classmethod
+    @traced_method
+    async def insert_many(
+        cls, models: List[SAModel], items: List[Tuple[DomainEntity, BaseModel]]
+    ) -> List[Union[BaseModel, Exception]]:
+        async with cls.session_scope() as session:
+            session.add_all(models)
+            changes: List[ChangeLogEntry] = []
+            try:
+                await set_statement_timeout(session)
+                changes = await cls.log_created(session, models)
+                await cls.count_stats(session, added=[model.__dict__ for model in models])
+                await cls.commit(session)
+            except QueryTimeoutException:
+                await cls.rollback(session)
+                raise
+            except SQLAlchemyError as exc:
+                await cls.rollback(session)
+                if in_unit_of_work(session):
+                    # items cannot be retried within a transaction that has failed
+                    raise to_repository_exception(exc)
+                # the items are retried on their own, which log and publish their changes themselves
+                models, changes = [], []
+            for model in models:
+                # same as create_one, so that server-side defaults are returned too
+                await session.refresh(model)
+                session.expunge(model)
+        await cls.committed(session, "create", cls.created_rows(models), changes)
+
+        if not models:
+            results: List[Union[BaseModel, Exception]] = []
+            for entity, response_schema in items:
+                try:
+                    results.append(await cls.create_one(entity, response_schema))
+                except RepositoryException as exc:
+                    results.append(exc)
+            return results
+        return [convert_model_to_schema(model, response_schema) for model, (_, response_schema) in zip(models, items)]
+
+    @classmethod
+    def create_batcher(cls) -> WriteBatcher:
+        batcher = cls.__dict__.get("_create_batcher")
+        if batcher is None:
+            batcher = WriteBatcher(
+                f"repository.{cls.model.__tablename__}.create",
+                cls.create_many,
+                cls.create_batch_window,
+                cls.create_batch_size,
+            )
+            setattr(cls, "_create_batcher", batcher)
+        return batcher
+
+    @classmethod
+    @traced_method
     async def update_by_id(cls, id: uuid.UUID, values: dict, response_schema: Type[BaseModel]) -> BaseModel:
         query = update(cls.model).where(cls.model.id == id).values(**values)
-        async with session_factory() as session:
+        async with cls.session_scope() as session:
             try:
-                await session.execute(query)
-                await session.commit()
+                await set_statement_timeout(session)
+                old_rows = []
+                if set(values) & set(cls.stats_fields()):
+                    old_rows = await cls.find_tracked_rows(session, [FilterCondition(field="id", value=id)])
+                updated = await with_timeout(session.execute(query))
+                updated_rows = [(id, values)] if updated.rowcount else []
+                if not updated.rowcount:
+                    old_rows = []
+                changes = cls.log_changes(session, "update", updated_rows)
+                await cls.count_stats(
+                    session, removed=[row for _, row in old_rows], added=[dict(row, **values) for _, row in old_rows]
+                )
+                await cls.commit(session)
             except SQLAlchemyError as exc:
-                await session.rollback()
-                raise RepositoryException(exc)
+                await cls.rollback(session)
+                raise to_repository_exception(exc)
+        await cls.committed(session, "update", updated_rows, changes)
         return await cls.find_one(
             [FilterCondition(field="id", value=id)],
             response_schema,
         )
 
     @classmethod
+    @traced_method
     async def delete(cls, conditions: List[FilterCondition]) -> int:
-        query = add_filters(cls.model, delete(cls.model), conditions)
-        async with session_factory() as session:
+        # schemas are handed out rather than loaded rows, so there is nothing to synchronize, which LIKE filters
+        # could not do anyway
+        query = add_filters(cls.model, delete(cls.model), conditions).execution_options(synchronize_session=False)
+        entity_id = cls.lookup_id(conditions) if current_unit_of_work.get() is None else None
+        if entity_id is not None and not await cls.might_exist(entity_id):
+            return 0
+        async with cls.session_scope() as session:
             try:
-                deleted_amount = await session.execute(query)
-                await session.commit()
+                await set_statement_timeout(session)
+                deleted_rows: List[Tuple[uuid.UUID, Mapping[str, Any]]] = []
+                if cls.tracks_written_rows():
+                    deleted_rows = await cls.find_tracked_rows(session, conditions)
+                    # the rows locked, rather than the ones matching by now, which may include new ones
+                    query = query.where(cls.model.id.in_([deleted_id for deleted_id, _ in deleted_rows]))
+                deleted_amount = await with_timeout(session.execute(query))
+                changes = cls.log_changes(session, "delete", [(deleted_id, {}) for deleted_id, _ in deleted_rows])
+                await cls.count_stats(session, removed=[row for _, row in deleted_rows])
+                await cls.commit(session)
             except SQLAlchemyError as exc:
-                await session.rollback()
-                raise RepositoryException(exc)
+                await cls.rollback(session)
+                raise to_repository_exception(exc)
+        await cls.committed(session, "delete", deleted_rows, changes)
+        if entity_id is not None and not deleted_amount.rowcount:
+            cls.found_missing(entity_id)
         return deleted_amount.rowcount
+
+    @classmethod
+    @traced_method
+    async def update(cls, conditions: List[FilterCondition], values: dict) -> int:
+        """Updates the rows matching the conditions with the values, returning the number of rows updated."""
+        query = add_filters(cls.model, update(cls.model), conditions).values(**values)
+        query = query.execution_options(synchronize_session=False)
+        async with cls.session_scope() as session:
+            try:
+                await set_statement_timeout(session)
+                old_rows: List[Tuple[uuid.UUID, Mapping[str, Any]]] = []
+                if cls.tracks_written_rows():
+                    old_rows = await cls.find_tracked_rows(session, conditions)
+                    query = query.where(cls.model.id.in_([entity_id for entity_id, _ in old_rows]))
+                updated = await with_timeout(session.execute(query))
+                updated_rows = [(entity_id, values) for entity_id, _ in old_rows]
+                changes = cls.log_changes(session, "update", updated_rows)
+                if set(values) & set(cls.stats_fields()):
+                    await cls.count_stats(
+                        session,
+                        removed=[row for _, row in old_rows],
+                        added=[dict(row, **values) for _, row in old_rows],
+                    )
+                await cls.commit(session)
+            except SQLAlchemyError as exc:
+                await cls.rollback(session)
+                raise to_repository_exception(exc)
+        await cls.committed(session, "update", updated_rows, changes)
+        return updated.rowcount
+
+    @classmethod
+    @traced_method
+    async def bulk_delete(
+        cls,
+        conditions: List[FilterCondition],
+        chunk_size: int = 1000,
+        pause: float = 0.0,
+        progress: Callable[[BulkProgress], None] = log_bulk_progress,
+    ) -> int:
+        """Deletes the rows matching the conditions in chunks, see :meth:`write_in_chunks`."""
+        return await cls.write_in_chunks(
+            f"{cls.model.__tablename__}.bulk_delete", conditions, cls.delete, chunk_size, pause, progress
+        )
+
+    @classmethod
+    @traced_method
+    async def bulk_update(
+        cls,
+        conditions: List[FilterCondition],
+        values: dict,
+        chunk_size: int = 1000,
+        pause: float = 0.0,
+        progress: Callable[[BulkProgress], None] = log_bulk_progress,
+    ) -> int:
+        """Updates the rows matching the conditions in chunks, see :meth:`write_in_chunks`."""
+
+        async def update_chunk(chunk_conditions: List[FilterCondition]) -> int:
+            return await cls.update(chunk_conditions, values)
+
+        return await cls.write_in_chunks(
+            f"{cls.model.__tablename__}.bulk_update", conditions, update_chunk, chunk_size, pause, progress
+        )
+
+    @classmethod
+    @traced_method
+    async def write_in_chunks(
+        cls,
+        operation: str,
+        conditions: List[FilterCondition],
+        write: Callable[[List[FilterCondition]], Awaitable[int]],
+        chunk_size: int,
+        pause: float,
+        progress: Callable[[BulkProgress], None],
+    ) -> int:
+        """Writes the rows matching the conditions by chunks of ``chunk_size`` ids, in id order.
+
+        Every chunk is written by a repository call of its own, so in a short transaction with the usual write hooks,
+        followed by a ``pause`` of as many seconds to let other traffic through. The conditions are applied again by
+        the write, so rows changed meanwhile to no longer match are left alone. Returns the number of rows written.
+        """
+        if current_unit_of_work.get() is not None:
+            raise RepositoryException("Bulk writes commit chunk by chunk and cannot run within a unit of work.")
+        id_query = select(cls.model).options(load_only(cls.model.id))
+        started_at = time.monotonic()
+        chunks = rows = 0
+        last_id: Optional[uuid.UUID] = None
+        while True:
+            after = [FilterCondition(field="id", operation=FilterOps.GT, value=last_id)] if last_id is not None else []
+            query_config = FindQueryConfig(
+                response_schema=EntityId, conditions=conditions + after, order_by="id", limit=chunk_size
+            )
+            ids = [entity.id async for entity in cls.find(query_config, id_query)]
+            if not ids:
+                break
+            rows += await write(conditions + [FilterCondition(field="id", operation=FilterOps.IN, value=ids)])
+            chunks += 1
+            last_id = ids[-1]
+            progress(BulkProgress(operation, chunks, rows, time.monotonic() - started_at))
+            if len(ids) < chunk_size:
+                break
+            if pause:
+                await asyncio.sleep(pause)
+        return rows
+
+    @classmethod
+    @traced_method
+    async def upsert(cls, entities: List[DomainEntity], response_schema: Type[BaseModel]) -> UpsertResult:
+        """Inserts the entities, or updates the rows having their natural key, in one statement.
+
+        The last entity wins when several have the same key. Ids are only set on insert. Entities are returned in
+        the order of their keys in the batch, with the number of rows inserted and updated.
+        """
+        if cls.natural_key is None:
+            raise RepositoryException(f"No natural key has been declared for model {cls.model.__name__}.")
+        table = cls.model.__table__
+        key_column = table.c[cls.natural_key]
+        rows_by_key: Dict[Any, Dict[str, Any]] = {}
+        for entity in entities:
+            values = entity.dict()
+            if values.get("id") is None:
+                values["id"] = new_id()
+            rows_by_key[values[cls.natural_key]] = values
+        if not rows_by_key:
+            return UpsertResult([], 0, 0)
+        keys = list(rows_by_key)
+        updated_fields = {field for values in rows_by_key.values() for field in values} - {"id", cls.natural_key}
+
+        async with cls.session_scope() as session:
+            try:
+                await set_statement_timeout(session)
+                # the stats fields of the rows being updated, to move their counts, locked until the commit
+                fields = cls.stats_fields()
+                await cls.lock_for_write(session)
+
+                async def find_existing(pending_keys: List[Any]) -> Dict[Any, Dict[str, Any]]:
+                    query = select(key_column, *[table.c[field] for field in fields]).where(
+                        key_column.in_(pending_keys)
+                    )
+                    rows = (await with_timeout(session.execute(query.with_for_update()))).all()
+                    return {row[0]: dict(zip(fields, row[1:])) for row in rows}
+
+                existing = await find_existing(keys)
+                if session.bind.dialect.name == "postgresql":
+                    returned, pending = [], keys
+                    while pending:
+                        query = dialect_insert(session, table).values([rows_by_key[key] for key in pending])
+                        # the rows inserted concurrently since they have been read are left out and locked, to be
+                        # read again with their values and updated in the next round
+                        query = query.on_conflict_do_update(
+                            index_elements=[key_column],
+                            set_={field: query.excluded[field] for field in updated_fields},
+                            where=key_column.in_(list(existing)),
+                        )
+                        # xmax is only set on the rows which have been updated
+                        query = query.returning(*table.c, literal_column("xmax = 0").label("inserted"))
+                        written = (await with_timeout(session.execute(query))).mappings().all()
+                        returned.extend(written)
+                        written_keys = {row[cls.natural_key] for row in written}
+                        pending = [key for key in pending if key not in written_keys]
+                        if pending:
+                            existing.update(await find_existing(pending))
+                    inserted_keys = {row[cls.natural_key] for row in returned if row["inserted"]}
+                else:
+                    query = dialect_insert(session, table).values(list(rows_by_key.values()))
+                    query = query.on_conflict_do_update(
+                        index_elements=[key_column], set_={field: query.excluded[field] for field in updated_fields}
+                    )
+                    # RETURNING is not supported on SQLite before SQLAlchemy 2.0, the rows are selected again
+                    await with_timeout(session.execute(query))
+                    returned = (
+                        (await with_timeout(session.execute(select(*table.c).where(key_column.in_(keys)))))
+                        .mappings()
+                        .all()
+                    )
+                    inserted_keys = set(keys) - set(existing)
+                rows = {row[cls.natural_key]: row for row in returned}
+                inserted_rows = [(rows[key]["id"], rows[key]) for key in keys if key in inserted_keys]
+                updated_rows = [(rows[key]["id"], rows[key]) for key in keys if key not in inserted_keys]
+                changes = cls.log_changes(session, "create", inserted_rows)
+                update_changes = cls.log_changes(session, "update", updated_rows)
+                await cls.count_stats(
+                    session,
+                    removed=[existing[key] for key in keys if key not in inserted_keys and key in existing],
+                    added=[rows[key] for key in keys],
+                )
+                await cls.commit(session)
+            except SQLAlchemyError as exc:
+                await cls.rollback(session)
+                raise to_repository_exception(exc)
+        await cls.committed(session, "create", inserted_rows, changes)
+        await cls.committed(session, "update", updated_rows, update_changes)
+        return UpsertResult(
+            [response_schema.parse_obj(dict(rows[key])) for key in keys], len(inserted_rows), len(updated_rows)
+        )
+
+    @classmethod
+    def created_rows(cls, models: List[Any]) -> List[Tuple[uuid.UUID, Mapping[str, Any]]]:
+        if not cls.search_fields and cls.existence_filter_capacity is None:
+            return []
+        return [(model.id, model.__dict__) for model in models]
+
+    @classmethod
+    def tracks_written_rows(cls) -> bool:
+        """Whether deletes and updates by conditions have to find out the rows they write for the write hooks."""
+        return cls.change_feed or bool(cls.search_fields) or bool(cls.stats_dimensions) or cls.cache_ttl is not None
+
+    @classmethod
+    @traced_method
+    async def on_committed(
+        cls,
+        operation: str,
+        rows: List[Tuple[uuid.UUID, Mapping[str, Any]]],
+        changes: List[ChangeLogEntry],
+    ):
+        """Write hook, called with (id, values) of the written rows once the transaction is committed."""
+        cls.publish_changes(changes)
+        if cls.search_fields and rows:
+            cls.search_index().apply(operation, rows)
+        cache = cls.entity_cache()
+        if cache is not None and operation != "create" and rows:
+            cache.invalidate(cls.cache_group(entity_id) for entity_id, _ in rows)
+        if operation == "create":
+            cls.add_existing([entity_id for entity_id, _ in rows])
+        setattr(cls, "_list_generation", cls.list_generation() + 1)
+
+    @classmethod
+    def search_index(cls) -> PrefixIndex:
+        index = cls.__dict__.get("_search_index")
+        if index is None:
+            index = PrefixIndex(f"repository.{cls.model.__tablename__}.search", cls.search_fields)
+            setattr(cls, "_search_index", index)
+        return index
+
+    @classmethod
+    @traced_method
+    async def search_rows(cls) -> AsyncIterable[Tuple[uuid.UUID, Mapping[str, Any]]]:
+        columns = [getattr(cls.model, field) for field in cls.search_fields]
+        query = select(cls.model.id, *columns).execution_options(yield_per=1000)
+        async with cls.open_session() as session:
+            async_result = await session.stream(query)
+            async for row in async_result:
+                yield row[0], dict(zip(cls.search_fields, row[1:]))
+
+    @classmethod
+    @traced_method
+    async def build_search_index(cls, force: bool = True):
+        await cls.search_index().build(cls.search_rows(), force=force)
+
+    @classmethod
+    @traced_method
+    async def search(cls, prefix: str, limit: int, response_schema: Type[BaseModel]) -> List[BaseModel]:
+        """Entities having a search field starting with the prefix, case insensitive, in term order."""
+        index = cls.search_index()
+        if not index.ready:
+            await cls.build_search_index(force=False)
+        ids = index.search(prefix, limit)
+        if not ids:
+            return []
+        query_config = FindQueryConfig(
+            response_schema=response_schema,
+            conditions=[FilterCondition(field="id", operation=FilterOps.IN, value=ids)],
+        )
+        found = {entity.id: entity async for entity in cls.find(query_config)}
+        return [found[entity_id] for entity_id in ids if entity_id in found]
+
+    @classmethod
+    def existence_filter(cls) -> Optional[ExistenceFilter]:
+        if cls.existence_filter_capacity is None:
+            return None
+        existence = cls.__dict__.get("_existence_filter")
+        if existence is None:
+            existence = ExistenceFilter(
+                f"repository.{cls.model.__tablename__}.existence",
+                cls.existence_filter_capacity,
+                cls.existence_false_positive_rate,
+                cls.negative_cache_ttl,
+            )
+            setattr(cls, "_existence_filter", existence)
+        return existence
+
+    @classmethod
+    @traced_method
+    async def stream_ids(cls) -> AsyncIterable[uuid.UUID]:
+        query = select(cls.model.id).execution_options(yield_per=1000)
+        async with cls.open_session() as session:
+            async_result = await session.stream(query)
+            async for row in async_result:
+                yield row[0]
+
+    @classmethod
+    @traced_method
+    async def build_existence_filter(cls, force: bool = True):
+        existence = cls.existence_filter()
+        if existence is None:
+            return
+        # creates committed during the scan are picked up from the change log afterwards
+        seq = await cls.last_change_seq()
+        await existence.build(cls.stream_ids(), seq, force=force, expected=await cls.count())
+        cls.rebuild_if_full(existence)
+
+    @classmethod
+    @traced_method
+    async def might_exist(cls, entity_id: uuid.UUID) -> bool:
+        """False when the entity certainly does not exist, as far as the existence filter tells."""
+        existence = cls.existence_filter()
+        if existence is None or existence.might_exist(entity_id):
+            return True
+        if time.monotonic() - existence.refreshed_at > cls.existence_refresh_interval:
+            # the id may have been created by another process meanwhile
+            await cls.refresh_existence_filter()
+            return existence.might_exist(entity_id)
+        return False
+
+    @classmethod
+    def found_missing(cls, entity_id: uuid.UUID):
+        existence = cls.existence_filter()
+        if existence is not None:
+            existence.missing(entity_id)
+
+    @classmethod
+    @traced_method
+    async def refresh_existence_filter(cls, page: int = 1000):
+        """Adds the ids created since the last refresh, by any process, as the change log has them."""
+        existence = cls.existence_filter()
+        if existence is None:
+            return
+        existence.refreshed_at = time.monotonic()
+        while True:
+            changes = await cls.find_changes(existence.seq, page)
+            cls.add_existing([change.entity_id for change in changes if change.operation == "create"])
+            if changes:
+                existence.seq = changes[-1].seq
+            if len(changes) < page:
+                break
+
+    @classmethod
+    def add_existing(cls, ids: List[uuid.UUID]):
+        existence = cls.existence_filter()
+        if existence is None or not ids:
+            return
+        existence.add(ids)
+        cls.rebuild_if_full(existence)
+
+    @classmethod
+    def rebuild_if_full(cls, existence: ExistenceFilter):
+        if existence.full and cls.__dict__.get("_existence_rebuild") is None:
+            # rebuilt at a larger capacity in the background, the current filter is used meanwhile
+            setattr(cls, "_existence_rebuild", asyncio.ensure_future(cls.rebuild_existence_filter()))
+
+    @classmethod
+    @traced_method
+    async def rebuild_existence_filter(cls):
+        try:
+            await cls.build_existence_filter()
+        finally:
+            setattr(cls, "_existence_rebuild", None)
+
+    @classmethod
+    def stats_fields(cls) -> Tuple[str, ...]:
+        return tuple(dict.fromkeys(dimension.field for dimension in cls.stats_dimensions.values()))
+
+    @classmethod
+    @traced_method
+    async def find_tracked_rows(
+        cls, session, conditions: List[FilterCondition]
+    ) -> List[Tuple[uuid.UUID, Mapping[str, Any]]]:
+        """Ids and stats fields of the matching rows, as the write hooks need them.
+
+        The rows are locked until the end of the transaction, so that the write which follows writes them as they
+        have been read: a concurrent write of the same rows waits, then finds them changed or gone.
+        """
+        await cls.lock_for_write(session)
+        fields = cls.stats_fields()
+        columns = [getattr(cls.model, field) for field in fields]
+        query = add_filters(cls.model, select(cls.model.id, *columns), conditions).with_for_update()
+        rows = (await with_timeout(session.execute(query))).all()
+        return [(row[0], dict(zip(fields, row[1:]))) for row in rows]
+
+    @classmethod
+    async def lock_for_write(cls, session):
+        """Takes the write lock of SQLite, which has no row locks and ignores FOR UPDATE, ahead of a read."""
+        if session.bind.dialect.name == "sqlite":
+            # a write matching no row is enough to hold the lock until the end of the transaction
+            await with_timeout(session.execute(cls.model.__table__.delete().where(false())))
+
+    @classmethod
+    def stat_keys(cls, values: Mapping[str, Any]) -> List[Tuple[str, str]]:
+        keys = [(TOTAL, "")]
+        for name, dimension in cls.stats_dimensions.items():
+            key = dimension.key(values.get(dimension.field))
+            if key is not None:
+                keys.append((name, key[: EntityStat.value.type.length]))
+        return keys
+
+    @classmethod
+    def stat_deltas(
+        cls, removed: List[Mapping[str, Any]] = (), added: List[Mapping[str, Any]] = ()  # type: ignore
+    ) -> Dict[Tuple[str, str], int]:
+        deltas: Dict[Tuple[str, str], int] = defaultdict(int)
+        for values in removed:
+            for key in cls.stat_keys(values):
+                deltas[key] -= 1
+        for values in added:
+            for key in cls.stat_keys(values):
+                deltas[key] += 1
+        return deltas
+
+    @classmethod
+    @traced_method
+    async def count_stats(
+        cls, session, removed: List[Mapping[str, Any]] = (), added: List[Mapping[str, Any]] = ()  # type: ignore
+    ):
+        if not cls.stats_dimensions:
+            return
+        await cls.write_stats(session, cls.stat_deltas(removed, added))
+
+    @classmethod
+    @traced_method
+    async def write_stats(cls, session, deltas: Mapping[Tuple[str, str], int]):
+        params = [
+            {"entity": cls.model.__tablename__, "dimension": dimension, "value": value, "count": count}
+            # in a stable order, so that concurrent writes lock the rows in the same order
+            for (dimension, value), count in sorted(deltas.items())
+            if count
+        ]
+        if not params:
+            return
+        table = EntityStat.__table__
+        query = dialect_insert(session, table)
+        query = query.on_conflict_do_update(
+            index_elements=[table.c.entity, table.c.dimension, table.c.value],
+            set_={"count": table.c.count + query.excluded.count},
+        )
+        await with_timeout(session.execute(query, params))
+
+    @classmethod
+    @traced_method
+    async def find_stats(cls, dimension: str) -> Dict[str, int]:
+        """Row counts per key of a dimension, read from the summary table."""
+        query = select(EntityStat.value, EntityStat.count).where(
+            EntityStat.entity == cls.model.__tablename__, EntityStat.dimension == dimension, EntityStat.count > 0
+        )
+        async with cls.session_scope() as session:
+            try:
+                await set_statement_timeout(session)
+                rows = (await with_timeout(session.execute(query))).all()
+            except SQLAlchemyError as exc:
+                raise to_repository_exception(exc)
+        return {value: count for value, count in rows}
+
+    @classmethod
+    @traced_method
+    async def rebuild_stats(cls) -> int:
+        """Recounts the stats of the entity from scratch and returns the number of rows counted.
+
+        Writes to the entity are blocked on Postgres meanwhile, so that none of them is lost or counted twice.
+        """
+        fields = cls.stats_fields()
+        query = select(*[getattr(cls.model, field) for field in fields]).execution_options(yield_per=1000)
+        deltas: Dict[Tuple[str, str], int] = defaultdict(int)
+        rows_counted = 0
+        async with cls.session_scope() as session:
+            try:
+                if session.bind.dialect.name == "postgresql":
+                    await session.execute(text(f'LOCK TABLE "{cls.model.__tablename__}" IN SHARE MODE'))
+                await session.execute(delete(EntityStat).where(EntityStat.entity == cls.model.__tablename__))
+                async_result = await session.stream(query)
+                async for row in async_result:
+                    rows_counted += 1
+                    for key in cls.stat_keys(dict(zip(fields, row))):
+                        deltas[key] += 1
+                await cls.write_stats(session, deltas)
+                await cls.commit(session)
+            except SQLAlchemyError as exc:
+                await cls.rollback(session)
+                raise to_repository_exception(exc)
+        return rows_counted
+
+    @classmethod
+    def change_payload(cls, values: Mapping[str, Any]) -> Optional[dict]:
+        payload = {field: values[field] for field in cls.change_feed_fields if field in values}
+        # round trip through JSON so that the payload of a published event matches the stored one
+        return json.loads(json.dumps(payload, default=str)) if payload else None
+
+    @classmethod
+    def change_entries(cls, operation: str, rows: List[Tuple[uuid.UUID, Mapping[str, Any]]]) -> List[ChangeLogEntry]:
+        if not cls.change_feed:
+            return []
+        created_at = datetime.datetime.utcnow()
+        return [
+            ChangeLogEntry(
+                entity=cls.model.__tablename__,
+                operation=operation,
+                entity_id=entity_id,
+                payload=cls.change_payload(values),
+                created_at=created_at,
+            )
+            for entity_id, values in rows
+        ]
+
+    @classmethod
+    def log_changes(cls, session, operation: str, rows: List[Tuple[uuid.UUID, Mapping[str, Any]]]):
+        changes = cls.change_entries(operation, rows)
+        session.add_all(changes)
+        return changes
+
+    @classmethod
+    @traced_method
+    async def log_created(cls, session, models: List[SAModel]) -> List[ChangeLogEntry]:
+        if not cls.change_feed:
+            return []
+        # ids are generated on flush
+        await with_timeout(session.flush())
+        return cls.log_changes(session, "create", [(model.id, model.__dict__) for model in models])
+
+    @classmethod
+    def publish_changes(cls, changes: List[ChangeLogEntry]):
+        if changes:
+            event_bus.publish([ChangeEvent.from_orm(change) for change in changes])
+
+    @classmethod
+    def subscribe_changes(cls):
+        return event_bus.subscribe(cls.model.__tablename__)
+
+    @classmethod
+    @traced_method
+    async def find_changes(cls, since: int = 0, limit: int = 100) -> List[ChangeEvent]:
+        """Changes after the sequence number ``since``, which readers resume from, as entries are committed in order."""
+        query_config = FindQueryConfig(
+            response_schema=ChangeEvent,
+            conditions=[
+                FilterCondition(field="entity", value=cls.model.__tablename__),
+                FilterCondition(field="seq", operation=FilterOps.GT, value=since),
+            ],
+            order_by="seq",
+            limit=limit,
+        )
+        return [change async for change in ChangeLogRepository.find(query_config)]
+
+    @classmethod
+    @traced_method
+    async def last_change_seq(cls) -> int:
+        query = select(func.max(ChangeLogEntry.seq)).where(ChangeLogEntry.entity == cls.model.__tablename__)
+        async with ChangeLogRepository.open_session() as session:
+            return (await with_timeout(session.execute(query))).scalar_one() or 0
+
+
+class ChangeLogRepository(SARepository):
+    model = ChangeLogEntry
@@ -0,0 +1,114 @@
+import asyncio
+import bisect
+import uuid
+
+from collections import OrderedDict
+from typing import Any, AsyncIterable, Dict, List, Mapping, Optional, Tuple
+
+from metrics import registry
+
+
+def normalize(value: Any) -> str:
+    return str(value).strip().lower()
+
+
+class PrefixIndex:
+    """In-memory prefix index over a few text fields of an entity.
+
+    Terms are kept in a sorted list of (term, id) pairs, so the matches of a prefix are a contiguous range
+    found by bisection. Results of recent queries are cached until the next change of the index.
+    """
+
+    def __init__(self, name: str, fields: Tuple[str, ...], cache_size: int = 1000):
+        self.fields = fields
+        self.cache_size = cache_size
+        self.ready = False
+        self._terms: List[Tuple[str, uuid.UUID]] = []
+        self._terms_by_id: Dict[uuid.UUID, Dict[str, str]] = {}
+        self._cache: "OrderedDict[Tuple[str, int], List[uuid.UUID]]" = OrderedDict()
+        # writes applied while the index is being built, replayed once it is ready
+        self._pending: Optional[List[Tuple[str, List[Tuple[uuid.UUID, Mapping[str, Any]]]]]] = None
+        self._build_lock = asyncio.Lock()
+        self._cache_hits = registry.counter(f"{name}.cache_hits")
+        self._cache_misses = registry.counter(f"{name}.cache_misses")
+        self._size = registry.gauge(f"{name}.terms")
+
+    async def build(self, rows: AsyncIterable[Tuple[uuid.UUID, Mapping[str, Any]]], force: bool = True):
+        """Rebuilds the index from (id, field values) rows, typically a scan of the table.
+
+        Without ``force``, an index which has got ready meanwhile is left as is.
+        """
+        async with self._build_lock:
+            if self.ready and not force:
+                return
+            self._pending = []
+            terms_by_id: Dict[uuid.UUID, Dict[str, str]] = {}
+            async for entity_id, values in rows:
+                terms_by_id[entity_id] = self._terms_of(values)
+            self._terms_by_id = terms_by_id
+            self._terms = sorted(
+                (term, entity_id) for entity_id, terms in terms_by_id.items() for term in terms.values()
+            )
+            pending, self._pending = self._pending, None
+            self.ready = True
+            for operation, changed_rows in pending:
+                self.apply(operation, changed_rows)
+            self._changed()
+
+    def apply(self, operation: str, rows: List[Tuple[uuid.UUID, Mapping[str, Any]]]):
+        """Applies committed writes: full values for creates, changed values for updates, ids for deletes."""
+        if self._pending is not None:
+            self._pending.append((operation, rows))
+            return
+        if not self.ready:
+            return
+        for entity_id, values in rows:
+            old_terms = self._terms_by_id.pop(entity_id, {})
+            for term in old_terms.values():
+                self._remove_term(term, entity_id)
+            if operation == "delete":
+                continue
+            terms = dict(old_terms, **self._terms_of(values))
+            self._terms_by_id[entity_id] = terms
+            for term in terms.values():
+                bisect.insort(self._terms, (term, entity_id))
+        self._changed()
+
+    def search(self, prefix: str, limit: int = 10) -> List[uuid.UUID]:
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        key = (prefix, limit)
+        cached = self._cache.get(key)
+        if cached is not None:
+            self._cache_hits.inc()
+            self._cache.move_to_end(key)
+            return cached
+
+        self._cache_misses.inc()
+        found: Dict[uuid.UUID, None] = {}
+        position = bisect.bisect_left(self._terms, (prefix,))
+        while position < len(self._terms) and len(found) < limit:
+            term, entity_id = self._terms[position]
+            if not term.startswith(prefix):
+                break
+            found[entity_id] = None
+            position += 1
+
+        ids = list(found)
+        self._cache[key] = ids
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return ids
+
+    def _terms_of(self, values: Mapping[str, Any]) -> Dict[str, str]:
+        return {field: normalize(values[field]) for field in self.fields if values.get(field) is not None}
+
+    def _remove_term(self, term: str, entity_id: uuid.UUID):
+        position = bisect.bisect_left(self._terms, (term, entity_id))
+        if position < len(self._terms) and self._terms[position] == (term, entity_id):
+            del self._terms[position]
+
+    def _changed(self):
+        self._cache.clear()
+        self._size.set(len(self._terms))
@@ -0,0 +1,334 @@
+import asyncio
+import functools
+import hashlib
+import heapq
+import uuid
+
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from pydantic import BaseModel
+from typing import (
+    Any,
+    AsyncIterable,
+    AsyncIterator,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Mapping,
+    Optional,
+    Sequence,
+    Tuple,
+    Type,
+    Union,
+)
+
+from domain.domain_entity import DomainEntity
+from orm.changefeed.models import ChangeLogEntry
+from orm.db import Base as SAModel, shard_session_factory, shard_urls
+from orm.ids import new_id
+from orm.repository import (
+    ChangeLogRepository,
+    FilterCondition,
+    FilterOps,
+    FindQueryConfig,
+    RepositoryException,
+    SARepository,
+    UpsertResult,
+)
+
+
+# Shard the sessions of a sharded repository are opened on, set by the routing of each call.
+current_shard: ContextVar[Optional[int]] = ContextVar("current_shard", default=None)
+
+
+@contextmanager
+def on_shard(shard: int) -> Iterator[None]:
+    token = current_shard.set(shard)
+    try:
+        yield
+    finally:
+        current_shard.reset(token)
+
+
+@functools.total_ordering
+class Descending:
+    """Sort key wrapper inverting the order of the wrapped key."""
+
+    __slots__ = ("key",)
+
+    def __init__(self, key: Any):
+        self.key = key
+
+    def __eq__(self, other: Any) -> bool:
+        return self.key == other.key
+
+    def __lt__(self, other: Any) -> bool:
+        return other.key < self.key
+
+
+def sort_key(entity: BaseModel, order_by: Optional[List[str]]) -> Tuple[Any, ...]:
+    """Key ordering entities the way ORDER BY does, with NULLs last ascending and first descending."""
+    key: List[Any] = []
+    for order_field in order_by or ():
+        field = order_field[1:] if order_field.startswith("-") else order_field
+        try:
+            value = getattr(entity, field)
+        except AttributeError:
+            raise RepositoryException(f"Field {field} has to be in the response schema to merge shards by it.")
+        field_key = (value is None, value)
+        key.append(Descending(field_key) if order_field.startswith("-") else field_key)
+    return tuple(key)
+
+
+async def next_or_none(iterator: AsyncIterator[Any]) -> Optional[Any]:
+    try:
+        return await iterator.__anext__()
+    except StopAsyncIteration:
+        return None
+
+
+class ShardedSARepository(SARepository):
+    """Spreads the rows of a repository over several databases by a hash of their UUID primary key.
+
+    Creates, updates and deletes or finds by id go to the one shard owning the id. Other finds and counts are
+    sent to every shard, and the results are merged on ``order_by`` before ``offset`` and ``limit`` are applied.
+    The merge compares values in Python, so text is ordered by code point whatever the DB collation is.
+
+    The change log stays in the main database and is written right after the shard transaction commits. Shards do
+    not join units of work.
+    """
+
+    # session factories of the shards, the DB_SHARDS engines by default
+    shards: Optional[Sequence[Callable[[], Any]]] = None
+
+    @classmethod
+    def shard_sessions(cls) -> Sequence[Callable[[], Any]]:
+        if cls.shards is not None:
+            return cls.shards
+        return [functools.partial(shard_session_factory, shard) for shard in range(len(shard_urls()))]
+
+    @classmethod
+    def shard_for(cls, id: Union[uuid.UUID, str]) -> int:
+        entity_id = id if isinstance(id, uuid.UUID) else uuid.UUID(str(id))
+        # hashed, as the bits of time-ordered ids are far from uniform
+        digest = hashlib.blake2b(entity_id.bytes, digest_size=8).digest()
+        return int.from_bytes(digest, "big") % len(cls.shard_sessions())
+
+    @classmethod
+    def routed_shard(cls, conditions: Optional[List[FilterCondition]]) -> Optional[int]:
+        for condition in conditions or ():
+            if condition.field == "id" and condition.operation == FilterOps.EQ and condition.value is not None:
+                return cls.shard_for(condition.value)
+        return None
+
+    @classmethod
+    def open_session(cls):
+        shard = current_shard.get()
+        if shard is None:
+            raise RepositoryException(f"No shard has been selected for model {cls.model.__name__}.")
+        return cls.shard_sessions()[shard]()
+
+    @classmethod
+    @asynccontextmanager
+    async def session_scope(cls) -> AsyncIterator[Any]:
+        # a unit of work is bound to the main database, shards keep transactions of their own
+        async with cls.open_session() as session:
+            yield session
+
+    @classmethod
+    async def count(cls, query=None, filters: Optional[List[FilterCondition]] = None) -> int:
+        count = super().count
+
+        async def count_shard(shard: int) -> int:
+            with on_shard(shard):
+                return await count(query, filters)
+
+        shard = cls.routed_shard(filters)
+        shards = range(len(cls.shard_sessions())) if shard is None else [shard]
+        return sum(await asyncio.gather(*(count_shard(shard) for shard in shards)))
+
+    @classmethod
+    async def find(cls, query_config: FindQueryConfig, query=None) -> AsyncIterable[BaseModel]:
+        shard = cls.routed_shard(query_config.conditions)
+        if shard is not None:
+            with on_shard(shard):
+                entities = super().find(query_config, query).__aiter__()
+                head = await next_or_none(entities)
+            try:
+                if head is not None:
+                    yield head
+                    async for entity in entities:
+                        yield entity
+            finally:
+                await entities.aclose()  # type: ignore
+            return
+
+        # every shard may hold any of the rows of the page, so each is asked for all the rows up to its end
+        shard_config = query_config.copy(
+            update={
+                "offset": None,
+                "limit": None if query_config.limit is None else (query_config.offset or 0) + query_config.limit,
+            }
+        )
+        streams: List[AsyncIterator[BaseModel]] = []
+        try:
+            heap = []
+            for shard in range(len(cls.shard_sessions())):
+                # the session of a stream is opened on its first item
+                with on_shard(shard):
+                    stream = super().find(shard_config, query).__aiter__()
+                    streams.append(stream)
+                    head = await next_or_none(stream)
+                if head is not None:
+                    # a shard has one entry at most, so ties never get to compare the entities
+                    heap.append((sort_key(head, query_config.order_by), shard, head))
+            heapq.heapify(heap)
+
+            skip, remaining = query_config.offset or 0, query_config.limit
+            while heap and remaining != 0:
+                _, shard, entity = heap[0]
+                following = await next_or_none(streams[shard])
+                if following is None:
+                    heapq.heappop(heap)
+                else:
+                    heapq.heapreplace(heap, (sort_key(following, query_config.order_by), shard, following))
+                if skip:
+                    skip -= 1
+                    continue
+                yield entity
+                if remaining is not None:
+                    remaining -= 1
+        finally:
+            for stream in streams:
+                await stream.aclose()  # type: ignore
+
+    @classmethod
+    def to_model(cls, entity: DomainEntity) -> SAModel:
+        # the id decides the shard, so it cannot be left to the DB
+        model = super().to_model(entity)
+        if model.id is None:
+            model.id = new_id()
+        return model
+
+    @classmethod
+    async def insert_one(cls, model: SAModel, response_schema: BaseModel) -> BaseModel:
+        with on_shard(cls.shard_for(model.id)):
+            return await super().insert_one(model, response_schema)
+
+    @classmethod
+    async def insert_many(
+        cls, models: List[SAModel], items: List[Tuple[DomainEntity, BaseModel]]
+    ) -> List[Union[BaseModel, Exception]]:
+        positions_by_shard: Dict[int, List[int]] = {}
+        for position, model in enumerate(models):
+            positions_by_shard.setdefault(cls.shard_for(model.id), []).append(position)
+
+        results: List[Union[BaseModel, Exception]] = [None] * len(models)  # type: ignore
+        for shard, positions in positions_by_shard.items():
+            with on_shard(shard):
+                shard_results = await super().insert_many(
+                    [models[position] for position in positions], [items[position] for position in positions]
+                )
+            for position, result in zip(positions, shard_results):
+                results[position] = result
+        return results
+
+    @classmethod
+    async def upsert(cls, entities: List[DomainEntity], response_schema: Type[BaseModel]) -> UpsertResult:
+        # the natural key is only unique within a shard, as rows are spread by id
+        raise RepositoryException(f"Upserts are not supported on the shards of model {cls.model.__name__}.")
+
+    @classmethod
+    async def update_by_id(cls, id: uuid.UUID, values: dict, response_schema: Type[BaseModel]) -> BaseModel:
+        with on_shard(cls.shard_for(id)):
+            return await super().update_by_id(id, values, response_schema)
+
+    @classmethod
+    async def update(cls, conditions: List[FilterCondition], values: dict) -> int:
+        shard = cls.routed_shard(conditions)
+        shards = range(len(cls.shard_sessions())) if shard is None else [shard]
+        updated_amount = 0
+        for shard in shards:
+            with on_shard(shard):
+                updated_amount += await super().update(conditions, values)
+        return updated_amount
+
+    @classmethod
+    async def delete(cls, conditions: List[FilterCondition]) -> int:
+        shard = cls.routed_shard(conditions)
+        shards = range(len(cls.shard_sessions())) if shard is None else [shard]
+        deleted_amount = 0
+        for shard in shards:
+            with on_shard(shard):
+                deleted_amount += await super().delete(conditions)
+        return deleted_amount
+
+    @classmethod
+    async def search_rows(cls) -> AsyncIterable[Tuple[uuid.UUID, Mapping[str, Any]]]:
+        for shard in range(len(cls.shard_sessions())):
+            with on_shard(shard):
+                rows = super().search_rows().__aiter__()
+                head = await next_or_none(rows)
+            if head is not None:
+                yield head
+                async for row in rows:
+                    yield row
+
+    @classmethod
+    async def stream_ids(cls) -> AsyncIterable[uuid.UUID]:
+        for shard in range(len(cls.shard_sessions())):
+            with on_shard(shard):
+                ids = super().stream_ids().__aiter__()
+                head = await next_or_none(ids)
+            if head is not None:
+                yield head
+                async for entity_id in ids:
+                    yield entity_id
+
+    @classmethod
+    async def find_stats(cls, dimension: str) -> Dict[str, int]:
+        find_stats = super().find_stats
+
+        async def find_shard_stats(shard: int) -> Dict[str, int]:
+            with on_shard(shard):
+                return await find_stats(dimension)
+
+        totals: Dict[str, int] = {}
+        shards = range(len(cls.shard_sessions()))
+        for stats in await asyncio.gather(*(find_shard_stats(shard) for shard in shards)):
+            for value, count in stats.items():
+                totals[value] = totals.get(value, 0) + count
+        return totals
+
+    @classmethod
+    async def rebuild_stats(cls) -> int:
+        rows_counted = 0
+        for shard in range(len(cls.shard_sessions())):
+            with on_shard(shard):
+                rows_counted += await super().rebuild_stats()
+        return rows_counted
+
+    @classmethod
+    def log_changes(cls, session, operation: str, rows: List[Tuple[uuid.UUID, Mapping[str, Any]]]):
+        # sequence numbers of the shards would collide, the entries are stored in the main database on commit
+        return cls.change_entries(operation, rows)
+
+    @classmethod
+    async def on_committed(
+        cls,
+        operation: str,
+        rows: List[Tuple[uuid.UUID, Mapping[str, Any]]],
+        changes: List[ChangeLogEntry],
+    ):
+        if changes:
+            async with ChangeLogRepository.open_session() as session:
+                session.add_all(changes)
+                await session.commit()
+        await super().on_committed(operation, rows, changes)
+
+
+@functools.lru_cache(maxsize=None)
+def sharded(repo: Type[SARepository]) -> Type[ShardedSARepository]:
+    """Sharded variant of a repository."""
+    return type(f"Sharded{repo.__name__}", (ShardedSARepository, repo), {})
@@ -0,0 +1,20 @@
+"""Recounts the stats of entities from scratch, of all the ones declaring dimensions by default.
+
+    python -m orm.stats [entity ...]
+"""
+import asyncio
+import sys
+
+from typing import List
+
+from orm.factories import repo_factory, repository_registry
+
+
+async def rebuild(names: List[str]):
+    for name in names or [name for name, repo in repository_registry.items() if repo.stats_dimensions]:
+        rows_counted = await repo_factory(name).rebuild_stats()
+        print(f"{name}: {rows_counted} rows counted")
+
+
+if __name__ == "__main__":
+    asyncio.run(rebuild(sys.argv[1:]))
@@ -0,0 +1,23 @@
+from typing import Any, Callable, NamedTuple, Optional
+
+
+# dimension counting all the rows, maintained for every entity with stats
+TOTAL = "total"
+
+
+class Dimension(NamedTuple):
+    """Groups the rows of an entity by a key computed from one of their fields."""
+
+    field: str
+    key: Callable[[Any], Optional[str]]
+
+
+def email_domain(email: Optional[str]) -> Optional[str]:
+    if not email or "@" not in email:
+        return None
+    return email.rsplit("@", 1)[1].strip().lower()
+
+
+def initial(value: Optional[str]) -> Optional[str]:
+    value = (value or "").strip()
+    return value[:1].upper() or None
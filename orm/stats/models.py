@@ -0,0 +1,14 @@
+from sqlalchemy import Column, Integer, String
+
+from ..db import Base
+
+
+class EntityStat(Base):
+    """Number of rows of an entity per value of a stats dimension."""
+
+    __tablename__ = "entity_stat"
+
+    entity = Column("entity", String(64), primary_key=True)
+    dimension = Column("dimension", String(64), primary_key=True)
+    value = Column("value", String(255), primary_key=True)
+    count = Column("count", Integer, nullable=False)
@@ -1,16 +1,16 @@
-import uuid
-
 from sqlalchemy import Column, String
 from sqlalchemy_utils.types.uuid import UUIDType
 
 from ..db import Base
+from ..ids import new_id
 
 
 class User(Base):
     __tablename__ = "user"
 
-    id = Column("id", UUIDType(), primary_key=True, default=uuid.uuid4)
-    email = Column("email", String(255), nullable=False)
+    # native UUID on Postgres, BINARY(16) elsewhere
+    id = Column("id", UUIDType(binary=True, native=True), primary_key=True, default=new_id)
+    email = Column("email", String(255), nullable=False, unique=True, index=True)
     password = Column("password", String(75), nullable=False)
     first_name = Column("first_name", String(255), nullable=False)
     last_name = Column("last_name", String(255), nullable=False)
@@ -0,0 +1,30 @@
+from fastapi import APIRouter, HTTPException
+from typing import Optional
+
+from metrics import registry
+from orm.cache import cache_backend
+from tracing import MemoryExporter, tracer
+
+
+router = APIRouter()
+
+
+@router.get("/metrics", summary="Metrics")
+async def get_metrics():
+    cache = cache_backend()
+    if cache is not None:
+        # refreshes the footprint gauges of the cache
+        cache.stats()
+    return registry.snapshot()
+
+
+@router.get("/traces", summary="Traces")
+async def get_traces(limit: int = 20, trace_id: Optional[str] = None):
+    """The last traces of the worker, each a list of spans ending with the root one."""
+    current_tracer = tracer()
+    if current_tracer is None or not isinstance(current_tracer.exporter, MemoryExporter):
+        raise HTTPException(status_code=404, detail="Traces are not kept in memory, see TRACE_EXPORTER.")
+    traces = current_tracer.exporter.traces()
+    if trace_id is not None:
+        traces = [spans for spans in traces if spans and spans[0]["trace_id"] == trace_id]
+    return traces[:limit]
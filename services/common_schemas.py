@@ -1,9 +1,39 @@
 from pydantic import BaseModel
 from typing import List, Any, Optional
 
+from orm.changefeed.bus import ChangeEvent
+
 
 class ApiListResponse(BaseModel):
     count: int
     results: List[Any]
     next: Optional[str]
     previous: Optional[str]
+
+
+class ChangeFeedResponse(BaseModel):
+    changes: List[ChangeEvent]
+    last_seq: int
+
+
+class StatGroup(BaseModel):
+    value: str
+    count: int
+
+
+class StatsResponse(BaseModel):
+    dimension: str
+    total: int
+    groups: List[StatGroup]
+
+
+class UpsertResponse(BaseModel):
+    inserted: int
+    updated: int
+    results: List[Any]
+
+
+class BulkWriteResponse(BaseModel):
+    # rows written, or the rows which would be on a dry run
+    rows: int
+    dry_run: bool
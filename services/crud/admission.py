@@ -0,0 +1,91 @@
+import asyncio
+import math
+
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+from metrics import registry
+from orm.db import engine_factory
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, retry_after: float):
+        super().__init__(f"Service is overloaded, retry in {retry_after} seconds.")
+        self.retry_after = retry_after
+
+
+def pool_saturation() -> float:
+    """Checked out connections relative to the DB pool size, capped at 1 once the pool overflows.
+
+    Pools without a size, such as ``NullPool``, are never saturated.
+    """
+    pool = engine_factory().sync_engine.pool
+    if not hasattr(pool, "checkedout") or not hasattr(pool, "size"):
+        return 0.0
+    size = pool.size()
+    if size <= 0:
+        return 0.0
+    return min(pool.checkedout() / size, 1.0)
+
+
+class ConcurrencyLimiter:
+    """Limits the number of concurrently executing requests of an action.
+
+    At most ``max_concurrency`` requests run at once and at most ``max_queue`` wait for a slot. A waiting
+    request is shed with :class:`AdmissionRejected` once it has waited for ``queue_timeout`` seconds. The wait
+    budget shrinks as the DB pool saturates, proportionally to ``pool_weight``, so with a busy pool the queue
+    gives up earlier instead of piling up requests that would wait for a connection anyway.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int,
+        max_queue: int = 100,
+        queue_timeout: float = 1.0,
+        pool_weight: float = 1.0,
+        name: str = "admission",
+    ):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.pool_weight = pool_weight
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._waiting = 0
+        self._admitted = registry.counter(f"{name}.admitted")
+        self._rejected = registry.counter(f"{name}.rejected")
+        self._queue_wait = registry.summary(f"{name}.queue_wait_seconds")
+
+    def wait_budget(self) -> float:
+        return self.queue_timeout * max(1.0 - self.pool_weight * pool_saturation(), 0.0)
+
+    def reject(self) -> AdmissionRejected:
+        self._rejected.inc()
+        return AdmissionRejected(retry_after=max(math.ceil(self.queue_timeout), 1))
+
+    @asynccontextmanager
+    async def acquire(self) -> AsyncIterator[None]:
+        if self._semaphore.locked():
+            if self._waiting >= self.max_queue:
+                raise self.reject()
+            budget = self.wait_budget()
+            if budget <= 0:
+                raise self.reject()
+
+            loop = asyncio.get_running_loop()
+            started_at = loop.time()
+            self._waiting += 1
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), budget)
+            except asyncio.TimeoutError:
+                raise self.reject()
+            finally:
+                self._waiting -= 1
+            self._queue_wait.observe(loop.time() - started_at)
+        else:
+            await self._semaphore.acquire()
+
+        self._admitted.inc()
+        try:
+            yield
+        finally:
+            self._semaphore.release()
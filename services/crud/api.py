@@ -1,18 +1,39 @@
 import uuid
 
-from fastapi import APIRouter
-from fastapi.responses import JSONResponse
-from typing import Optional, Type, Dict, Callable
+from contextlib import AsyncExitStack, asynccontextmanager
+from fastapi import APIRouter, Body, Header, HTTPException
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from typing import Optional, Type, Dict, Callable, AsyncIterator, Any, List, Tuple, Union
 from pydantic import BaseModel
 
 from . import service
-from orm.repository import FilterCondition, Repository
-from ..common_schemas import ApiListResponse
+from .admission import ConcurrencyLimiter
+from .idempotency import IdempotencyStore, fingerprint_request
+from .responses import FastJSONStreamingResponse
+from orm.query_budget import query_budget
+from orm.repository import FilterCondition, Repository, UnitOfWork, query_timeout, unit_of_work
+from orm.stats.dimensions import TOTAL
+from ..common_schemas import ApiListResponse, BulkWriteResponse, ChangeFeedResponse, StatsResponse, UpsertResponse
 from ..utils import get_next_page_url, get_prev_page_url
+from tracing import span
 
 
 class URLConf(BaseModel):
     service_handler: Optional[Callable] = None
+    admission: Optional[ConcurrencyLimiter] = None
+    # seconds each DB statement of the action is allowed to run for
+    statement_timeout: Optional[float] = None
+    # when set, results are rendered by this class directly instead of FastAPI's jsonable_encoder pass
+    response_class: Optional[Type[Response]] = None
+    # repository calls of the action share one session and transaction, committed before the response
+    unit_of_work: bool = False
+    # queries a request to the action is expected to run at most, the ones running more are logged
+    query_budget: Optional[int] = None
+    # name of the action in logs and metrics, "{entity}.{action}" as set by crud_factory
+    name: Optional[str] = None
+
+    class Config:
+        arbitrary_types_allowed = True
 
 
 class GetURLConf(URLConf):
@@ -22,6 +43,14 @@ class GetURLConf(URLConf):
 class CreateURLConf(URLConf):
     response_model: Type[BaseModel]
     entity_type: Type[BaseModel]
+    idempotency_store: Optional[IdempotencyStore] = None
+
+
+class UpsertURLConf(URLConf):
+    response_model: Type[UpsertResponse]
+    entity_type: Type[BaseModel]
+    entity_schema: Type[BaseModel]
+    max_batch_size: int = 1000
 
 
 class ListURLConf(URLConf):
@@ -32,14 +61,106 @@ class ListURLConf(URLConf):
 class UpdateURLConf(URLConf):
     response_model: Type[BaseModel]
     update_schema: Type[BaseModel]
+    idempotency_store: Optional[IdempotencyStore] = None
 
 
 class DeleteURLConf(URLConf):
     pass
 
 
+class BulkDeleteURLConf(URLConf):
+    # fields the conditions are allowed to filter on
+    filter_fields: Tuple[str, ...]
+    chunk_size: int = 1000
+    # seconds to wait between chunks
+    chunk_pause: float = 0.0
+
+
+class BulkUpdateURLConf(BulkDeleteURLConf):
+    update_schema: Type[BaseModel]
+
+
+class SearchURLConf(URLConf):
+    entity_schema: Type[BaseModel]
+    max_limit: int = 20
+
+
+class StatsURLConf(URLConf):
+    max_limit: int = 1000
+
+
+class ChangesURLConf(URLConf):
+    page_size: int = 100
+    # the longest a long-poll may wait for changes, in seconds
+    max_wait: float = 30
+    # how often the change log is checked for changes committed by other processes, in seconds
+    poll_interval: float = 1.0
+
+
+class ExportURLConf(URLConf):
+    entity_schema: Type[BaseModel]
+    streaming_response_class: Type[FastJSONStreamingResponse] = FastJSONStreamingResponse
+
+
+@asynccontextmanager
+async def action_scope(action_conf: URLConf) -> AsyncIterator[None]:
+    async with AsyncExitStack() as stack:
+        # the time between the root span of the request and this one goes to the validation of the request
+        stack.enter_context(span(action_conf.name or "action"))
+        stack.enter_context(query_timeout(action_conf.statement_timeout))
+        if action_conf.query_budget is not None:
+            stack.enter_context(query_budget(action_conf.name or "action", action_conf.query_budget))
+        if action_conf.admission is not None:
+            await stack.enter_async_context(action_conf.admission.acquire())
+        # entered after admission, so that queued requests do not hold a connection
+        if action_conf.unit_of_work:
+            await stack.enter_async_context(unit_of_work())
+        yield
+
+
+async def request_unit_of_work() -> AsyncIterator[UnitOfWork]:
+    """FastAPI dependency sharing one unit of work between the repository calls of a request.
+
+    FastAPI finalizes dependencies once the response has been sent, so a handler which has to report a failed
+    commit to the client calls ``await uow.commit()`` itself before returning.
+    """
+    async with unit_of_work() as uow:
+        yield uow
+
+
+def to_response_model(content: Any, response_model: Type[BaseModel]) -> BaseModel:
+    """Validates and filters the content the way FastAPI does for a ``response_model``."""
+    if type(content) is response_model:
+        return content
+    if isinstance(content, BaseModel):
+        content = content.dict()
+    return response_model.validate(content)
+
+
+def render(action_conf: URLConf, content: Any, response_model: Optional[Type[BaseModel]] = None) -> Any:
+    # a returned Response bypasses FastAPI's response_model handling, so it is done here
+    if action_conf.response_class is None or isinstance(content, Response):
+        return content
+    with span("render"):
+        if response_model is not None:
+            content = to_response_model(content, response_model)
+        return action_conf.response_class(content)
+
+
+def route_kwargs(action_conf: URLConf) -> Dict[str, Any]:
+    return {"response_class": action_conf.response_class} if action_conf.response_class is not None else {}
+
+
 def get_available_actions():
+    # static paths go first so that they are not shadowed by /{entity_id}
     return {
+        "changes": add_changes_action,
+        "export": add_export_action,
+        "search": add_search_action,
+        "stats": add_stats_action,
+        "upsert": add_upsert_action,
+        "bulk_delete": add_bulk_delete_action,
+        "bulk_update": add_bulk_update_action,
         "get": add_get_action,
         "create": add_create_action,
         "list": add_list_action,
@@ -48,11 +169,22 @@ def get_available_actions():
     }
 
 
-def crud_factory(entity_name: str, router: APIRouter, repo: Repository, actions: Dict[str, URLConf]):
+def crud_factory(
+    entity_name: str,
+    router: APIRouter,
+    repo: Repository,
+    actions: Dict[str, URLConf],
+    response_class: Optional[Type[Response]] = None,
+):
     available_actions = get_available_actions()
     for action_name, handler in available_actions.items():
         if action_name in actions:
-            handler(entity_name, router, repo, actions[action_name])
+            action_conf = actions[action_name]
+            if response_class is not None and action_conf.response_class is None:
+                action_conf = action_conf.copy(update={"response_class": response_class})
+            if action_conf.name is None:
+                action_conf = action_conf.copy(update={"name": f"{entity_name.lower()}.{action_name}"})
+            handler(entity_name, router, repo, action_conf)
     return router
 
 
@@ -61,31 +193,78 @@ def add_create_action(entity_name: str, router: APIRouter, repo: Repository, act
     if action_conf.service_handler:
         service_handler = action_conf.service_handler
 
-    @router.post("/", response_model=action_conf.response_model, summary=f"{entity_name} Create")
-    async def create_entity(entity: action_conf.entity_type):  # type: ignore
-        created_entity = await service_handler(repo, entity, action_conf.response_model)
-        return created_entity
+    @router.post(
+        "/", response_model=action_conf.response_model, summary=f"{entity_name} Create", **route_kwargs(action_conf)
+    )
+    async def create_entity(
+        entity: action_conf.entity_type, idempotency_key: Optional[str] = Header(None)  # type: ignore
+    ):
+        async def create():
+            async with action_scope(action_conf):
+                created_entity = await service_handler(repo, entity, action_conf.response_model)
+                return render(action_conf, created_entity, action_conf.response_model)
+
+        if action_conf.idempotency_store is not None and idempotency_key:
+            return await action_conf.idempotency_store.run(
+                f"{entity_name}:create:{idempotency_key}", fingerprint_request(entity), create
+            )
+        return await create()
 
     return create_entity
 
 
+def add_upsert_action(entity_name: str, router: APIRouter, repo: Repository, action_conf: UpsertURLConf):
+    service_handler = service.upsert_entities
+    if action_conf.service_handler:
+        service_handler = action_conf.service_handler
+
+    @router.post(
+        "/upsert",
+        response_model=action_conf.response_model,
+        summary=f"{entity_name} Upsert",
+        **route_kwargs(action_conf),
+    )
+    async def upsert_entities(
+        entities: Union[List[action_conf.entity_type], action_conf.entity_type]  # type: ignore
+    ):
+        batch = entities if isinstance(entities, list) else [entities]
+        if len(batch) > action_conf.max_batch_size:
+            detail = f"Batches are limited to {action_conf.max_batch_size} entities."
+            raise HTTPException(status_code=422, detail=detail)
+        async with action_scope(action_conf):
+            result = await service_handler(repo, batch, action_conf.entity_schema)
+        response = action_conf.response_model.construct(
+            inserted=result.inserted,
+            updated=result.updated,
+            results=[to_response_model(entity, action_conf.entity_schema) for entity in result.entities],
+        )
+        return render(action_conf, response)
+
+    return upsert_entities
+
+
 def add_list_action(entity_name: str, router: APIRouter, repo: Repository, action_conf: ListURLConf):
     service_handler = service.get_entities
     if action_conf.service_handler:
         service_handler = action_conf.service_handler
 
-    @router.get("/", response_model=action_conf.response_model, summary=f"{entity_name} List")
+    @router.get(
+        "/", response_model=action_conf.response_model, summary=f"{entity_name} List", **route_kwargs(action_conf)
+    )
     async def list_entity(offset: int = 0, limit: int = 100, order_by: Optional[str] = None):
-        entities = await service_handler(repo, action_conf.entity_schema, offset, limit, order_by)
-        count = await service.get_entity_count(repo)
+        async with action_scope(action_conf):
+            entities = await service_handler(repo, action_conf.entity_schema, offset, limit, order_by)
+            count = await service.get_entity_count(repo)
 
         base_url = router.url_path_for("list_entity")
-        return action_conf.response_model(
-            results=entities,
+        # entities of the entity schema type are taken as is instead of being validated once more
+        response = action_conf.response_model.construct(
+            results=[to_response_model(entity, action_conf.entity_schema) for entity in entities],
             count=count,
             next=get_next_page_url(base_url, offset, limit, count, order_by),
             previous=get_prev_page_url(base_url, offset, limit, order_by),
         )
+        return render(action_conf, response)
 
     return list_entity
 
@@ -95,32 +274,106 @@ def add_update_action(entity_name: str, router: APIRouter, repo: Repository, act
     if action_conf.service_handler:
         service_handler = action_conf.service_handler
 
-    @router.patch("/{entity_id}", response_model=action_conf.response_model, summary=f"{entity_name} Update")
-    async def update_entity(entity_id: uuid.UUID, update_data: action_conf.update_schema):  # type: ignore
-        updated_entity = await service_handler(
-            repo,
-            entity_id,
-            update_data.dict(exclude_unset=True),
-            response_schema=action_conf.response_model,
-        )
-        return updated_entity
+    @router.patch(
+        "/{entity_id}",
+        response_model=action_conf.response_model,
+        summary=f"{entity_name} Update",
+        **route_kwargs(action_conf),
+    )
+    async def update_entity(
+        entity_id: uuid.UUID,
+        update_data: action_conf.update_schema,  # type: ignore
+        idempotency_key: Optional[str] = Header(None),
+    ):
+        async def update():
+            async with action_scope(action_conf):
+                updated_entity = await service_handler(
+                    repo,
+                    entity_id,
+                    update_data.dict(exclude_unset=True),
+                    response_schema=action_conf.response_model,
+                )
+            return render(action_conf, updated_entity, action_conf.response_model)
+
+        if action_conf.idempotency_store is not None and idempotency_key:
+            return await action_conf.idempotency_store.run(
+                f"{entity_name}:update:{idempotency_key}",
+                fingerprint_request(entity_id, update_data.dict(exclude_unset=True)),
+                update,
+            )
+        return await update()
 
     return update_entity
 
 
+def check_conditions(conditions: List[FilterCondition], filter_fields: Tuple[str, ...]):
+    if not conditions:
+        raise HTTPException(status_code=422, detail="Bulk writes need at least one condition.")
+    for condition in conditions:
+        if condition.field not in filter_fields:
+            raise HTTPException(status_code=422, detail=f"Conditions can only filter on: {', '.join(filter_fields)}.")
+
+
+def add_bulk_delete_action(entity_name: str, router: APIRouter, repo: Repository, action_conf: BulkDeleteURLConf):
+    service_handler = service.bulk_delete_entities
+    if action_conf.service_handler:
+        service_handler = action_conf.service_handler
+
+    @router.post("/bulk/delete", response_model=BulkWriteResponse, summary=f"{entity_name} Bulk Delete")
+    async def bulk_delete_entities(conditions: List[FilterCondition] = Body(..., embed=True), dry_run: bool = False):
+        check_conditions(conditions, action_conf.filter_fields)
+        async with action_scope(action_conf):
+            rows = await service_handler(
+                repo, conditions, action_conf.chunk_size, action_conf.chunk_pause, dry_run=dry_run
+            )
+        return BulkWriteResponse(rows=rows, dry_run=dry_run)
+
+    return bulk_delete_entities
+
+
+def add_bulk_update_action(entity_name: str, router: APIRouter, repo: Repository, action_conf: BulkUpdateURLConf):
+    service_handler = service.bulk_update_entities
+    if action_conf.service_handler:
+        service_handler = action_conf.service_handler
+
+    @router.post("/bulk/update", response_model=BulkWriteResponse, summary=f"{entity_name} Bulk Update")
+    async def bulk_update_entities(
+        conditions: List[FilterCondition],
+        values: action_conf.update_schema,  # type: ignore
+        dry_run: bool = False,
+    ):
+        check_conditions(conditions, action_conf.filter_fields)
+        update_data = values.dict(exclude_unset=True)
+        if not update_data:
+            raise HTTPException(status_code=422, detail="Values to update are missing.")
+        async with action_scope(action_conf):
+            rows = await service_handler(
+                repo, conditions, update_data, action_conf.chunk_size, action_conf.chunk_pause, dry_run=dry_run
+            )
+        return BulkWriteResponse(rows=rows, dry_run=dry_run)
+
+    return bulk_update_entities
+
+
 def add_get_action(entity_name: str, router: APIRouter, repo: Repository, action_conf: GetURLConf):
     service_handler = service.get_entity
     if action_conf.service_handler:
         service_handler = action_conf.service_handler
 
-    @router.get("/{entity_id}", response_model=action_conf.response_model, summary=f"{entity_name} Get")
+    @router.get(
+        "/{entity_id}",
+        response_model=action_conf.response_model,
+        summary=f"{entity_name} Get",
+        **route_kwargs(action_conf),
+    )
     async def get_entity(entity_id: uuid.UUID):
-        entity = await service_handler(
-            repo,
-            [FilterCondition(field="id", value=entity_id)],
-            action_conf.response_model,
-        )
-        return entity
+        async with action_scope(action_conf):
+            entity = await service_handler(
+                repo,
+                [FilterCondition(field="id", value=entity_id)],
+                action_conf.response_model,
+            )
+        return render(action_conf, entity, action_conf.response_model)
 
     return get_entity
 
@@ -132,8 +385,99 @@ def add_delete_action(entity_name: str, router: APIRouter, repo: Repository, act
 
     @router.delete("/{entity_id}", summary=f"{entity_name} Delete")
     async def delete_entity(entity_id: uuid.UUID):
-        deleted_amount = await service_handler(repo, [FilterCondition(field="id", value=entity_id)])
+        async with action_scope(action_conf):
+            deleted_amount = await service_handler(repo, [FilterCondition(field="id", value=entity_id)])
         if deleted_amount == 0:
             return JSONResponse(status_code=404, content={"message": "Entity not found."})
 
     return delete_entity
+
+
+def add_export_action(entity_name: str, router: APIRouter, repo: Repository, action_conf: ExportURLConf):
+    service_handler = service.stream_entities
+    if action_conf.service_handler:
+        service_handler = action_conf.service_handler
+
+    @router.get("/export", summary=f"{entity_name} Export", response_class=action_conf.streaming_response_class)
+    async def export_entities(order_by: Optional[str] = None):
+        async def entities():
+            # the response is streamed after the handler returns, so the scope has to wrap the iteration
+            async with action_scope(action_conf):
+                async for entity in service_handler(repo, action_conf.entity_schema, order_by):
+                    yield to_response_model(entity, action_conf.entity_schema)
+
+        return action_conf.streaming_response_class(entities())
+
+    return export_entities
+
+
+def add_search_action(entity_name: str, router: APIRouter, repo: Repository, action_conf: SearchURLConf):
+    service_handler = service.search_entities
+    if action_conf.service_handler:
+        service_handler = action_conf.service_handler
+
+    @router.get(
+        "/search",
+        response_model=List[action_conf.entity_schema],  # type: ignore
+        summary=f"{entity_name} Search",
+        **route_kwargs(action_conf),
+    )
+    async def search_entities(q: str, limit: int = 10):
+        async with action_scope(action_conf):
+            entities = await service_handler(
+                repo, q, max(min(limit, action_conf.max_limit), 0), action_conf.entity_schema
+            )
+        return render(action_conf, [to_response_model(entity, action_conf.entity_schema) for entity in entities])
+
+    return search_entities
+
+
+def add_stats_action(entity_name: str, router: APIRouter, repo: Repository, action_conf: StatsURLConf):
+    service_handler = service.get_stats
+    if action_conf.service_handler:
+        service_handler = action_conf.service_handler
+
+    @router.get("/stats", response_model=StatsResponse, summary=f"{entity_name} Stats", **route_kwargs(action_conf))
+    async def get_stats(dimension: str = TOTAL, limit: int = 100):
+        dimensions = [TOTAL, *repo.stats_dimensions]
+        if dimension not in dimensions:
+            raise HTTPException(status_code=422, detail=f"Dimension has to be one of: {', '.join(dimensions)}.")
+        async with action_scope(action_conf):
+            stats = await service_handler(repo, dimension, max(min(limit, action_conf.max_limit), 0))
+        return render(action_conf, stats, StatsResponse)
+
+    return get_stats
+
+
+def add_changes_action(entity_name: str, router: APIRouter, repo: Repository, action_conf: ChangesURLConf):
+    @router.get("/changes", response_model=ChangeFeedResponse, summary=f"{entity_name} Changes")
+    async def list_changes(since: int = 0, limit: Optional[int] = None, wait: float = 0):
+        async with action_scope(action_conf):
+            changes = await service.wait_for_changes(
+                repo,
+                since,
+                min(limit or action_conf.page_size, action_conf.page_size),
+                min(wait, action_conf.max_wait),
+                action_conf.poll_interval,
+            )
+        return ChangeFeedResponse(changes=changes, last_seq=changes[-1].seq if changes else since)
+
+    @router.get("/changes/stream", summary=f"{entity_name} Changes Stream", response_class=StreamingResponse)
+    async def stream_changes(since: int = 0, last_event_id: Optional[str] = Header(None)):
+        # a reconnecting EventSource resumes from the last event it has received
+        if last_event_id and last_event_id.isdigit():
+            since = int(last_event_id)
+
+        async def events():
+            async with action_scope(action_conf):
+                async for changes in service.stream_changes(
+                    repo, since, action_conf.page_size, action_conf.poll_interval
+                ):
+                    if not changes:
+                        yield ": keepalive\n\n"
+                    for change in changes:
+                        yield f"id: {change.seq}\nevent: change\ndata: {change.json()}\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return list_changes, stream_changes
@@ -0,0 +1,278 @@
+import asyncio
+import datetime
+import hashlib
+import json
+import random
+
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, Response
+from pydantic import BaseModel
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from sqlalchemy import update
+from sqlalchemy.exc import SQLAlchemyError
+
+from orm.idempotency.models import IdempotencyRecord
+from orm.repository import (
+    SARepository,
+    FilterCondition,
+    FilterOps,
+    FindQueryConfig,
+    RepositoryException,
+    to_repository_exception,
+)
+from orm import repository as orm_repository
+
+
+class StoredResponse(BaseModel):
+    fingerprint: str
+    status_code: int = 200
+    content: Any = None
+
+    class Config:
+        orm_mode = True
+
+
+class IdempotencyRecordSchema(StoredResponse):
+    key: str
+    created_at: datetime.datetime
+
+
+def fingerprint_request(*parts: Any) -> str:
+    payload = json.dumps(jsonable_encoder(parts), sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class IdempotencyStore(ABC):
+    """Keeps completed responses by Idempotency-Key.
+
+    A retry is answered from the store without calling the handler again. Concurrent requests with the same
+    key wait for the first one to complete instead of running the handler twice: within a process through an
+    in-flight event, across processes through :meth:`claim`.
+    """
+
+    # seconds between checks for a response of a key claimed by another process
+    poll_interval = 0.05
+
+    def __init__(self):
+        self._in_flight: Dict[str, asyncio.Event] = {}
+
+    @abstractmethod
+    async def get(self, key: str) -> Optional[StoredResponse]:
+        pass
+
+    @abstractmethod
+    async def put(self, key: str, response: StoredResponse):
+        pass
+
+    async def claim(self, key: str, fingerprint: str) -> bool:
+        """Reserves the key for execution, False if another process is executing it."""
+        return True
+
+    async def release(self, key: str):
+        """Gives up a claimed key whose execution has failed."""
+
+    async def run(self, key: str, fingerprint: str, handler: Callable[[], Awaitable[Any]]) -> Any:
+        while True:
+            stored = await self.get(key)
+            if stored is not None:
+                return self.replay(stored, fingerprint)
+            in_flight = self._in_flight.get(key)
+            if in_flight is not None:
+                # the first execution may fail, in which case the stored response is still missing
+                # and one of the waiters gets to execute the handler
+                await in_flight.wait()
+                continue
+            in_flight = self._in_flight[key] = asyncio.Event()
+            try:
+                claimed = await self.claim(key, fingerprint)
+            except BaseException:
+                del self._in_flight[key]
+                in_flight.set()
+                raise
+            if claimed:
+                break
+            del self._in_flight[key]
+            in_flight.set()
+            await asyncio.sleep(self.poll_interval)
+
+        try:
+            result = await handler()
+        except BaseException:
+            await self.release(key)
+            raise
+        else:
+            await self.put(key, self.to_stored_response(result, fingerprint))
+            return result
+        finally:
+            del self._in_flight[key]
+            in_flight.set()
+
+    @staticmethod
+    def to_stored_response(result: Any, fingerprint: str) -> StoredResponse:
+        if isinstance(result, Response):
+            return StoredResponse(
+                fingerprint=fingerprint,
+                status_code=result.status_code,
+                content=json.loads(result.body) if result.body else None,
+            )
+        return StoredResponse(fingerprint=fingerprint, content=jsonable_encoder(result))
+
+    @staticmethod
+    def replay(stored: StoredResponse, fingerprint: str) -> JSONResponse:
+        if stored.fingerprint != fingerprint:
+            raise HTTPException(status_code=422, detail="Idempotency-Key has already been used for another request.")
+        return JSONResponse(status_code=stored.status_code, content=stored.content)
+
+
+class InMemoryIdempotencyStore(IdempotencyStore):
+    """LRU store holding at most ``max_entries`` responses for ``ttl`` seconds each."""
+
+    def __init__(self, max_entries: int = 10000, ttl: Optional[float] = 24 * 60 * 60):
+        super().__init__()
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._responses: "OrderedDict[str, tuple]" = OrderedDict()
+
+    async def get(self, key: str) -> Optional[StoredResponse]:
+        entry = self._responses.get(key)
+        if entry is None:
+            return None
+        stored_at, response = entry
+        if self.ttl is not None and stored_at + self.ttl < asyncio.get_running_loop().time():
+            del self._responses[key]
+            return None
+        self._responses.move_to_end(key)
+        return response
+
+    async def put(self, key: str, response: StoredResponse):
+        self._responses[key] = (asyncio.get_running_loop().time(), response)
+        self._responses.move_to_end(key)
+        while len(self._responses) > self.max_entries:
+            self._responses.popitem(last=False)
+
+
+PENDING_STATUS = 0
+
+
+class IdempotencyRecordRepository(SARepository):
+    model = IdempotencyRecord
+
+    @classmethod
+    async def complete(cls, key: str, values: dict) -> int:
+        query = (
+            update(cls.model).where(cls.model.key == key, cls.model.status_code == PENDING_STATUS).values(**values)
+        )
+        async with orm_repository.session_factory() as session:
+            try:
+                updated = await session.execute(query)
+                await session.commit()
+            except SQLAlchemyError as exc:
+                await session.rollback()
+                raise to_repository_exception(exc)
+        return updated.rowcount
+
+
+class DBIdempotencyStore(IdempotencyStore):
+    """Store backed by the ``idempotency_record`` table, shared by all the workers.
+
+    A key is claimed by inserting a pending record before the handler runs, so duplicates arriving at other
+    workers wait for it. A pending record older than ``claim_timeout`` seconds is considered abandoned and can be
+    claimed again. Records older than ``ttl`` seconds, and the oldest ones beyond ``max_entries``, are pruned on
+    ``prune_probability`` of the writes.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 100000,
+        ttl: float = 24 * 60 * 60,
+        claim_timeout: float = 60,
+        prune_probability: float = 0.01,
+        repo=IdempotencyRecordRepository,
+    ):
+        super().__init__()
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.claim_timeout = claim_timeout
+        self.prune_probability = prune_probability
+        self.repo = repo
+
+    async def get(self, key: str) -> Optional[StoredResponse]:
+        query_config = FindQueryConfig(
+            response_schema=StoredResponse,
+            conditions=[
+                FilterCondition(field="key", value=key),
+                FilterCondition(field="status_code", operation=FilterOps.GT, value=PENDING_STATUS),
+                FilterCondition(field="created_at", operation=FilterOps.GTE, value=self._seconds_ago(self.ttl)),
+            ],
+        )
+        responses = [response async for response in self.repo.find(query_config)]
+        return responses[0] if responses else None
+
+    async def claim(self, key: str, fingerprint: str) -> bool:
+        record = IdempotencyRecordSchema(
+            key=key, fingerprint=fingerprint, status_code=PENDING_STATUS, created_at=datetime.datetime.utcnow()
+        )
+        for _ in range(2):
+            try:
+                await self.repo.create(record, StoredResponse)
+                return True
+            except RepositoryException:
+                # the key is taken, which is fine unless by an expired response or an abandoned claim
+                if not await self._delete_stale(key):
+                    return False
+        return False
+
+    async def _delete_stale(self, key: str) -> int:
+        expired = await self.repo.delete(
+            [
+                FilterCondition(field="key", value=key),
+                FilterCondition(field="created_at", operation=FilterOps.LT, value=self._seconds_ago(self.ttl)),
+            ]
+        )
+        abandoned = await self.repo.delete(
+            [
+                FilterCondition(field="key", value=key),
+                FilterCondition(field="status_code", value=PENDING_STATUS),
+                FilterCondition(
+                    field="created_at", operation=FilterOps.LT, value=self._seconds_ago(self.claim_timeout)
+                ),
+            ]
+        )
+        return expired + abandoned
+
+    async def release(self, key: str):
+        await self.repo.delete(
+            [FilterCondition(field="key", value=key), FilterCondition(field="status_code", value=PENDING_STATUS)]
+        )
+
+    async def put(self, key: str, response: StoredResponse):
+        values = dict(response.dict(), created_at=datetime.datetime.utcnow())
+        if not await self.repo.complete(key, values):
+            # the claim has been taken over after the timeout, keep the response of the new owner
+            return
+        if random.random() < self.prune_probability:
+            await self.prune()
+
+    async def prune(self):
+        await self.repo.delete(
+            [FilterCondition(field="created_at", operation=FilterOps.LT, value=self._seconds_ago(self.ttl))]
+        )
+        excess = await self.repo.count() - self.max_entries
+        if excess <= 0:
+            return
+        query_config = FindQueryConfig(
+            response_schema=IdempotencyRecordSchema, order_by="created_at", offset=excess - 1, limit=1
+        )
+        oldest_kept = [record async for record in self.repo.find(query_config)]
+        if oldest_kept:
+            await self.repo.delete(
+                [FilterCondition(field="created_at", operation=FilterOps.LTE, value=oldest_kept[0].created_at)]
+            )
+
+    @staticmethod
+    def _seconds_ago(seconds: float) -> datetime.datetime:
+        return datetime.datetime.utcnow() - datetime.timedelta(seconds=seconds)
@@ -0,0 +1,154 @@
+import datetime
+import decimal
+import enum
+import gzip
+import json
+import uuid
+import zlib
+
+from pydantic import BaseModel
+from starlette.datastructures import Headers
+from starlette.responses import Response, StreamingResponse
+from starlette.types import Receive, Scope, Send
+from typing import Any, AsyncIterable, Callable, Dict, List, Optional, Type
+
+try:
+    import ujson
+except ImportError:  # pragma: no cover
+    ujson = None
+
+
+GZIP_LEVEL = 6
+
+primitive_converters: Dict[type, Callable[[Any], Any]] = {
+    uuid.UUID: str,
+    datetime.datetime: datetime.datetime.isoformat,
+    datetime.date: datetime.date.isoformat,
+    datetime.time: datetime.time.isoformat,
+    decimal.Decimal: float,
+    bytes: bytes.decode,
+}
+
+
+def to_primitive(value: Any) -> Any:
+    """Turns a value into JSON-native types, a lightweight replacement of ``jsonable_encoder``."""
+    value_type = type(value)
+    if value_type in (str, int, float, bool) or value is None:
+        return value
+    if value_type is dict:
+        return {key: to_primitive(item) for key, item in value.items()}
+    if value_type in (list, tuple, set, frozenset):
+        return [to_primitive(item) for item in value]
+    if isinstance(value, BaseModel):
+        return to_primitive(value.dict(by_alias=True))
+    converter = primitive_converters.get(value_type)
+    if converter is not None:
+        return converter(value)
+    if isinstance(value, enum.Enum):
+        return to_primitive(value.value)
+    for base_type, converter in primitive_converters.items():
+        if isinstance(value, base_type):
+            return converter(value)
+    raise TypeError(f"Object of type {value_type.__name__} is not JSON serializable")
+
+
+def dumps(content: Any) -> bytes:
+    content = to_primitive(content)
+    if ujson is not None:
+        return ujson.dumps(content, ensure_ascii=False).encode("utf-8")
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def accepts_gzip(scope: Scope) -> bool:
+    return "gzip" in Headers(scope=scope).get("accept-encoding", "")
+
+
+class FastJSONResponse(Response):
+    """Renders pydantic models straight to JSON bytes, skipping ``jsonable_encoder``.
+
+    Bodies of at least ``gzip_min_size`` bytes are gzipped for clients accepting it; use :meth:`with_gzip`
+    to get a response class with compression enabled.
+    """
+
+    media_type = "application/json"
+    gzip_min_size: Optional[int] = None
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+    @classmethod
+    def with_gzip(cls, min_size: int = 1024) -> Type["FastJSONResponse"]:
+        return type(f"GZip{cls.__name__}", (cls,), {"gzip_min_size": min_size})
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if self.gzip_min_size is not None and len(self.body) >= self.gzip_min_size and accepts_gzip(scope):
+            self.body = gzip.compress(self.body, compresslevel=GZIP_LEVEL)
+            self.headers["content-encoding"] = "gzip"
+            self.headers["content-length"] = str(len(self.body))
+            self.headers.add_vary_header("Accept-Encoding")
+        await super().__call__(scope, receive, send)
+
+
+class FastJSONStreamingResponse(StreamingResponse):
+    """Streams the items of an async iterable as a JSON array.
+
+    The body is gzipped for clients accepting it once its first ``gzip_min_size`` bytes have been produced;
+    shorter bodies are sent as is.
+    """
+
+    media_type = "application/json"
+    gzip_min_size: Optional[int] = None
+    use_gzip = False
+
+    def __init__(self, content: AsyncIterable[Any], **kwargs):
+        super().__init__(self.encode(content), **kwargs)
+
+    @staticmethod
+    async def encode(items: AsyncIterable[Any]) -> AsyncIterable[bytes]:
+        separator = b"["
+        async for item in items:
+            yield separator + dumps(item)
+            separator = b","
+        yield b"[]" if separator == b"[" else b"]"
+
+    @classmethod
+    def with_gzip(cls, min_size: int = 1024) -> Type["FastJSONStreamingResponse"]:
+        return type(f"GZip{cls.__name__}", (cls,), {"gzip_min_size": min_size})
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        self.use_gzip = self.gzip_min_size is not None and accepts_gzip(scope)
+        await super().__call__(scope, receive, send)
+
+    async def stream_response(self, send: Send):
+        if not self.use_gzip:
+            await super().stream_response(send)
+            return
+
+        # headers go out before the body, so the decision is taken once enough of the body is buffered
+        chunks = self.body_iterator.__aiter__()
+        buffered, buffered_size = [], 0
+        async for chunk in chunks:
+            buffered.append(chunk)
+            buffered_size += len(chunk)
+            if buffered_size >= self.gzip_min_size:
+                break
+        else:
+            self.body_iterator = self.iterate(buffered)
+            await super().stream_response(send)
+            return
+
+        self.headers["content-encoding"] = "gzip"
+        self.headers.add_vary_header("Accept-Encoding")
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+        await send({"type": "http.response.body", "body": compressor.compress(b"".join(buffered)), "more_body": True})
+        async for chunk in chunks:
+            compressed = compressor.compress(chunk)
+            if compressed:
+                await send({"type": "http.response.body", "body": compressed, "more_body": True})
+        await send({"type": "http.response.body", "body": compressor.flush(), "more_body": False})
+
+    @staticmethod
+    async def iterate(chunks: List[bytes]) -> AsyncIterable[bytes]:
+        for chunk in chunks:
+            yield chunk
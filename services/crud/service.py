@@ -1,16 +1,31 @@
+import asyncio
+import heapq
 import uuid
 
 from pydantic import BaseModel
-from typing import List, Optional, Type, Dict, Any
+from typing import List, Optional, Type, Dict, Any, AsyncIterable
 
-from orm.repository import FindQueryConfig, FilterCondition, Repository
+from orm.changefeed.bus import ChangeEvent
+from orm.repository import FindQueryConfig, FilterCondition, Repository, UpsertResult
+from orm.stats.dimensions import TOTAL
+from tracing import traced
+from ..common_schemas import StatGroup, StatsResponse
 
 
+@traced
 async def create_entity(repo: Repository, entity: BaseModel, response_schema: Type[BaseModel]) -> Type[BaseModel]:
     entity = await repo.create(entity, response_schema)
     return entity
 
 
+@traced
+async def upsert_entities(
+    repo: Repository, entities: List[BaseModel], response_schema: Type[BaseModel]
+) -> UpsertResult:
+    return await repo.upsert(entities, response_schema)
+
+
+@traced
 async def get_entities(
     repo: Repository,
     response_schema: BaseModel,
@@ -26,20 +41,69 @@ async def get_entities(
         order_by=order_by,
         conditions=filters,
     )
-    entities = []
-    async for entity in repo.find(query_config):
-        entities.append(entity)
-    return entities
+    return await repo.find_list(query_config)
+
+
+@traced
+async def stream_entities(
+    repo: Repository, response_schema: BaseModel, order_by: Optional[str] = None
+) -> AsyncIterable[BaseModel]:
+    async for entity in repo.find(FindQueryConfig(response_schema=response_schema, order_by=order_by)):
+        yield entity
+
+
+@traced
+async def search_entities(
+    repo: Repository, prefix: str, limit: int, response_schema: Type[BaseModel]
+) -> List[BaseModel]:
+    return await repo.search(prefix, limit, response_schema)
+
+
+@traced
+async def get_stats(repo: Repository, dimension: str, limit: int) -> StatsResponse:
+    """The largest groups of a stats dimension, along with the total number of rows."""
+    groups = await repo.find_stats(dimension)
+    total = sum((await repo.find_stats(TOTAL)).values())
+    largest = heapq.nsmallest(limit, groups.items(), key=lambda group: (-group[1], group[0]))
+    return StatsResponse(
+        dimension=dimension, total=total, groups=[StatGroup(value=value, count=count) for value, count in largest]
+    )
+
 
+@traced
+async def bulk_delete_entities(
+    repo: Repository, conditions: List[FilterCondition], chunk_size: int, pause: float, dry_run: bool = False
+) -> int:
+    if dry_run:
+        return await repo.count(filters=conditions)
+    return await repo.bulk_delete(conditions, chunk_size, pause)
 
+
+@traced
+async def bulk_update_entities(
+    repo: Repository,
+    conditions: List[FilterCondition],
+    values: Dict[str, Any],
+    chunk_size: int,
+    pause: float,
+    dry_run: bool = False,
+) -> int:
+    if dry_run:
+        return await repo.count(filters=conditions)
+    return await repo.bulk_update(conditions, values, chunk_size, pause)
+
+
+@traced
 async def get_entity(repo: Repository, conditions: List[FilterCondition], response_schema: BaseModel):
     return await repo.find_one(conditions, response_schema)
 
 
+@traced
 async def get_entity_count(repo: Repository, filters: Optional[List[FilterCondition]] = None):
-    return await repo.count(filters)
+    return await repo.count_list(filters)
 
 
+@traced
 async def update_entity(
     repo: Repository, id: uuid.UUID, update_data: Dict[str, Any], response_schema: Type[BaseModel]
 ) -> BaseModel:
@@ -47,5 +111,54 @@ async def update_entity(
     return updated_user
 
 
+@traced
 async def delete_entity(repo: Repository, conditions: List[FilterCondition]) -> int:
     return await repo.delete(conditions)
+
+
+def drain(queue: asyncio.Queue):
+    while not queue.empty():
+        queue.get_nowait()
+
+
+@traced
+async def wait_for_changes(
+    repo: Repository, since: int, limit: int, wait: float, poll_interval: float
+) -> List[ChangeEvent]:
+    """Long-polls the change log until there are changes after ``since`` or ``wait`` seconds pass.
+
+    Commits of this process wake the poll up immediately, the ones of other processes are picked up
+    every ``poll_interval`` seconds.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + wait
+    with repo.subscribe_changes() as queue:
+        while True:
+            changes = await repo.find_changes(since, limit)
+            remaining = deadline - loop.time()
+            if changes or remaining <= 0:
+                return changes
+            try:
+                await asyncio.wait_for(queue.get(), min(remaining, poll_interval))
+                drain(queue)
+            except asyncio.TimeoutError:
+                pass
+
+
+@traced
+async def stream_changes(
+    repo: Repository, since: int, limit: int, poll_interval: float
+) -> AsyncIterable[List[ChangeEvent]]:
+    """Yields batches of changes after ``since`` as they get committed, an empty batch when idle."""
+    with repo.subscribe_changes() as queue:
+        while True:
+            changes = await repo.find_changes(since, limit)
+            if changes:
+                since = changes[-1].seq
+                yield changes
+                continue
+            try:
+                await asyncio.wait_for(queue.get(), poll_interval)
+                drain(queue)
+            except asyncio.TimeoutError:
+                yield []
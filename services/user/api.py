@@ -7,7 +7,10 @@ from typing import Optional, List, Dict
 from domain.user import User
 from orm.factories import repo_factory
 from ..crud import api as crud_api
-from ..common_schemas import ApiListResponse
+from ..crud.admission import ConcurrencyLimiter
+from ..crud.idempotency import InMemoryIdempotencyStore
+from ..crud.responses import FastJSONResponse, FastJSONStreamingResponse
+from ..common_schemas import ApiListResponse, UpsertResponse
 from . import service
 
 
@@ -25,21 +28,77 @@ class ListUserResponse(ApiListResponse):
     results: List[ApiUserEntity]
 
 
+class UpsertUserResponse(UpsertResponse):
+    results: List[ApiUserEntity]
+
+
 class PartialUserUpdateSchema(BaseModel):
     first_name: Optional[str]
     last_name: Optional[str]
     username: Optional[str]
 
 
+# bulk deletes and updates run one at a time
+bulk_admission = ConcurrencyLimiter(max_concurrency=1, max_queue=1, name="admission.user.bulk")
+
+# query budgets leave room for the SET LOCAL statement_timeout of each transaction on Postgres
 actions: Dict[str, crud_api.URLConf] = {
-    "get": crud_api.GetURLConf(response_model=ApiUserEntity),
-    "list": crud_api.ListURLConf(response_model=ListUserResponse, entity_schema=ApiUserEntity),
+    "get": crud_api.GetURLConf(response_model=ApiUserEntity, statement_timeout=2.0, query_budget=2),
+    "list": crud_api.ListURLConf(
+        response_model=ListUserResponse,
+        entity_schema=ApiUserEntity,
+        admission=ConcurrencyLimiter(max_concurrency=10, max_queue=50, queue_timeout=2.0, name="admission.user.list"),
+        statement_timeout=5.0,
+        # no unit of work: the page and the count are cached apart, so the count may differ from the page by the
+        # writes which have come in between
+        query_budget=4,
+    ),
     "create": crud_api.CreateURLConf(
         response_model=ApiUserEntity,
         entity_type=User,
         service_handler=service.create_user,
+        idempotency_store=InMemoryIdempotencyStore(),
+        admission=ConcurrencyLimiter(max_concurrency=20, max_queue=100, name="admission.user.create"),
+        query_budget=6,
+    ),
+    "upsert": crud_api.UpsertURLConf(
+        response_model=UpsertUserResponse,
+        entity_type=User,
+        entity_schema=ApiUserEntity,
+        service_handler=service.upsert_users,
+        statement_timeout=10.0,
+        query_budget=8,
+    ),
+    "update": crud_api.UpdateURLConf(
+        response_model=ApiUserEntity,
+        update_schema=PartialUserUpdateSchema,
+        idempotency_store=InMemoryIdempotencyStore(),
+        unit_of_work=True,
+        query_budget=6,
+    ),
+    "delete": crud_api.DeleteURLConf(query_budget=6),
+    "bulk_delete": crud_api.BulkDeleteURLConf(
+        filter_fields=("email", "first_name", "last_name"),
+        chunk_pause=0.05,
+        statement_timeout=5.0,
+        admission=bulk_admission,
+    ),
+    "bulk_update": crud_api.BulkUpdateURLConf(
+        update_schema=PartialUserUpdateSchema,
+        filter_fields=("email", "first_name", "last_name"),
+        chunk_pause=0.05,
+        statement_timeout=5.0,
+        admission=bulk_admission,
+    ),
+    "changes": crud_api.ChangesURLConf(),
+    "search": crud_api.SearchURLConf(entity_schema=ApiUserEntity, statement_timeout=2.0, query_budget=2),
+    "stats": crud_api.StatsURLConf(statement_timeout=2.0, unit_of_work=True, query_budget=3),
+    "export": crud_api.ExportURLConf(
+        entity_schema=ApiUserEntity,
+        streaming_response_class=FastJSONStreamingResponse.with_gzip(min_size=1024),
+        admission=ConcurrencyLimiter(max_concurrency=2, max_queue=5, queue_timeout=1.0, name="admission.user.export"),
     ),
-    "update": crud_api.UpdateURLConf(response_model=ApiUserEntity, update_schema=PartialUserUpdateSchema),
-    "delete": crud_api.DeleteURLConf(),
 }
-router = crud_api.crud_factory("User", APIRouter(), repo_factory("user"), actions)
+router = crud_api.crud_factory(
+    "User", APIRouter(), repo_factory("user"), actions, response_class=FastJSONResponse.with_gzip(min_size=1024)
+)
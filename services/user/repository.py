@@ -1,6 +1,18 @@
 from orm.repository import SARepository
+from orm.stats.dimensions import Dimension, email_domain, initial
 from orm.user import models
 
 
 class UserRepository(SARepository):
     model = models.User
+    change_feed = True
+    change_feed_fields = ("email", "first_name", "last_name")
+    search_fields = ("email", "first_name", "last_name")
+    cache_ttl = 60.0
+    natural_key = "email"
+    existence_filter_capacity = 1_000_000
+    list_cache_size = 1000
+    stats_dimensions = {
+        "email_domain": Dimension("email", email_domain),
+        "last_name_initial": Dimension("last_name", initial),
+    }
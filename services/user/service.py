@@ -1,17 +1,26 @@
 import hashlib
 
 from pydantic import BaseModel
-from typing import Type
+from typing import List, Type
 
 from domain.user import User
-from orm.repository import Repository
+from orm.repository import Repository, UpsertResult
+from tracing import traced
 
 
 def hash_password(password: str):
     return hashlib.sha512(password.encode("utf-8")).hexdigest()[:75]
 
 
+@traced
 async def create_user(repo: Repository, user: User, response_schema: Type[BaseModel]) -> User:
     user.password = hash_password(user.password)
     user = await repo.create(user, response_schema)
     return user
+
+
+@traced
+async def upsert_users(repo: Repository, users: List[User], response_schema: Type[BaseModel]) -> UpsertResult:
+    for user in users:
+        user.password = hash_password(user.password)
+    return await repo.upsert(users, response_schema)
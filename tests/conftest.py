@@ -1,12 +1,15 @@
 import pytest
 import os
 
+from contextlib import contextmanager
 from unittest import mock
 from sqlalchemy import create_engine
-from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
 from config import Config
 
 from orm import db as DB
+from orm.query_budget import count_queries, track_queries
 
 DEFAULT_TEST_DB_CONNECT = "sqlite+aiosqlite:///test.db"
 
@@ -15,6 +18,9 @@ def _get_declarative_base():
     from tests.orm.conftest import Base
 
     import orm.user.models
+    import orm.idempotency.models
+    import orm.changefeed.models
+    import orm.stats.models
 
     return Base
 
@@ -56,3 +62,60 @@ async def db(sync_engine):
 
         await child_session.close()
         await conn.rollback()  # cancel root transaction
+
+
+def create_file_db(path):
+    """Creates a SQLite database with all the tables and returns a session factory of it."""
+    _get_declarative_base().metadata.create_all(create_engine(f"sqlite:///{path}"))
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    track_queries(async_engine)
+    return async_engine, sessionmaker(async_engine, expire_on_commit=False, class_=AsyncSession)
+
+
+@pytest.fixture
+async def file_db(tmp_path):
+    """A database whose sessions commit and roll back for real, unlike the ones of the db fixture."""
+    async_engine, session_maker = create_file_db(tmp_path / "file.db")
+    with mock.patch("orm.repository.session_factory", side_effect=session_maker):
+        yield session_maker
+    await async_engine.dispose()
+
+
+@pytest.fixture
+async def pg_db():
+    """A Postgres database at TEST_PG_CONNECT, for the tests of concurrent transactions, skipped when not set."""
+    url = Config.get("TEST_PG_CONNECT", "")
+    if not url:
+        pytest.skip("TEST_PG_CONNECT is not set")
+    async_engine = create_async_engine(url)
+    track_queries(async_engine)
+    async with async_engine.begin() as connection:
+        await connection.run_sync(_get_declarative_base().metadata.drop_all)
+        await connection.run_sync(_get_declarative_base().metadata.create_all)
+    session_maker = sessionmaker(async_engine, expire_on_commit=False, class_=AsyncSession)
+    with mock.patch("orm.repository.session_factory", side_effect=session_maker):
+        yield session_maker
+    await async_engine.dispose()
+
+
+@pytest.fixture(params=["file_db", "pg_db"])
+def committing_db(request):
+    """The databases whose sessions commit for real, SQLite and Postgres when there is one."""
+    return request.getfixturevalue(request.param)
+
+
+@pytest.fixture
+def assert_max_queries():
+    """Fails a test whose block runs more queries than allowed, listing the statements run more than once.
+
+        with assert_max_queries(2):
+            await service.get_entities(...)
+    """
+
+    @contextmanager
+    def assert_max_queries(limit: int):
+        with count_queries() as log:
+            yield log
+        assert log.count <= limit, f"More than {limit} queries have been run: {log.describe()}"
+
+    return assert_max_queries
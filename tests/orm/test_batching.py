@@ -0,0 +1,91 @@
+import asyncio
+import pytest
+
+from unittest.mock import patch, MagicMock
+
+from metrics import registry
+from orm.batching import WriteBatcher
+from orm.repository import RepositoryException
+from .conftest import UserSchema, UserRepo
+
+
+class BatchedUserRepo(UserRepo):
+    create_batch_window = 0.01
+    create_batch_size = 10
+
+
+@pytest.mark.asyncio
+async def test_batcher_flushes_on_window():
+    batches = []
+
+    async def handler(items):
+        batches.append(items)
+        return [item * 2 for item in items]
+
+    batcher = WriteBatcher("test.window", handler, window=0.01, max_size=100)
+    results = await asyncio.gather(*(batcher.submit(i) for i in range(5)))
+
+    assert results == [0, 2, 4, 6, 8]
+    assert batches == [[0, 1, 2, 3, 4]]
+    assert not batcher._tasks
+    assert registry.summary("test.window.batch_size").snapshot()["max"] == 5
+
+
+@pytest.mark.asyncio
+async def test_batcher_flushes_on_size():
+    batches = []
+
+    async def handler(items):
+        batches.append(items)
+        return items
+
+    batcher = WriteBatcher("test.size", handler, window=10, max_size=2)
+    results = await asyncio.gather(*(batcher.submit(i) for i in range(4)))
+
+    assert results == [0, 1, 2, 3]
+    assert batches == [[0, 1], [2, 3]]
+
+
+@pytest.mark.asyncio
+async def test_batcher_returns_errors_per_item():
+    async def handler(items):
+        return [ValueError(item) if item % 2 else item for item in items]
+
+    batcher = WriteBatcher("test.errors", handler, window=0.01, max_size=100)
+    results = await asyncio.gather(*(batcher.submit(i) for i in range(3)), return_exceptions=True)
+
+    assert results[0] == 0
+    assert isinstance(results[1], ValueError)
+    assert results[2] == 2
+
+
+@pytest.mark.asyncio
+async def test_batched_create(db):
+    with patch("orm.repository.session_factory", return_value=db) as session_factory_mock:
+        created = await asyncio.gather(
+            *(
+                BatchedUserRepo.create(UserSchema(username=name, password="secret"), UserSchema)
+                for name in ("andrey", "paul", "andrew")
+            )
+        )
+
+    assert session_factory_mock.call_count == 1
+    assert [user.username for user in created] == ["andrey", "paul", "andrew"]
+    assert all(user.id is not None for user in created)
+    assert await UserRepo.count() == 3
+
+
+@pytest.mark.asyncio
+async def test_create_many_falls_back_to_single_creates():
+    items = [(UserSchema(username="andrey", password="secret"), UserSchema)] * 2
+    create_one_results = [UserSchema(username="andrey", password="secret"), RepositoryException("duplicate")]
+
+    with patch.object(BatchedUserRepo, "create_one", side_effect=create_one_results):
+        with patch("orm.repository.session_factory") as session_factory_mock:
+            session = session_factory_mock.return_value.__aenter__.return_value
+            session.add_all = MagicMock()
+            session.commit.side_effect = RepositoryException("batch failed")
+            results = await BatchedUserRepo.create_many(items)
+
+    assert results[0].username == "andrey"
+    assert isinstance(results[1], RepositoryException)
@@ -0,0 +1,62 @@
+import pytest
+
+from orm.cache import MemoryCacheBackend
+from orm.repository import FilterCondition, FilterOps, RepositoryException, unit_of_work
+from orm.stats.dimensions import TOTAL, Dimension, initial
+from .conftest import UserSchema, UserRepo
+
+
+class BulkUserRepo(UserRepo):
+    stats_dimensions = {"username_initial": Dimension("username", initial)}
+    cache_ttl = 60.0
+
+
+@pytest.fixture
+async def repo(file_db):
+    repo = type("BulkUserRepo", (BulkUserRepo,), {"cache": MemoryCacheBackend("test.bulk.cache")})
+    await repo.create_many(
+        [(UserSchema(username=f"user{number:02}", password="secret"), UserSchema) for number in range(25)]
+    )
+    return repo
+
+
+def username_like(value):
+    return [FilterCondition(field="username", operation=FilterOps.LIKE, value=value)]
+
+
+@pytest.mark.asyncio
+async def test_bulk_delete_in_chunks(repo, file_db):
+    chunks = []
+    assert await repo.bulk_delete(username_like("user1"), chunk_size=4, pause=0.01, progress=chunks.append) == 10
+    assert [(progress.chunks, progress.rows) for progress in chunks] == [(1, 4), (2, 8), (3, 10)]
+    assert chunks[-1].operation == "test_user.bulk_delete"
+    assert await repo.count() == 15
+    assert await repo.find_stats(TOTAL) == {"": 15}
+
+
+@pytest.mark.asyncio
+async def test_each_chunk_commits(repo, file_db):
+    def interrupt(progress):
+        if progress.chunks == 2:
+            raise RuntimeError()
+
+    with pytest.raises(RuntimeError):
+        await repo.bulk_update(username_like("user"), {"password": "changed"}, chunk_size=10, progress=interrupt)
+    assert await repo.count(filters=[FilterCondition(field="password", value="changed")]) == 20
+
+
+@pytest.mark.asyncio
+async def test_bulk_update_invalidates_the_cache(repo, file_db):
+    user = await repo.find_one([FilterCondition(field="username", value="user03")], UserSchema)
+    await repo.find_one([FilterCondition(field="id", value=user.id)], UserSchema)
+
+    assert await repo.bulk_update(username_like("user0"), {"username": "renamed"}, chunk_size=3) == 10
+    assert (await repo.find_one([FilterCondition(field="id", value=user.id)], UserSchema)).username == "renamed"
+    assert await repo.find_stats("username_initial") == {"R": 10, "U": 15}
+
+
+@pytest.mark.asyncio
+async def test_bulk_writes_are_not_run_in_a_unit_of_work(repo, file_db):
+    with pytest.raises(RepositoryException):
+        async with unit_of_work():
+            await repo.bulk_delete(username_like("user"))
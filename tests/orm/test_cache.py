@@ -0,0 +1,167 @@
+import time
+import pytest
+
+from unittest.mock import patch
+
+from orm import repository
+from orm.cache import MemoryCacheBackend, SQLiteCacheBackend
+from orm.repository import FilterCondition, unit_of_work
+from .conftest import UserSchema, UserRepo
+
+
+def test_memory_backend():
+    cache = MemoryCacheBackend("test.cache.memory", max_entries=2)
+    cache.set("user:1", "a", b"ann", ttl=60)
+    cache.set("user:1", "b", b"ann in b", ttl=60)
+    assert cache.get("user:1", "a") == b"ann"
+
+    # the least recently used entry goes first
+    cache.set("user:2", "a", b"bob", ttl=60)
+    assert cache.get("user:1", "b") is None
+    assert cache.footprint() == (2, len("user:1a") + 3 + len("user:2a") + 3)
+
+    cache.invalidate(["user:1"])
+    assert cache.get("user:1", "a") is None
+    cache.set("user:3", "a", b"eve", ttl=-1)
+    assert cache.get("user:3", "a") is None
+    assert cache.stats() == {"hits": 1, "misses": 3, "hit_ratio": 0.25, "entries": 1, "bytes": 10}
+
+
+def test_sqlite_backend_is_shared_by_processes(tmp_path):
+    path = str(tmp_path / "cache.db")
+    # a backend of its own per worker, each with its connections
+    worker0 = SQLiteCacheBackend(path, name="test.cache.worker0")
+    worker1 = SQLiteCacheBackend(path, name="test.cache.worker1")
+
+    worker0.set("user:1", "a", b"ann", ttl=60)
+    worker0.set("user:1", "b", b"ann in b", ttl=60)
+    worker0.set("user:2", "a", b"bob", ttl=60)
+    assert worker1.get("user:1", "b") == b"ann in b"
+
+    worker1.invalidate(["user:1"])
+    assert worker0.get("user:1", "a") is None
+    assert worker0.get("user:2", "a") == b"bob"
+    stats = worker0.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 1, 1)
+    assert stats["bytes"] > 0
+
+
+@pytest.mark.parametrize("backend", ["memory", "sqlite"])
+def test_invalidation_blocks_the_values_read_before(tmp_path, backend):
+    if backend == "memory":
+        cache = MemoryCacheBackend("test.cache.blocked", invalidation_ttl=0.05)
+    else:
+        cache = SQLiteCacheBackend(str(tmp_path / "cache.db"), name="test.cache.blocked", invalidation_ttl=0.05)
+    read_at = time.time()
+    cache.invalidate(["user:1"])
+    cache.set("user:1", "a", b"ann", ttl=60, read_at=read_at)
+    assert cache.get("user:1", "a") is None
+
+    cache.set("user:1", "a", b"ann", ttl=60, read_at=time.time())
+    assert cache.get("user:1", "a") == b"ann"
+    time.sleep(0.1)
+    cache.invalidate(["user:2"])
+    if backend == "sqlite":
+        cache.prune()
+    # an invalidation is forgotten after invalidation_ttl seconds
+    cache.set("user:1", "b", b"ann in b", ttl=60, read_at=read_at)
+    assert cache.get("user:1", "b") == b"ann in b"
+
+
+def test_sqlite_backend_prunes(tmp_path):
+    cache = SQLiteCacheBackend(str(tmp_path / "cache.db"), name="test.cache.prune", max_entries=3, prune_every=5)
+    cache.set("expired", "a", b"", ttl=-1)
+    for number in range(4):
+        cache.set(f"user:{number}", "a", b"", ttl=60 + number)
+    assert cache.footprint()[0] == 3
+    # the entry expiring soonest is pruned along with the expired one
+    assert cache.get("user:0", "a") is None
+    assert cache.get("user:3", "a") == b""
+
+
+def test_sqlite_backend_expires_entries(tmp_path):
+    cache = SQLiteCacheBackend(str(tmp_path / "cache.db"), name="test.cache.ttl")
+    cache.set("user:1", "a", b"ann", ttl=0.05)
+    assert cache.get("user:1", "a") == b"ann"
+    time.sleep(0.1)
+    assert cache.get("user:1", "a") is None
+
+
+class CachedUserRepo(UserRepo):
+    cache_ttl = 60.0
+
+
+@pytest.fixture
+def cached_repos(tmp_path):
+    path = str(tmp_path / "cache.db")
+    # repositories of two workers sharing the cache file
+    worker0 = type("Worker0UserRepo", (CachedUserRepo,), {"cache": SQLiteCacheBackend(path, "test.cache.repo0")})
+    worker1 = type("Worker1UserRepo", (CachedUserRepo,), {"cache": SQLiteCacheBackend(path, "test.cache.repo1")})
+    return worker0, worker1
+
+
+@pytest.mark.asyncio
+async def test_find_one_by_id_is_cached(file_db, cached_repos):
+    worker0, worker1 = cached_repos
+    user = await worker0.create(UserSchema(username="andrey", password="secret"), UserSchema)
+    by_id = [FilterCondition(field="id", value=user.id)]
+
+    assert await worker0.find_one(by_id, UserSchema) == user
+    sessions = repository.session_factory.call_count
+    assert await worker1.find_one(by_id, UserSchema) == user
+    assert await worker0.find_one(by_id, UserSchema) == user
+    assert repository.session_factory.call_count == sessions
+
+    # other lookups go to the database
+    await worker0.find_one([FilterCondition(field="username", value="andrey")], UserSchema)
+    assert repository.session_factory.call_count == sessions + 1
+
+
+@pytest.mark.asyncio
+async def test_writes_invalidate_the_cache_of_every_worker(file_db, cached_repos):
+    worker0, worker1 = cached_repos
+    user = await worker0.create(UserSchema(username="andrey", password="secret"), UserSchema)
+    by_id = [FilterCondition(field="id", value=user.id)]
+    await worker0.find_one(by_id, UserSchema)
+
+    await worker1.update_by_id(user.id, {"username": "andrew"}, UserSchema)
+    assert (await worker0.find_one(by_id, UserSchema)).username == "andrew"
+
+    await worker1.delete(by_id)
+    with pytest.raises(repository.RepositoryException):
+        await worker0.find_one(by_id, UserSchema)
+
+
+@pytest.mark.asyncio
+async def test_unit_of_work_reads_its_own_writes(file_db, cached_repos):
+    worker0, _ = cached_repos
+    user = await worker0.create(UserSchema(username="andrey", password="secret"), UserSchema)
+    by_id = [FilterCondition(field="id", value=user.id)]
+    await worker0.find_one(by_id, UserSchema)
+
+    async with unit_of_work():
+        await worker0.update_by_id(user.id, {"username": "andrew"}, UserSchema)
+        assert (await worker0.find_one(by_id, UserSchema)).username == "andrew"
+    assert (await worker0.find_one(by_id, UserSchema)).username == "andrew"
+
+
+
+@pytest.mark.asyncio
+async def test_entity_written_while_read_is_not_cached(file_db, cached_repos):
+    worker0, worker1 = cached_repos
+    user = await worker0.create(UserSchema(username="andrey", password="secret"), UserSchema)
+    by_id = [FilterCondition(field="id", value=user.id)]
+    find = worker0.find.__func__
+
+    async def find_then_update(cls, query_config):
+        entities = find(cls, query_config)
+        try:
+            entity = await entities.__anext__()
+        finally:
+            await entities.aclose()
+        await worker1.update_by_id(user.id, {"username": "andrew"}, UserSchema)
+        yield entity
+
+    with patch.object(worker0, "find", classmethod(find_then_update)):
+        assert (await worker0.find_one(by_id, UserSchema)).username == "andrey"
+    assert (await worker0.find_one(by_id, UserSchema)).username == "andrew"
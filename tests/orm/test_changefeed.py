@@ -0,0 +1,145 @@
+import asyncio
+import pytest
+
+from datetime import datetime
+from unittest.mock import patch
+from uuid import uuid4
+from fastapi import APIRouter
+
+from orm.changefeed.bus import ChangeEvent, EventBus, event_bus
+from orm.changefeed.models import ChangeLogEntry
+from orm.repository import FilterCondition, RepositoryException, SARepository
+from services.crud import api, service
+from .conftest import UserSchema, UserRepo
+
+
+class ChangeFeedUserRepo(UserRepo):
+    change_feed = True
+    change_feed_fields = ("username",)
+
+
+@pytest.mark.asyncio
+async def test_writes_are_logged_and_published(db):
+    with event_bus.subscribe("test_user") as queue:
+        user = await ChangeFeedUserRepo.create(UserSchema(username="andrey", password="secret"), UserSchema)
+        await ChangeFeedUserRepo.update_by_id(user.id, {"username": "andrew", "password": "x"}, UserSchema)
+        await ChangeFeedUserRepo.delete([FilterCondition(field="username", value="andrew")])
+
+    changes = await ChangeFeedUserRepo.find_changes()
+    assert [(change.operation, change.entity_id) for change in changes] == [
+        ("create", user.id),
+        ("update", user.id),
+        ("delete", user.id),
+    ]
+    assert [change.payload for change in changes] == [{"username": "andrey"}, {"username": "andrew"}, None]
+    published = [queue.get_nowait() for _ in range(queue.qsize())]
+    assert published == changes
+
+    assert await ChangeFeedUserRepo.find_changes(since=changes[0].seq, limit=1) == changes[1:2]
+
+
+@pytest.mark.asyncio
+async def test_repository_without_change_feed(db):
+    await UserRepo.create(UserSchema(username="andrey", password="secret"), UserSchema)
+    assert await UserRepo.find_changes() == []
+
+
+@pytest.mark.asyncio
+async def test_wait_for_changes_wakes_up_on_commit(db):
+    async def create_later():
+        await asyncio.sleep(0.05)
+        await ChangeFeedUserRepo.create(UserSchema(username="andrey", password="secret"), UserSchema)
+
+    writer = asyncio.ensure_future(create_later())
+    changes = await asyncio.wait_for(service.wait_for_changes(ChangeFeedUserRepo, 0, 10, 5, 10), 1)
+    await writer
+    assert [change.operation for change in changes] == ["create"]
+
+    assert await service.wait_for_changes(ChangeFeedUserRepo, changes[0].seq, 10, 0.01, 10) == []
+
+
+def test_bus_drops_lagging_subscribers():
+    bus = EventBus(max_queue=1)
+    change = ChangeEvent(seq=1, entity="test_user", operation="delete", entity_id=uuid4(), created_at=datetime.now())
+    with bus.subscribe("test_user") as queue:
+        bus.publish([change])
+        assert queue.get_nowait() == change
+        bus.publish([change, change])
+        assert queue not in bus._subscribers["test_user"]
+
+
+@pytest.mark.asyncio
+async def test_changes_stream_resumes_from_last_event_id(db):
+    router = APIRouter()
+    list_changes, stream_changes = api.add_changes_action(
+        "User", router, ChangeFeedUserRepo, api.ChangesURLConf(poll_interval=0.01)
+    )
+    for username in ("andrey", "paul"):
+        await ChangeFeedUserRepo.create(UserSchema(username=username, password="secret"), UserSchema)
+    first, second = await ChangeFeedUserRepo.find_changes()
+
+    response = await stream_changes(since=0, last_event_id=str(first.seq))
+    events = response.body_iterator.__aiter__()
+    assert await events.__anext__() == f"id: {second.seq}\nevent: change\ndata: {second.json()}\n\n"
+    assert await events.__anext__() == ": keepalive\n\n"
+    await events.aclose()
+
+    feed = await list_changes(since=0, limit=1)
+    assert feed.changes == [first]
+    assert feed.last_seq == first.seq
+
+
+@pytest.mark.asyncio
+async def test_entries_are_committed_in_sequence_order(committing_db):
+    def entry():
+        return ChangeLogEntry(entity="test_user", operation="create", entity_id=uuid4(), created_at=datetime.utcnow())
+
+    async with committing_db() as first, committing_db() as second:
+        first.add(entry())
+        await first.flush()
+
+        async def write_second():
+            second.add(entry())
+            await second.commit()
+
+        writer = asyncio.ensure_future(write_second())
+        await asyncio.sleep(0.1)
+        # the second transaction waits for the first one, whose entry comes first
+        assert not writer.done()
+        assert await ChangeFeedUserRepo.find_changes() == []
+        await first.commit()
+        await asyncio.wait_for(writer, 5)
+
+    changes = await ChangeFeedUserRepo.find_changes()
+    assert len(changes) == 2
+    assert await ChangeFeedUserRepo.find_changes(since=changes[0].seq) == changes[1:]
+
+
+class BatchedChangeFeedUserRepo(ChangeFeedUserRepo):
+    create_batch_window = 0.01
+
+
+@pytest.mark.asyncio
+async def test_failed_batch_publishes_the_changes_of_the_retries_only(file_db):
+    commit = SARepository.commit.__func__
+    calls = []
+
+    async def fail_first_commit(cls, session):
+        calls.append(None)
+        if len(calls) == 1:
+            raise RepositoryException("batch failed")
+        await commit(cls, session)
+
+    with event_bus.subscribe("test_user") as queue:
+        with patch.object(SARepository, "commit", classmethod(fail_first_commit)):
+            users = await asyncio.gather(
+                *(
+                    BatchedChangeFeedUserRepo.create(UserSchema(username=username, password="secret"), UserSchema)
+                    for username in ("andrey", "paul")
+                )
+            )
+        published = [queue.get_nowait() for _ in range(queue.qsize())]
+
+    assert len(calls) == 3
+    assert sorted(change.entity_id for change in published) == sorted(user.id for user in users)
+    assert published == await ChangeFeedUserRepo.find_changes()
@@ -0,0 +1,110 @@
+import time
+import uuid
+import pytest
+
+from orm import repository
+from orm.existence import BloomFilter, ExistenceFilter
+from orm.repository import FilterCondition, NotFoundException, RepositoryException
+from .conftest import UserSchema, UserRepo
+
+
+class FilteredUserRepo(UserRepo):
+    existence_filter_capacity = 100
+    change_feed = True
+
+
+def test_bloom_filter_keeps_to_its_false_positive_rate():
+    bloom = BloomFilter(10000, 0.01)
+    ids = [uuid.uuid4() for _ in range(10000)]
+    for entity_id in ids:
+        bloom.add(entity_id)
+    assert all(entity_id in bloom for entity_id in ids)
+
+    false_positives = sum(uuid.uuid4() in bloom for _ in range(10000))
+    assert false_positives < 200
+    assert bloom.estimated_false_positive_rate() == pytest.approx(0.01, abs=0.005)
+    # about 9.6 bits per id
+    assert bloom.size < 10000 * 10 / 8
+
+
+@pytest.mark.asyncio
+async def test_existence_filter_remembers_missing_ids():
+    async def ids():
+        yield known
+
+    known, missing = uuid.uuid4(), uuid.uuid4()
+    existence = ExistenceFilter("test.existence", capacity=2, negative_ttl=0.05)
+    assert existence.might_exist(missing)
+    await existence.build(ids())
+    assert existence.might_exist(known)
+
+    existence.missing(known)
+    assert not existence.might_exist(known)
+    time.sleep(0.1)
+    assert existence.might_exist(known)
+
+    existence.add([uuid.uuid4(), uuid.uuid4()])
+    assert existence.full
+
+
+@pytest.mark.asyncio
+async def test_existence_filter_is_sized_for_the_ids_expected():
+    async def ids(count):
+        for _ in range(count):
+            yield uuid.uuid4()
+
+    existence = ExistenceFilter("test.existence.sized", capacity=10)
+    await existence.build(ids(100), expected=100)
+    assert not existence.full
+    # more ids than expected are scanned when the table grows meanwhile
+    await existence.build(ids(300), expected=100)
+    assert existence.full
+
+
+def test_existence_filter_needs_the_change_feed():
+    with pytest.raises(RepositoryException):
+        type("UnfedUserRepo", (UserRepo,), {"existence_filter_capacity": 100})
+
+
+@pytest.mark.asyncio
+async def test_missing_ids_are_answered_without_the_database(file_db):
+    repo = type("Worker0UserRepo", (FilteredUserRepo,), {})
+    user = await repo.create(UserSchema(username="andrey", password="secret"), UserSchema)
+    await repo.build_existence_filter()
+
+    sessions = repository.session_factory.call_count
+    with pytest.raises(NotFoundException):
+        await repo.find_one([FilterCondition(field="id", value=uuid.uuid4())], UserSchema)
+    assert await repo.delete([FilterCondition(field="id", value=uuid.uuid4())]) == 0
+    # the change log is read once to check for the creates of other processes
+    assert repository.session_factory.call_count <= sessions + 1
+
+    created = await repo.create(UserSchema(username="paul", password="secret"), UserSchema)
+    assert await repo.find_one([FilterCondition(field="id", value=created.id)], UserSchema) == created
+    assert await repo.delete([FilterCondition(field="id", value=user.id)]) == 1
+    with pytest.raises(NotFoundException):
+        await repo.find_one([FilterCondition(field="id", value=user.id)], UserSchema)
+
+
+@pytest.mark.asyncio
+async def test_creates_of_other_workers_are_read_from_the_change_log(file_db):
+    worker0 = type("Worker0UserRepo", (FilteredUserRepo,), {"existence_refresh_interval": 0.0})
+    worker1 = type("Worker1UserRepo", (FilteredUserRepo,), {})
+    await worker0.build_existence_filter()
+    user = await worker1.create(UserSchema(username="andrey", password="secret"), UserSchema)
+
+    assert await worker0.find_one([FilterCondition(field="id", value=user.id)], UserSchema) == user
+
+
+@pytest.mark.asyncio
+async def test_full_filter_is_rebuilt(file_db):
+    repo = type("SmallUserRepo", (FilteredUserRepo,), {"existence_filter_capacity": 1})
+    await repo.build_existence_filter()
+    users = [await repo.create(UserSchema(username=f"user{i}", password="secret"), UserSchema) for i in range(3)]
+    rebuild = repo.__dict__.get("_existence_rebuild")
+    if rebuild is not None:
+        await rebuild
+
+    assert not repo.existence_filter().full
+    for user in users:
+        assert await repo.might_exist(user.id)
@@ -0,0 +1,28 @@
+import time
+import uuid
+
+from unittest import mock
+
+from orm import ids
+
+
+def test_uuid7():
+    before = time.time_ns() // 1_000_000
+    generated = [ids.uuid7() for _ in range(10000)]
+    after = time.time_ns() // 1_000_000
+
+    assert generated == sorted(generated)
+    assert len(set(generated)) == len(generated)
+    assert {id.version for id in generated} == {7}
+    assert {id.variant for id in generated} == {uuid.RFC_4122}
+    assert before <= generated[0].int >> 80 <= generated[-1].int >> 80 <= after + 1
+
+
+def test_new_id_follows_the_configured_strategy():
+    ids.id_strategy.cache_clear()
+    try:
+        with mock.patch.dict("os.environ", {"ID_STRATEGY": "uuid4"}):
+            assert ids.new_id().version == 4
+    finally:
+        ids.id_strategy.cache_clear()
+    assert ids.new_id().version == 7
@@ -0,0 +1,97 @@
+import asyncio
+import pytest
+
+from orm import repository
+from orm.list_cache import ListCache
+from orm.repository import FilterCondition, FilterOps, FindQueryConfig, find_query_key, unit_of_work
+from .conftest import UserSchema, UserRepo
+
+
+class ListCachedUserRepo(UserRepo):
+    list_cache_size = 10
+
+
+def loader(values):
+    calls = []
+
+    async def load():
+        calls.append(None)
+        await asyncio.sleep(0)
+        return values[len(calls) - 1]
+
+    return load, calls
+
+
+@pytest.mark.asyncio
+async def test_concurrent_misses_load_once():
+    cache = ListCache("test.list_cache.misses", max_entries=10, ttl=60, stale_ttl=1)
+    load, calls = loader(["page"])
+    assert await asyncio.gather(*(cache.get("key", 0, load) for _ in range(5))) == ["page"] * 5
+    assert await cache.get("key", 0, load) == "page"
+    assert len(calls) == 1
+
+
+@pytest.mark.asyncio
+async def test_stale_results_are_served_while_revalidated():
+    cache = ListCache("test.list_cache.stale", max_entries=10, ttl=60, stale_ttl=1)
+    load, calls = loader(["old", "new"])
+    await cache.get("key", 0, load)
+
+    # a burst after a write gets the old result, which is loaded again once
+    assert await asyncio.gather(*(cache.get("key", 1, load) for _ in range(5))) == ["old"] * 5
+    await asyncio.sleep(0.01)
+    assert await cache.get("key", 1, load) == "new"
+    assert len(calls) == 2
+
+
+@pytest.mark.asyncio
+async def test_results_are_evicted_and_expire():
+    cache = ListCache("test.list_cache.lru", max_entries=2, ttl=0.05, stale_ttl=1)
+    load, calls = loader(["a", "b", "c", "a again", "b again"])
+    for key in "abc":
+        await cache.get(key, 0, load)
+    # the least recently used result goes first
+    assert await cache.get("a", 0, load) == "a again"
+    await asyncio.sleep(0.1)
+    assert await cache.get("c", 1, load) == "b again"
+    assert len(calls) == 5
+
+
+def test_key_ignores_the_order_of_conditions():
+    first = FilterCondition(field="username", value="andrey")
+    second = FilterCondition(field="password", operation=FilterOps.LIKE, value="secret")
+
+    def config(conditions):
+        return FindQueryConfig(response_schema=UserSchema, conditions=conditions, limit=10, order_by="username")
+
+    assert find_query_key(config([first, second])) == find_query_key(config([second, first]))
+    assert find_query_key(config([first])) != find_query_key(config([second]))
+
+
+@pytest.mark.asyncio
+async def test_lists_are_cached_until_a_write(file_db):
+    repo = type("FreshListUserRepo", (ListCachedUserRepo,), {"list_cache_stale_ttl": 0.0})
+    user = await repo.create(UserSchema(username="andrey", password="secret"), UserSchema)
+    query_config = FindQueryConfig(response_schema=UserSchema, limit=10, order_by="username")
+
+    assert await repo.find_list(query_config) == [user]
+    assert await repo.count_list() == 1
+    sessions = repository.session_factory.call_count
+    assert await repo.find_list(query_config) == [user]
+    assert await repo.count_list() == 1
+    assert repository.session_factory.call_count == sessions
+
+    created = await repo.create(UserSchema(username="paul", password="secret"), UserSchema)
+    assert await repo.find_list(query_config) == [user, created]
+    assert await repo.count_list() == 2
+
+    # read only units of work are served from the cache
+    sessions = repository.session_factory.call_count
+    async with unit_of_work():
+        assert await repo.find_list(query_config) == [user, created]
+    assert repository.session_factory.call_count == sessions + 1
+
+    async with unit_of_work():
+        await repo.delete([FilterCondition(field="id", value=user.id)])
+        assert await repo.find_list(query_config) == [created]
+    assert await repo.count_list() == 1
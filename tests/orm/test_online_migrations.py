@@ -0,0 +1,98 @@
+import uuid
+import pytest
+
+from alembic.migration import MigrationContext
+from alembic.operations import Operations
+from sqlalchemy import Column, MetaData, String, Table, create_engine, func, inspect, select
+from sqlalchemy_utils.types.uuid import UUIDType
+
+from orm.online_migrations import backfill_batches, checkpoint_table, create_index_concurrently
+
+
+ROWS = 20000
+
+user = Table(
+    "user",
+    MetaData(),
+    Column("id", UUIDType(), primary_key=True),
+    Column("email", String(255)),
+    Column("email_lower", String(255)),
+)
+
+
+@pytest.fixture(scope="module")
+def large_db(tmp_path_factory):
+    path = tmp_path_factory.mktemp("online_migrations") / "large.db"
+    engine = create_engine(f"sqlite:///{path}")
+    user.create(engine)
+    with engine.begin() as connection:
+        connection.execute(
+            user.insert(), [{"id": uuid.uuid4(), "email": f"User{i}@Example.com"} for i in range(ROWS)]
+        )
+    return path
+
+
+@pytest.fixture
+def engine(large_db, tmp_path):
+    # a fresh copy per test
+    copy = tmp_path / "copy.db"
+    copy.write_bytes(large_db.read_bytes())
+    engine = create_engine(f"sqlite:///{copy}")
+    yield engine
+    engine.dispose()
+
+
+def missing(connection):
+    return connection.execute(select(func.count()).where(user.c.email_lower.is_(None))).scalar_one()
+
+
+def test_backfill_in_batches(engine):
+    reported = []
+    with engine.connect() as connection:
+        rows = backfill_batches(
+            connection,
+            user,
+            {"email_lower": func.lower(user.c.email)},
+            where=user.c.email_lower.is_(None),
+            batch_size=3000,
+            progress=reported.append,
+        )
+        assert rows == ROWS
+        assert missing(connection) == 0
+        assert connection.execute(select(user.c.email_lower).limit(1)).scalar_one().startswith("user")
+
+    assert len(reported) == 7
+    assert [progress.rows for progress in reported] == [3000 * i for i in range(1, 7)] + [ROWS]
+    assert {progress.total for progress in reported} == {ROWS}
+    assert reported[-1].last_key == max(progress.last_key for progress in reported)
+
+
+def test_backfill_resumes_from_checkpoint(engine):
+    class Interrupted(Exception):
+        pass
+
+    def interrupt(progress):
+        if progress.batches == 2:
+            raise Interrupted()
+
+    values = {"email_lower": func.lower(user.c.email)}
+    with engine.connect() as connection:
+        with pytest.raises(Interrupted):
+            backfill_batches(connection, user, values, batch_size=5000, checkpoint="lower", progress=interrupt)
+        assert missing(connection) == ROWS - 10000
+        assert connection.execute(select(checkpoint_table.c.rows)).scalar_one() == 10000
+
+        reported = []
+        rows = backfill_batches(connection, user, values, batch_size=5000, checkpoint="lower", progress=reported.append)
+        assert rows == ROWS - 10000
+        assert len(reported) == 2
+        assert missing(connection) == 0
+        # done, a later backfill under the same name starts over
+        assert connection.execute(select(func.count()).select_from(checkpoint_table)).scalar_one() == 0
+
+
+def test_create_index_concurrently(engine):
+    with engine.connect() as connection:
+        with Operations.context(MigrationContext.configure(connection)):
+            create_index_concurrently("ix_user_email", "user", ["email"])
+        assert [index["name"] for index in inspect(connection).get_indexes("user")] == ["ix_user_email"]
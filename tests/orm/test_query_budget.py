@@ -0,0 +1,64 @@
+import logging
+import pytest
+
+from metrics import registry
+from orm.query_budget import count_queries, query_budget, statement_shape
+from orm.repository import FilterCondition, FilterOps, FindQueryConfig
+from .conftest import UserRepo, UserSchema
+
+
+def test_statement_shape():
+    assert statement_shape("SELECT id\n  FROM user WHERE id IN (?, ?,?)") == "SELECT id FROM user WHERE id IN (...)"
+    assert statement_shape("WHERE id IN ($1, $2)") == "WHERE id IN (...)"
+    assert statement_shape("VALUES (%(a_m0)s, %(b_m0)s), (%(a_m1)s, %(b_m1)s)") == "VALUES (...)"
+    assert statement_shape("WHERE count > (SELECT 1)") == "WHERE count > (SELECT 1)"
+
+
+@pytest.mark.asyncio
+async def test_queries_are_counted(db, users):
+    with count_queries() as outer:
+        await UserRepo.count()
+        with count_queries() as inner:
+            for user in users.values():
+                await UserRepo.find_one([FilterCondition(field="id", value=user.id)], UserSchema)
+
+    assert (outer.count, inner.count) == (4, 3)
+    assert outer.duration >= inner.duration > 0
+    # the lookups in a loop give themselves away
+    assert list(inner.duplicates().values()) == [3]
+    assert "3 x SELECT" in inner.describe()
+
+
+@pytest.mark.asyncio
+async def test_lookups_in_one_query_are_not_duplicates(db, users, assert_max_queries):
+    with assert_max_queries(1) as log:
+        ids = [user.id for user in users.values()]
+        query_config = FindQueryConfig(
+            response_schema=UserSchema, conditions=[FilterCondition(field="id", operation=FilterOps.IN, value=ids)]
+        )
+        assert len([entity async for entity in UserRepo.find(query_config)]) == 3
+    assert log.duplicates() == {}
+
+
+@pytest.mark.asyncio
+async def test_assert_max_queries(db, users, assert_max_queries):
+    with pytest.raises(AssertionError, match="More than 1 queries"):
+        with assert_max_queries(1):
+            await UserRepo.count()
+            await UserRepo.count()
+
+
+@pytest.mark.asyncio
+async def test_query_budget(db, users, caplog):
+    with caplog.at_level(logging.WARNING, logger="orm.query_budget"):
+        with query_budget("test.budget.within", 1):
+            await UserRepo.count()
+        with query_budget("test.budget.over", 1):
+            await UserRepo.count()
+            await UserRepo.count()
+
+    assert registry.summary("query_budget.test.budget.within.queries").snapshot()["max"] == 1
+    assert registry.counter("query_budget.test.budget.within.over_budget").value == 0
+    assert registry.counter("query_budget.test.budget.over.over_budget").value == 1
+    assert len(caplog.records) == 1
+    assert caplog.records[0].getMessage().startswith("test.budget.over has gone over its budget of 1 queries: 2 ")
@@ -1,8 +1,17 @@
+import asyncio
 import pytest
 
+from unittest.mock import patch
 from sqlalchemy import select, func, delete
 
-from orm.repository import FilterCondition, FindQueryConfig, FilterOps
+from orm.repository import (
+    FilterCondition,
+    FindQueryConfig,
+    FilterOps,
+    QueryTimeoutException,
+    query_timeout,
+    statement_timeout,
+)
 from .conftest import UserSchema, UserModel, UserRepo
 
 
@@ -89,3 +98,29 @@ async def test_find_one(users):
         response_schema=UserSchema,
     )
     assert user.username == "paul"
+
+
+@pytest.mark.asyncio
+async def test_query_timeout(users):
+    async def slow_execute(*args, **kwargs):
+        await asyncio.sleep(1)
+
+    assert await UserRepo.count() == 3
+    with query_timeout(0.01):
+        with patch("orm.repository.session_factory") as session_factory_mock:
+            session = session_factory_mock.return_value.__aenter__.return_value
+            session.execute = slow_execute
+            with pytest.raises(QueryTimeoutException):
+                await UserRepo.count()
+    assert statement_timeout.get() is None
+
+
+@pytest.mark.asyncio
+async def test_create_query_timeout(db):
+    async def slow_commit():
+        await asyncio.sleep(1)
+
+    with query_timeout(0.01):
+        with patch.object(db, "commit", slow_commit):
+            with pytest.raises(QueryTimeoutException):
+                await UserRepo.create(UserSchema(username="andrey", password="secret"), UserSchema)
@@ -0,0 +1,81 @@
+import pytest
+
+from uuid import uuid4
+
+from orm.repository import FilterCondition
+from orm.search import PrefixIndex
+from .conftest import UserSchema, UserRepo
+
+
+class SearchUserRepo(UserRepo):
+    search_fields = ("username",)
+
+
+async def rows_of(rows):
+    for row in rows:
+        yield row
+
+
+@pytest.mark.asyncio
+async def test_prefix_index():
+    ann, bob = uuid4(), uuid4()
+    index = PrefixIndex("test.search", ("first_name", "last_name"))
+    await index.build(rows_of([(ann, {"first_name": "Ann", "last_name": "Lee"}), (bob, {"first_name": "Bob"})]))
+
+    assert index.search("a") == [ann]
+    assert index.search(" LE") == [ann]
+    assert index.search("") == []
+
+    index.apply("update", [(bob, {"last_name": "Annis"})])
+    assert set(index.search("an")) == {ann, bob}
+    assert index.search("an", limit=1) == [ann]
+    assert index.search("bob") == [bob]
+
+    index.apply("update", [(bob, {"first_name": "Robert"})])
+    assert index.search("bob") == []
+    index.apply("delete", [(ann, {})])
+    assert index.search("an") == [bob]
+
+
+@pytest.mark.asyncio
+async def test_prefix_index_cache_is_invalidated_by_writes():
+    ann = uuid4()
+    index = PrefixIndex("test.search.cache", ("first_name",))
+    await index.build(rows_of([]))
+    assert index.search("an") == []
+    assert index.search("an") == []
+    assert index._cache_hits.snapshot() == {"value": 1}
+
+    index.apply("create", [(ann, {"first_name": "Ann"})])
+    assert index.search("an") == [ann]
+
+
+@pytest.mark.asyncio
+async def test_writes_during_build_are_replayed():
+    ann, bob = uuid4(), uuid4()
+    index = PrefixIndex("test.search.build", ("first_name",))
+
+    async def rows():
+        yield ann, {"first_name": "Ann"}
+        index.apply("create", [(bob, {"first_name": "Bob"})])
+        index.apply("delete", [(ann, {})])
+
+    await index.build(rows())
+    assert index.search("an") == []
+    assert index.search("bo") == [bob]
+
+
+@pytest.mark.asyncio
+async def test_repository_search(db, users):
+    found = await SearchUserRepo.search("ANDR", 10, UserSchema)
+    assert {user.username for user in found} == {"andrey", "andrew"}
+
+    user = await SearchUserRepo.create(UserSchema(username="andreas", password="secret"), UserSchema)
+    assert [found.id for found in await SearchUserRepo.search("andrea", 10, UserSchema)] == [user.id]
+
+    await SearchUserRepo.update_by_id(user.id, {"username": "paula"}, UserSchema)
+    assert await SearchUserRepo.search("andrea", 10, UserSchema) == []
+    assert len(await SearchUserRepo.search("pau", 10, UserSchema)) == 2
+
+    await SearchUserRepo.delete([FilterCondition(field="username", value="paul")])
+    assert [found.username for found in await SearchUserRepo.search("pau", 10, UserSchema)] == ["paula"]
@@ -0,0 +1,141 @@
+import pytest
+
+from uuid import uuid4
+
+from sqlalchemy import select
+
+from orm.changefeed.bus import event_bus
+from orm.repository import FilterCondition, FilterOps, FindQueryConfig, RepositoryException
+from orm.stats.dimensions import TOTAL, Dimension, initial
+from orm.sharding import ShardedSARepository, sharded, sort_key
+from tests.conftest import create_file_db
+from .conftest import UserSchema, UserRepo
+
+
+SHARDS = 3
+NAMES = ["andrey", "paul", "andrew", "mark", "olga", "ivan", "zoe", "bob", "anna", "kate"]
+
+
+@pytest.fixture
+async def shards(tmp_path, file_db):
+    engines, session_makers = [], []
+    for shard in range(SHARDS):
+        engine, session_maker = create_file_db(tmp_path / f"shard{shard}.db")
+        engines.append(engine)
+        session_makers.append(session_maker)
+    yield session_makers
+    for engine in engines:
+        await engine.dispose()
+
+
+@pytest.fixture
+def repo(shards):
+    return type(
+        "ShardedUserRepo",
+        (ShardedSARepository, UserRepo),
+        {"shards": shards, "change_feed": True, "stats_dimensions": {"initial": Dimension("username", initial)}},
+    )
+
+
+@pytest.fixture
+async def users(repo):
+    return [await repo.create(UserSchema(username=name, password="secret"), UserSchema) for name in NAMES]
+
+
+async def shard_usernames(session_maker):
+    async with session_maker() as session:
+        return set((await session.execute(select(UserRepo.model.username))).scalars())
+
+
+@pytest.mark.asyncio
+async def test_rows_are_spread_by_id(repo, shards, users):
+    spread = [await shard_usernames(session_maker) for session_maker in shards]
+    assert sum(len(names) for names in spread) == len(NAMES)
+    assert sum(1 for names in spread if names) > 1
+    for user in users:
+        assert user.username in spread[repo.shard_for(user.id)]
+
+
+@pytest.mark.asyncio
+async def test_point_operations(repo, users):
+    user = users[0]
+    assert await repo.find_one([FilterCondition(field="id", value=user.id)], UserSchema) == user
+
+    updated = await repo.update_by_id(user.id, {"username": "andy"}, UserSchema)
+    assert updated.username == "andy"
+
+    assert await repo.delete([FilterCondition(field="id", value=user.id)]) == 1
+    with pytest.raises(RepositoryException):
+        await repo.find_one([FilterCondition(field="id", value=user.id)], UserSchema)
+
+
+@pytest.mark.asyncio
+async def test_scatter_gather(repo, users):
+    assert await repo.count() == len(NAMES)
+    assert await repo.count(filters=[FilterCondition(field="username", operation=FilterOps.LIKE, value="an")]) == 4
+
+    async def usernames(**kwargs):
+        return [user.username async for user in repo.find(FindQueryConfig(response_schema=UserSchema, **kwargs))]
+
+    assert await usernames(order_by="username") == sorted(NAMES)
+    assert await usernames(order_by="-username") == sorted(NAMES, reverse=True)
+    assert await usernames(order_by="username", offset=2, limit=3) == sorted(NAMES)[2:5]
+    assert await usernames(order_by="-username", offset=8, limit=5) == sorted(NAMES, reverse=True)[8:]
+    assert len(set(await usernames(limit=4))) == 4
+
+    assert await repo.find_stats(TOTAL) == {"": len(NAMES)}
+    assert (await repo.find_stats("initial"))["A"] == 3
+    assert await repo.rebuild_stats() == len(NAMES)
+    assert (await repo.find_stats("initial"))["A"] == 3
+
+    assert await repo.delete([FilterCondition(field="username", operation=FilterOps.LIKE, value="an")]) == 4
+    assert await repo.count() == len(NAMES) - 4
+
+
+@pytest.mark.asyncio
+async def test_create_many_keeps_item_order(repo):
+    items = [(UserSchema(username=name, password="secret"), UserSchema) for name in NAMES]
+    created = await repo.create_many(items)
+    assert [user.username for user in created] == NAMES
+    assert await repo.count() == len(NAMES)
+
+
+@pytest.mark.asyncio
+async def test_change_log_stays_in_main_db(repo, users):
+    with event_bus.subscribe("test_user") as queue:
+        await repo.update_by_id(users[0].id, {"username": "andy"}, UserSchema)
+    changes = await repo.find_changes()
+    assert [change.operation for change in changes] == ["create"] * len(NAMES) + ["update"]
+    assert queue.get_nowait() == changes[-1]
+
+
+def test_sort_key():
+    andrey, paul = UserSchema(username="andrey", password="b"), UserSchema(username="paul", password="a")
+    assert sort_key(andrey, ["username"]) < sort_key(paul, ["username"])
+    assert sort_key(andrey, ["-username"]) > sort_key(paul, ["-username"])
+    assert sort_key(paul, ["password", "username"]) < sort_key(andrey, ["password", "username"])
+    # NULLs go last
+    assert sort_key(UserSchema(id=uuid4(), username="a", password="a"), ["id"]) < sort_key(andrey, ["id"])
+    with pytest.raises(RepositoryException):
+        sort_key(andrey, ["email"])
+
+
+def test_sharded_variant_is_cached():
+    assert sharded(UserRepo) is sharded(UserRepo)
+    assert issubclass(sharded(UserRepo), ShardedSARepository)
+    assert sharded(UserRepo).model is UserRepo.model
+
+
+@pytest.mark.asyncio
+async def test_bulk_writes(repo, users):
+    chunks = []
+    andr = [FilterCondition(field="username", operation=FilterOps.LIKE, value="andr")]
+    assert await repo.bulk_update(andr, {"password": "changed"}, chunk_size=1, progress=chunks.append) == 2
+    assert [progress.rows for progress in chunks] == [1, 2]
+
+    assert await repo.bulk_delete([FilterCondition(field="password", value="secret")], chunk_size=3) == 8
+    assert {user.username async for user in repo.find(FindQueryConfig(response_schema=UserSchema))} == {
+        "andrey",
+        "andrew",
+    }
+    assert await repo.find_stats(TOTAL) == {"": 2}
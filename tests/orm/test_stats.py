@@ -0,0 +1,98 @@
+import asyncio
+import pytest
+
+from unittest.mock import patch
+
+from orm.repository import FilterCondition, FilterOps
+from orm.stats.dimensions import TOTAL, Dimension, email_domain, initial
+from .conftest import UserSchema, UserRepo
+
+
+class StatsUserRepo(UserRepo):
+    stats_dimensions = {"username_initial": Dimension("username", initial)}
+
+
+def test_dimension_keys():
+    assert email_domain("Andrey@Example.COM") == "example.com"
+    assert email_domain("andrey") is None
+    assert initial(" paul") == "P"
+    assert initial("") is None
+
+
+@pytest.mark.asyncio
+async def test_stats_follow_writes(db):
+    andrey = await StatsUserRepo.create(UserSchema(username="andrey", password="secret"), UserSchema)
+    await StatsUserRepo.create_many(
+        [(UserSchema(username=name, password="secret"), UserSchema) for name in ("andrew", "paul")]
+    )
+    assert await StatsUserRepo.find_stats("username_initial") == {"A": 2, "P": 1}
+    assert await StatsUserRepo.find_stats(TOTAL) == {"": 3}
+
+    await StatsUserRepo.update_by_id(andrey.id, {"username": "mark"}, UserSchema)
+    await StatsUserRepo.update_by_id(andrey.id, {"password": "changed"}, UserSchema)
+    assert await StatsUserRepo.find_stats("username_initial") == {"A": 1, "M": 1, "P": 1}
+
+    await StatsUserRepo.delete([FilterCondition(field="username", operation=FilterOps.LIKE, value="and")])
+    assert await StatsUserRepo.find_stats("username_initial") == {"M": 1, "P": 1}
+    assert await StatsUserRepo.find_stats(TOTAL) == {"": 2}
+
+
+@pytest.mark.asyncio
+async def test_rebuild_stats(db, users):
+    # the fixture rows are inserted behind the repository's back
+    assert await StatsUserRepo.find_stats("username_initial") == {}
+
+    assert await StatsUserRepo.rebuild_stats() == 3
+    assert await StatsUserRepo.find_stats("username_initial") == {"A": 2, "P": 1}
+    assert await StatsUserRepo.rebuild_stats() == 3
+    assert await StatsUserRepo.find_stats(TOTAL) == {"": 3}
+
+
+@pytest.mark.asyncio
+async def test_repository_without_stats(db):
+    await UserRepo.create(UserSchema(username="andrey", password="secret"), UserSchema)
+    assert await UserRepo.find_stats(TOTAL) == {}
+
+
+@pytest.fixture
+def slow_tracked_rows():
+    """Leaves time for concurrent writes to read the same rows before the first one writes them."""
+    find_tracked_rows = StatsUserRepo.find_tracked_rows.__func__
+
+    async def read_then_wait(cls, session, conditions):
+        rows = await find_tracked_rows(cls, session, conditions)
+        await asyncio.sleep(0.1)
+        return rows
+
+    with patch.object(StatsUserRepo, "find_tracked_rows", classmethod(read_then_wait)):
+        yield
+
+
+@pytest.mark.asyncio
+async def test_concurrent_deletes_count_the_row_once(committing_db, slow_tracked_rows):
+    andrey = await StatsUserRepo.create(UserSchema(username="andrey", password="secret"), UserSchema)
+    await StatsUserRepo.create(UserSchema(username="paul", password="secret"), UserSchema)
+
+    by_id = [FilterCondition(field="id", value=andrey.id)]
+    deleted = await asyncio.gather(StatsUserRepo.delete(by_id), StatsUserRepo.delete(by_id))
+
+    assert sorted(deleted) == [0, 1]
+    assert await StatsUserRepo.find_stats(TOTAL) == {"": 1}
+    assert await StatsUserRepo.find_stats("username_initial") == {"P": 1}
+
+
+@pytest.mark.asyncio
+async def test_concurrent_updates_move_the_stats_of_the_rows_written(committing_db, slow_tracked_rows):
+    await StatsUserRepo.create_many(
+        [(UserSchema(username=name, password="secret"), UserSchema) for name in ("andrey", "andrew", "paul")]
+    )
+
+    by_initial = [FilterCondition(field="username", operation=FilterOps.LIKE, value="a")]
+    await asyncio.gather(
+        StatsUserRepo.update(by_initial, {"username": "mark"}),
+        StatsUserRepo.update(by_initial, {"username": "bob"}),
+    )
+
+    stats = await StatsUserRepo.find_stats("username_initial")
+    assert await StatsUserRepo.rebuild_stats() == 3
+    assert stats == await StatsUserRepo.find_stats("username_initial")
@@ -0,0 +1,85 @@
+import pytest
+
+from orm import repository
+from orm.changefeed.bus import event_bus
+from orm.repository import FilterCondition, RepositoryException, current_unit_of_work, unit_of_work
+from services.crud import api
+from .conftest import UserSchema, UserRepo
+
+
+class ChangeFeedUserRepo(UserRepo):
+    change_feed = True
+    change_feed_fields = ("username",)
+
+
+@pytest.mark.asyncio
+async def test_calls_share_one_session_and_commit(file_db):
+    async with unit_of_work():
+        user = await UserRepo.create(UserSchema(username="andrey", password="secret"), UserSchema)
+        await UserRepo.update_by_id(user.id, {"username": "andrew"}, UserSchema)
+        assert await UserRepo.count() == 1
+    assert repository.session_factory.call_count == 1
+
+    assert (await UserRepo.find_one([FilterCondition(field="id", value=user.id)], UserSchema)).username == "andrew"
+
+
+@pytest.mark.asyncio
+async def test_rollback_on_error(file_db):
+    with pytest.raises(ValueError):
+        async with unit_of_work():
+            await UserRepo.create(UserSchema(username="andrey", password="secret"), UserSchema)
+            raise ValueError()
+    assert await UserRepo.count() == 0
+    assert current_unit_of_work.get() is None
+
+
+@pytest.mark.asyncio
+async def test_hooks_run_after_commit(file_db):
+    with event_bus.subscribe("test_user") as queue:
+        async with unit_of_work() as uow:
+            async with unit_of_work() as nested:
+                assert nested is uow
+                await ChangeFeedUserRepo.create(UserSchema(username="andrey", password="secret"), UserSchema)
+            assert queue.empty()
+        assert [change.operation for change in [queue.get_nowait()]] == ["create"]
+
+        with pytest.raises(ValueError):
+            async with unit_of_work():
+                await ChangeFeedUserRepo.create(UserSchema(username="paul", password="secret"), UserSchema)
+                raise ValueError()
+        assert queue.empty()
+
+
+@pytest.mark.asyncio
+async def test_savepoint(file_db):
+    with event_bus.subscribe("test_user") as queue:
+        async with unit_of_work() as uow:
+            await ChangeFeedUserRepo.create(UserSchema(username="andrey", password="secret"), UserSchema)
+            with pytest.raises(RepositoryException):
+                async with uow.savepoint():
+                    await ChangeFeedUserRepo.create(UserSchema(username="paul", password="secret"), UserSchema)
+                    await ChangeFeedUserRepo.update_by_id(
+                        (await ChangeFeedUserRepo.find_one([], UserSchema)).id, {"missing": 1}, UserSchema
+                    )
+            async with uow.savepoint():
+                await ChangeFeedUserRepo.create(UserSchema(username="mark", password="secret"), UserSchema)
+
+    users = [user.username async for user in UserRepo.find(repository.FindQueryConfig(response_schema=UserSchema))]
+    assert sorted(users) == ["andrey", "mark"]
+    assert [queue.get_nowait().payload for _ in range(queue.qsize())] == [{"username": "andrey"}, {"username": "mark"}]
+
+
+@pytest.mark.asyncio
+async def test_action_scope_unit_of_work(file_db):
+    async with api.action_scope(api.DeleteURLConf(unit_of_work=True)):
+        assert current_unit_of_work.get() is not None
+    async with api.action_scope(api.DeleteURLConf()):
+        assert current_unit_of_work.get() is None
+
+    dependency = api.request_unit_of_work()
+    uow = await dependency.__anext__()
+    await UserRepo.create(UserSchema(username="andrey", password="secret"), UserSchema)
+    with pytest.raises(StopAsyncIteration):
+        await dependency.__anext__()
+    assert uow.session.info == {}
+    assert await UserRepo.count() == 1
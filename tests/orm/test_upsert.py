@@ -0,0 +1,88 @@
+import asyncio
+import pytest
+
+from domain.user import User as UserEntity
+from orm.repository import FilterCondition, RepositoryException, SARepository
+from orm.stats.dimensions import Dimension, email_domain
+from orm.user.models import User
+from .conftest import UserRepo, UserSchema
+
+
+class UpsertUserRepo(SARepository):
+    model = User
+    natural_key = "email"
+    change_feed = True
+    change_feed_fields = ("email", "first_name")
+    search_fields = ("first_name",)
+    stats_dimensions = {"email_domain": Dimension("email", email_domain)}
+
+
+def user(email, first_name="Andrey"):
+    return UserEntity(email=email, password="secret", first_name=first_name, last_name="Pavelchuk")
+
+
+@pytest.mark.asyncio
+async def test_upsert(db):
+    created = await UpsertUserRepo.upsert([user("andrey@example.com"), user("paul@example.org", "Paul")], UserEntity)
+    assert (created.inserted, created.updated) == (2, 0)
+    assert [entity.first_name for entity in created.entities] == ["Andrey", "Paul"]
+
+    result = await UpsertUserRepo.upsert(
+        [user("paul@example.org", "Pavel"), user("mark@example.org", "Mark"), user("paul@example.org", "Paolo")],
+        UserEntity,
+    )
+    # the last of the entities with the same key wins
+    assert (result.inserted, result.updated) == (1, 1)
+    assert [entity.first_name for entity in result.entities] == ["Paolo", "Mark"]
+
+    paul = await UpsertUserRepo.find_one([FilterCondition(field="email", value="paul@example.org")], UserEntity)
+    assert paul.first_name == "Paolo"
+    assert await UpsertUserRepo.count() == 3
+    assert await UpsertUserRepo.find_stats("email_domain") == {"example.com": 1, "example.org": 2}
+
+
+@pytest.mark.asyncio
+async def test_upsert_keeps_the_id(db):
+    class UserWithId(UserEntity):
+        id: object = None
+
+    created = await UpsertUserRepo.upsert([user("andrey@example.com")], UserWithId)
+    updated = await UpsertUserRepo.upsert([user("andrey@example.com", "Andrew")], UserWithId)
+    assert updated.entities[0].id == created.entities[0].id
+
+
+@pytest.mark.asyncio
+async def test_upsert_hooks(db):
+    await UpsertUserRepo.build_search_index()
+    with UpsertUserRepo.subscribe_changes() as subscription:
+        await UpsertUserRepo.upsert([user("andrey@example.com")], UserEntity)
+        await UpsertUserRepo.upsert(
+            [user("andrey@example.com", "Andrew"), user("paul@example.org", "Paul")], UserEntity
+        )
+        events = [await subscription.get() for _ in range(3)]
+    assert [(event.operation, event.payload["first_name"]) for event in events] == [
+        ("create", "Andrey"),
+        ("create", "Paul"),
+        ("update", "Andrew"),
+    ]
+    assert len(UpsertUserRepo.search_index().search("andrew")) == 1
+    assert UpsertUserRepo.search_index().search("andrey") == []
+
+
+@pytest.mark.asyncio
+async def test_concurrent_upserts_of_a_new_key(committing_db):
+    results = await asyncio.gather(
+        UpsertUserRepo.upsert([user("andrey@example.com")], UserEntity),
+        UpsertUserRepo.upsert([user("andrey@example.com", "Andrew")], UserEntity),
+    )
+
+    # the one which has waited for the other updates the row it has inserted
+    assert sorted((result.inserted, result.updated) for result in results) == [(0, 1), (1, 0)]
+    assert await UpsertUserRepo.count() == 1
+    assert await UpsertUserRepo.find_stats("email_domain") == {"example.com": 1}
+
+
+@pytest.mark.asyncio
+async def test_upsert_needs_a_natural_key(db):
+    with pytest.raises(RepositoryException):
+        await UserRepo.upsert([UserSchema(username="andrey", password="secret")], UserSchema)
@@ -0,0 +1,83 @@
+import asyncio
+import pytest
+
+from unittest.mock import patch, AsyncMock, Mock
+from fastapi import APIRouter
+
+from services.crud import api, admission
+from services.crud.admission import ConcurrencyLimiter, AdmissionRejected
+from services.common_schemas import ApiListResponse
+from ...orm.conftest import UserSchema, UserRepo
+
+
+@pytest.mark.asyncio
+async def test_limiter_runs_up_to_max_concurrency():
+    limiter = ConcurrencyLimiter(max_concurrency=2, queue_timeout=1)
+    running, max_running = 0, 0
+
+    async def request():
+        nonlocal running, max_running
+        async with limiter.acquire():
+            running += 1
+            max_running = max(max_running, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+
+    await asyncio.gather(*(request() for _ in range(5)))
+    assert max_running == 2
+
+
+@pytest.mark.asyncio
+async def test_limiter_sheds_after_queue_timeout():
+    limiter = ConcurrencyLimiter(max_concurrency=1, queue_timeout=0.01)
+    async with limiter.acquire():
+        with pytest.raises(AdmissionRejected) as exc_info:
+            async with limiter.acquire():
+                pass
+    assert exc_info.value.retry_after == 1
+
+
+@pytest.mark.asyncio
+async def test_limiter_sheds_when_queue_is_full():
+    limiter = ConcurrencyLimiter(max_concurrency=1, max_queue=0, queue_timeout=10)
+    async with limiter.acquire():
+        with pytest.raises(AdmissionRejected):
+            async with limiter.acquire():
+                pass
+
+
+@pytest.mark.asyncio
+async def test_limiter_sheds_immediately_on_saturated_pool():
+    limiter = ConcurrencyLimiter(max_concurrency=1, queue_timeout=10)
+    with patch.object(admission, "pool_saturation", return_value=1.0):
+        assert limiter.wait_budget() == 0
+        async with limiter.acquire():
+            with pytest.raises(AdmissionRejected):
+                async with limiter.acquire():
+                    pass
+
+
+@pytest.mark.asyncio
+async def test_list_action_is_throttled():
+    limiter = ConcurrencyLimiter(max_concurrency=1, queue_timeout=0.01)
+    urlconf = api.ListURLConf(response_model=ApiListResponse, entity_schema=UserSchema, admission=limiter)
+    with patch.object(api.service, "get_entities", AsyncMock(return_value=[])):
+        list_handler = api.add_list_action("User", APIRouter(), UserRepo, urlconf)
+
+    with patch.object(api.service, "get_entity_count", AsyncMock(return_value=0)):
+        async with limiter.acquire():
+            with pytest.raises(AdmissionRejected):
+                await list_handler()
+        response = await list_handler()
+    assert response.count == 0
+
+
+def test_pool_saturation():
+    pool = Mock(size=Mock(return_value=5), checkedout=Mock(return_value=2))
+    with patch.object(admission, "engine_factory") as engine_factory_mock:
+        engine_factory_mock.return_value.sync_engine.pool = pool
+        assert admission.pool_saturation() == 0.4
+        pool.checkedout.return_value = 7
+        assert admission.pool_saturation() == 1.0
+        engine_factory_mock.return_value.sync_engine.pool = object()
+        assert admission.pool_saturation() == 0.0
@@ -2,11 +2,11 @@ import pytest
 
 from uuid import uuid4
 from unittest.mock import patch, AsyncMock
-from fastapi import APIRouter
+from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 
-from orm.repository import FilterCondition
-from services.common_schemas import ApiListResponse
+from orm.repository import FilterCondition, UpsertResult
+from services.common_schemas import ApiListResponse, StatsResponse, UpsertResponse
 from services.crud import api
 from ...orm.conftest import UserSchema, UserRepo
 
@@ -114,3 +114,128 @@ async def test_add_delete_action():
     entity_id = uuid4()
     await delete_handler(entity_id)
     assert await service_handler.called_once_with(UserRepo, [FilterCondition(field="id", value=entity_id)])
+
+
+@pytest.mark.asyncio
+async def test_add_search_action():
+    urlconf = api.SearchURLConf(entity_schema=UserSchema, max_limit=5)
+    router = APIRouter()
+
+    user = UserSchema(id=uuid4(), username="andrew", password="secret")
+    service_handler = AsyncMock(return_value=[user])
+    with patch.object(api.service, "search_entities", service_handler):
+        search_handler = api.add_search_action("User", router, UserRepo, urlconf)
+
+    assert len(router.routes) == 1
+    route = router.routes[0]
+    assert route.methods == {"GET"}
+    assert route.path == "/search"
+    assert route.summary == "User Search"
+
+    assert await search_handler("and", limit=50) == [user]
+    service_handler.assert_awaited_once_with(UserRepo, "and", 5, UserSchema)
+
+
+@pytest.mark.asyncio
+async def test_add_stats_action():
+    urlconf = api.StatsURLConf(max_limit=5)
+    router = APIRouter()
+    repo = type("StatsRepo", (UserRepo,), {"stats_dimensions": {"username_initial": None}})
+
+    service_handler = AsyncMock(return_value=StatsResponse(dimension="username_initial", total=0, groups=[]))
+    with patch.object(api.service, "get_stats", service_handler):
+        stats_handler = api.add_stats_action("User", router, repo, urlconf)
+
+    route = router.routes[0]
+    assert route.path == "/stats"
+    assert route.response_model == StatsResponse
+
+    await stats_handler("username_initial", limit=50)
+    service_handler.assert_awaited_once_with(repo, "username_initial", 5)
+    with pytest.raises(HTTPException) as exc_info:
+        await stats_handler("email_domain")
+    assert exc_info.value.status_code == 422
+
+
+@pytest.mark.asyncio
+async def test_add_upsert_action():
+    user = UserSchema(username="andrew", password="secret")
+    urlconf = api.UpsertURLConf(
+        response_model=UpsertResponse, entity_type=UserSchema, entity_schema=UserSchema, max_batch_size=2
+    )
+    router = APIRouter()
+
+    service_handler = AsyncMock(return_value=UpsertResult([user], inserted=1, updated=0))
+    with patch.object(api.service, "upsert_entities", service_handler):
+        upsert_handler = api.add_upsert_action("User", router, UserRepo, urlconf)
+
+    route = router.routes[0]
+    assert route.path == "/upsert"
+    assert route.methods == {"POST"}
+    assert route.response_model == UpsertResponse
+
+    response = await upsert_handler(user)
+    service_handler.assert_awaited_once_with(UserRepo, [user], UserSchema)
+    assert (response.inserted, response.updated, response.results) == (1, 0, [user])
+    await upsert_handler([user, user])
+    with pytest.raises(HTTPException) as exc_info:
+        await upsert_handler([user] * 3)
+    assert exc_info.value.status_code == 422
+
+
+def test_crud_factory_names_actions():
+    router = APIRouter()
+    actions = {"delete": api.DeleteURLConf(query_budget=2), "get": api.GetURLConf(response_model=UserSchema)}
+    with patch.object(api, "add_delete_action") as add_delete, patch.object(api, "add_get_action") as add_get:
+        api.crud_factory("User", router, UserRepo, actions)
+
+    assert add_delete.call_args.args[3].name == "user.delete"
+    assert add_delete.call_args.args[3].query_budget == 2
+    assert add_get.call_args.args[3].name == "user.get"
+    # the confs passed in are left as they are
+    assert actions["delete"].name is None
+
+
+@pytest.mark.asyncio
+async def test_add_bulk_delete_action():
+    urlconf = api.BulkDeleteURLConf(filter_fields=("username",), chunk_size=10, chunk_pause=0.5)
+    router = APIRouter()
+
+    service_handler = AsyncMock(return_value=3)
+    with patch.object(api.service, "bulk_delete_entities", service_handler):
+        bulk_delete_handler = api.add_bulk_delete_action("User", router, UserRepo, urlconf)
+
+    route = router.routes[0]
+    assert route.path == "/bulk/delete"
+    assert route.methods == {"POST"}
+
+    conditions = [FilterCondition(field="username", value="andrew")]
+    response = await bulk_delete_handler(conditions, dry_run=True)
+    service_handler.assert_awaited_once_with(UserRepo, conditions, 10, 0.5, dry_run=True)
+    assert (response.rows, response.dry_run) == (3, True)
+    for conditions in ([], [FilterCondition(field="password", value="secret")]):
+        with pytest.raises(HTTPException) as exc_info:
+            await bulk_delete_handler(conditions)
+        assert exc_info.value.status_code == 422
+
+
+@pytest.mark.asyncio
+async def test_add_bulk_update_action():
+    class UpdateSchema(BaseModel):
+        username: str = None
+
+    urlconf = api.BulkUpdateURLConf(update_schema=UpdateSchema, filter_fields=("username",))
+    router = APIRouter()
+
+    service_handler = AsyncMock(return_value=2)
+    with patch.object(api.service, "bulk_update_entities", service_handler):
+        bulk_update_handler = api.add_bulk_update_action("User", router, UserRepo, urlconf)
+
+    assert router.routes[0].path == "/bulk/update"
+    conditions = [FilterCondition(field="username", value="andrew")]
+    response = await bulk_update_handler(conditions, UpdateSchema(username="paul"))
+    service_handler.assert_awaited_once_with(UserRepo, conditions, {"username": "paul"}, 1000, 0.0, dry_run=False)
+    assert response.rows == 2
+    with pytest.raises(HTTPException) as exc_info:
+        await bulk_update_handler(conditions, UpdateSchema())
+    assert exc_info.value.status_code == 422
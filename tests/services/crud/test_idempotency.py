@@ -0,0 +1,137 @@
+import asyncio
+import pytest
+
+from unittest.mock import AsyncMock, patch
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import JSONResponse
+
+from services.crud import api
+from services.crud.idempotency import (
+    InMemoryIdempotencyStore,
+    DBIdempotencyStore,
+    StoredResponse,
+    fingerprint_request,
+)
+from ...orm.conftest import UserSchema, UserRepo
+
+
+@pytest.mark.asyncio
+async def test_run_replays_stored_response():
+    store = InMemoryIdempotencyStore()
+    handler = AsyncMock(return_value={"username": "andrey"})
+
+    first = await store.run("key", "fp", handler)
+    second = await store.run("key", "fp", handler)
+
+    handler.assert_called_once()
+    assert first == {"username": "andrey"}
+    assert isinstance(second, JSONResponse)
+    assert second.body == b'{"username":"andrey"}'
+
+
+@pytest.mark.asyncio
+async def test_run_rejects_reused_key():
+    store = InMemoryIdempotencyStore()
+    await store.run("key", "fp", AsyncMock(return_value={}))
+    with pytest.raises(HTTPException) as exc_info:
+        await store.run("key", "another fp", AsyncMock(return_value={}))
+    assert exc_info.value.status_code == 422
+
+
+@pytest.mark.asyncio
+async def test_run_waits_for_in_flight_duplicate():
+    store = InMemoryIdempotencyStore()
+    calls = []
+
+    async def handler():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return {"id": 1}
+
+    first, second = await asyncio.gather(store.run("key", "fp", handler), store.run("key", "fp", handler))
+    assert len(calls) == 1
+    assert first == {"id": 1}
+    assert isinstance(second, JSONResponse)
+
+
+@pytest.mark.asyncio
+async def test_run_does_not_store_failures():
+    store = InMemoryIdempotencyStore()
+    with pytest.raises(ValueError):
+        await store.run("key", "fp", AsyncMock(side_effect=ValueError))
+    assert await store.run("key", "fp", AsyncMock(return_value=1)) == 1
+
+
+@pytest.mark.asyncio
+async def test_in_memory_store_is_bounded():
+    store = InMemoryIdempotencyStore(max_entries=2)
+    for key in ("a", "b", "c"):
+        await store.put(key, StoredResponse(fingerprint=key))
+    assert await store.get("a") is None
+    assert (await store.get("c")).fingerprint == "c"
+
+
+@pytest.mark.asyncio
+async def test_db_store(db):
+    store = DBIdempotencyStore(max_entries=2, prune_probability=1)
+    for key in ("a", "b", "c"):
+        assert await store.claim(key, key)
+        assert await store.get(key) is None
+        await store.put(key, StoredResponse(fingerprint=key, content={"key": key}))
+        await asyncio.sleep(0.001)
+    assert await store.get("a") is None
+    stored = await store.get("c")
+    assert stored.content == {"key": "c"}
+
+
+@pytest.mark.asyncio
+async def test_db_store_claims_across_workers(file_db):
+    first_worker, second_worker = DBIdempotencyStore(), DBIdempotencyStore()
+    second_worker.poll_interval = 0.01
+    handler = AsyncMock(return_value={"id": 1})
+
+    assert await first_worker.claim("key", "fp")
+    assert not await second_worker.claim("key", "fp")
+
+    duplicate = asyncio.ensure_future(second_worker.run("key", "fp", handler))
+    await asyncio.sleep(0.05)
+    await first_worker.put("key", StoredResponse(fingerprint="fp", content={"id": 1}))
+    response = await asyncio.wait_for(duplicate, 1)
+
+    handler.assert_not_called()
+    assert isinstance(response, JSONResponse)
+    assert response.body == b'{"id":1}'
+
+
+@pytest.mark.asyncio
+async def test_db_store_releases_failed_claims(file_db):
+    store = DBIdempotencyStore()
+    with pytest.raises(ValueError):
+        await store.run("key", "fp", AsyncMock(side_effect=ValueError))
+    assert await store.claim("key", "fp")
+
+
+@pytest.mark.asyncio
+async def test_db_store_takes_over_abandoned_claims(file_db):
+    first_worker, second_worker = DBIdempotencyStore(), DBIdempotencyStore(claim_timeout=0)
+    assert await first_worker.claim("key", "fp")
+    await asyncio.sleep(0.001)
+    assert await second_worker.claim("key", "fp")
+
+
+@pytest.mark.asyncio
+async def test_create_action_with_idempotency_key():
+    user = UserSchema(username="andrew", password="secret")
+    urlconf = api.CreateURLConf(
+        response_model=UserSchema, entity_type=UserSchema, idempotency_store=InMemoryIdempotencyStore()
+    )
+    service_handler = AsyncMock(return_value=user)
+    with patch.object(api.service, "create_entity", service_handler):
+        create_handler = api.add_create_action("User", APIRouter(), UserRepo, urlconf)
+
+    await create_handler(user, idempotency_key="key")
+    replayed = await create_handler(user, idempotency_key="key")
+
+    service_handler.assert_called_once()
+    assert isinstance(replayed, JSONResponse)
+    assert fingerprint_request(user) != fingerprint_request(UserSchema(username="paul", password="secret"))
@@ -0,0 +1,130 @@
+import asyncio
+import datetime
+import gzip
+import json
+import pytest
+
+from uuid import uuid4
+from unittest.mock import AsyncMock, patch
+from fastapi import APIRouter
+from pydantic import BaseModel
+
+from services.crud import api
+from services.crud.responses import FastJSONResponse, FastJSONStreamingResponse, to_primitive
+from services.common_schemas import ApiListResponse
+from ...orm.conftest import UserSchema, UserRepo
+
+
+async def call(response, accept_encoding=b"gzip, deflate"):
+    messages = []
+
+    async def receive():
+        # the streaming response listens for a disconnect while sending the body
+        await asyncio.sleep(1)
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {"type": "http", "headers": [(b"accept-encoding", accept_encoding)]}
+    await response(scope, receive, send)
+    headers = dict(messages[0]["headers"])
+    return headers, b"".join(message.get("body", b"") for message in messages[1:])
+
+
+def test_to_primitive():
+    user_id = uuid4()
+    created_at = datetime.datetime(2021, 11, 2, 14, 40)
+    user = UserSchema(id=user_id, username="andrey", password="secret")
+    assert to_primitive({"user": user, "created_at": created_at, "ids": (user_id,)}) == {
+        "user": {"id": str(user_id), "username": "andrey", "password": "secret"},
+        "created_at": "2021-11-02T14:40:00",
+        "ids": [str(user_id)],
+    }
+
+
+@pytest.mark.asyncio
+async def test_fast_json_response_gzip():
+    users = [UserSchema(id=uuid4(), username=f"user{i}", password="secret") for i in range(50)]
+    response = FastJSONResponse.with_gzip(min_size=100)(users)
+
+    headers, body = await call(response)
+    assert headers[b"content-encoding"] == b"gzip"
+    assert int(headers[b"content-length"]) == len(body)
+    assert len(json.loads(gzip.decompress(body))) == 50
+
+    headers, body = await call(FastJSONResponse.with_gzip(min_size=10 ** 6)(users))
+    assert b"content-encoding" not in headers
+    assert len(json.loads(body)) == 50
+
+    headers, body = await call(FastJSONResponse.with_gzip(min_size=100)(users), accept_encoding=b"identity")
+    assert b"content-encoding" not in headers
+
+
+@pytest.mark.asyncio
+async def test_fast_json_streaming_response():
+    async def users(amount):
+        for i in range(amount):
+            yield UserSchema(username=f"user{i}", password="secret")
+
+    headers, body = await call(FastJSONStreamingResponse.with_gzip(min_size=100)(users(50)))
+    assert headers[b"content-encoding"] == b"gzip"
+    assert len(json.loads(gzip.decompress(body))) == 50
+
+    headers, body = await call(FastJSONStreamingResponse.with_gzip(min_size=100)(users(1)))
+    assert b"content-encoding" not in headers
+    assert json.loads(body) == [{"id": None, "username": "user0", "password": "secret"}]
+
+    headers, body = await call(FastJSONStreamingResponse(users(0)))
+    assert body == b"[]"
+
+
+@pytest.mark.asyncio
+async def test_crud_factory_response_class():
+    router = APIRouter()
+    actions = {"list": api.ListURLConf(response_model=ApiListResponse, entity_schema=UserSchema)}
+    with patch.object(api.service, "get_entities", AsyncMock(return_value=[])):
+        api.crud_factory("User", router, UserRepo, actions, response_class=FastJSONResponse)
+        list_handler = router.routes[0].endpoint
+        with patch.object(api.service, "get_entity_count", AsyncMock(return_value=0)):
+            response = await list_handler()
+
+    assert isinstance(response, FastJSONResponse)
+    assert json.loads(response.body) == {"count": 0, "results": [], "next": None, "previous": None}
+    assert actions["list"].response_class is None
+
+
+@pytest.mark.asyncio
+async def test_render_filters_through_response_model():
+    class UserWithoutPassword(BaseModel):
+        username: str
+
+    user = UserSchema(username="andrey", password="secret")
+    urlconf = api.GetURLConf(response_model=UserWithoutPassword, response_class=FastJSONResponse)
+    with patch.object(api.service, "get_entity", AsyncMock(return_value=user)):
+        get_handler = api.add_get_action("User", APIRouter(), UserRepo, urlconf)
+        response = await get_handler(uuid4())
+    assert json.loads(response.body) == {"username": "andrey"}
+
+    urlconf = api.CreateURLConf(
+        response_model=UserWithoutPassword, entity_type=UserSchema, response_class=FastJSONResponse
+    )
+    service_handler = AsyncMock(return_value={"username": "paul", "password": "secret"})
+    urlconf = urlconf.copy(update={"service_handler": service_handler})
+    create_handler = api.add_create_action("User", APIRouter(), UserRepo, urlconf)
+    response = await create_handler(user)
+    assert json.loads(response.body) == {"username": "paul"}
+
+
+@pytest.mark.asyncio
+async def test_add_export_action():
+    async def entities(repo, schema, order_by):
+        yield UserSchema(username="andrey", password="secret")
+
+    urlconf = api.ExportURLConf(entity_schema=UserSchema, service_handler=entities)
+    router = APIRouter()
+    export_handler = api.add_export_action("User", router, UserRepo, urlconf)
+    assert router.routes[0].path == "/export"
+
+    headers, body = await call(await export_handler())
+    assert json.loads(body) == [{"id": None, "username": "andrey", "password": "secret"}]
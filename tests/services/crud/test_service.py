@@ -44,7 +44,7 @@ async def test_get_entity(user):
 @pytest.mark.asyncio
 async def test_get_entity_count():
     count_mock = AsyncMock(return_value=5)
-    with patch.object(UserRepo, "count", count_mock):
+    with patch.object(UserRepo, "count_list", count_mock):
         count = await service.get_entity_count(UserRepo, ["cond1", "cond2"])
     count_mock.assert_called_once_with(["cond1", "cond2"])
     assert count == 5
@@ -67,3 +67,12 @@ async def test_delete_entity(user):
         count = await service.delete_entity(UserRepo, ["cond1", "cond2"])
     delete_mock.assert_called_once_with(["cond1", "cond2"])
     assert count == 5
+
+
+@pytest.mark.asyncio
+async def test_get_stats():
+    stats = {"username_initial": {"A": 2, "P": 2, "M": 1}, "total": {"": 5}}
+    with patch.object(UserRepo, "find_stats", AsyncMock(side_effect=stats.get)):
+        response = await service.get_stats(UserRepo, "username_initial", 2)
+    assert response.total == 5
+    assert [(group.value, group.count) for group in response.groups] == [("A", 2), ("P", 2)]
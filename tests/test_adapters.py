@@ -1,4 +1,9 @@
-from adapters import convert_schema_to_model, convert_model_to_schema
+import uuid
+import pytest
+
+from pydantic import validator, constr, ValidationError
+
+from adapters import convert_schema_to_model, convert_model_to_schema, convert_rows_to_schemas, get_row_mapping
 from .orm.conftest import UserSchema, UserModel
 
 
@@ -17,3 +22,39 @@ def test_convert_schema_to_model():
     assert isinstance(model, UserModel)
     assert model.username == "andrey"
     assert model.password == "secret"
+
+
+def test_convert_rows_to_schemas():
+    models = [UserModel(username="andrey", password="secret"), UserModel(username="paul", password="secret1")]
+    schemas = convert_rows_to_schemas(models, UserSchema)
+    assert [schema.username for schema in schemas] == ["andrey", "paul"]
+    assert all(isinstance(schema, UserSchema) for schema in schemas)
+    assert get_row_mapping(UserModel, UserSchema) == (("id", "id"), ("username", "username"), ("password", "password"))
+
+
+def test_convert_rows_to_schemas_falls_back_to_from_orm():
+    class UserWithComputedField(UserSchema):
+        display_name: str = "anonymous"
+
+    schemas = convert_rows_to_schemas([UserModel(username="andrey", password="secret")], UserWithComputedField)
+    assert get_row_mapping(UserModel, UserWithComputedField) is None
+    assert schemas[0].username == "andrey"
+    assert schemas[0].display_name == "anonymous"
+
+
+def test_convert_rows_to_schemas_matches_from_orm():
+    class LowercaseUserSchema(UserSchema):
+        @validator("username")
+        def lowercase_username(cls, value):
+            return value.lower()
+
+    class ShortUsernameSchema(UserSchema):
+        username: constr(max_length=3)
+
+    models = [UserModel(id=uuid.uuid4(), username="ANDREY", password="secret")]
+    for schema in (UserSchema, LowercaseUserSchema):
+        assert convert_rows_to_schemas(models, schema) == [convert_model_to_schema(models[0], schema)]
+    assert get_row_mapping(UserModel, LowercaseUserSchema) is None
+    assert get_row_mapping(UserModel, ShortUsernameSchema) is None
+    with pytest.raises(ValidationError):
+        convert_rows_to_schemas(models, ShortUsernameSchema)
@@ -0,0 +1,73 @@
+import asyncio
+import pytest
+
+from middleware import CancelOnDisconnectMiddleware
+
+
+@pytest.mark.asyncio
+async def test_handler_is_cancelled_on_disconnect():
+    cancelled = asyncio.Event()
+
+    async def app(scope, receive, send):
+        assert (await receive())["type"] == "http.request"
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    messages = [{"type": "http.request", "body": b"", "more_body": False}, {"type": "http.disconnect"}]
+
+    async def receive():
+        if len(messages) == 1:
+            await asyncio.sleep(0.01)
+        return messages.pop(0)
+
+    async def send(message):
+        pass
+
+    await asyncio.wait_for(CancelOnDisconnectMiddleware(app)({"type": "http"}, receive, send), 1)
+    assert cancelled.is_set()
+
+
+@pytest.mark.asyncio
+async def test_completed_response_is_not_cancelled():
+    sent = []
+
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"ok"})
+        await asyncio.sleep(0.02)  # background task after the response
+        sent.append("background")
+
+    async def receive():
+        await asyncio.sleep(0.01)
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        sent.append(message["type"])
+
+    await CancelOnDisconnectMiddleware(app)({"type": "http"}, receive, send)
+    assert sent == ["http.response.start", "http.response.body", "background"]
+
+
+@pytest.mark.asyncio
+async def test_handler_is_cancelled_with_middleware():
+    cancelled = asyncio.Event()
+
+    async def app(scope, receive, send):
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    async def receive():
+        await asyncio.sleep(10)
+
+    middleware_task = asyncio.ensure_future(CancelOnDisconnectMiddleware(app)({"type": "http"}, receive, None))
+    await asyncio.sleep(0.01)
+    middleware_task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await middleware_task
+    assert cancelled.is_set()
@@ -0,0 +1,122 @@
+import json
+import pytest
+
+from unittest import mock
+
+from orm.repository import FindQueryConfig, unit_of_work
+from tests.orm.conftest import UserSchema, UserRepo
+from tracing import (
+    FileExporter,
+    MemoryExporter,
+    Tracer,
+    TracingMiddleware,
+    parse_traceparent,
+    span,
+    trace,
+    traced,
+)
+
+
+TRACEPARENT = "00-0af7651916cd43dd8448eb211c80319c-b7ad6b7169203331-01"
+
+
+def test_parse_traceparent():
+    assert parse_traceparent(TRACEPARENT) == ("0af7651916cd43dd8448eb211c80319c", "b7ad6b7169203331", True)
+    assert parse_traceparent(TRACEPARENT[:-1] + "0")[2] is False
+    assert parse_traceparent("00-" + "0" * 32 + "-b7ad6b7169203331-01") is None
+    assert parse_traceparent("garbage") is None
+    assert parse_traceparent(None) is None
+
+
+def test_sampling():
+    assert Tracer(MemoryExporter(), sample_rate=0.0).start_trace("request") is None
+    # the sampled flag of the caller is ignored unless followed
+    assert Tracer(MemoryExporter(), sample_rate=0.0).start_trace("request", TRACEPARENT) is None
+    root = Tracer(MemoryExporter(), sample_rate=1.0).start_trace("request", TRACEPARENT[:-1] + "0")
+    assert (root.trace.trace_id, root.parent_id) == ("0af7651916cd43dd8448eb211c80319c", "b7ad6b7169203331")
+
+    follower = Tracer(MemoryExporter(), sample_rate=0.0, follow_caller=True)
+    assert follower.start_trace("request", TRACEPARENT) is not None
+    follower.sample_rate = 1.0
+    assert follower.start_trace("request", TRACEPARENT[:-1] + "0") is None
+
+
+@traced
+async def create_and_list():
+    await UserRepo.create(UserSchema(username="andrey", password="secret"), UserSchema)
+    async with unit_of_work():
+        return [user async for user in UserRepo.find(FindQueryConfig(response_schema=UserSchema))]
+
+
+def tree(spans):
+    names = {span["span_id"]: span["name"] for span in spans}
+    return {(names.get(span["parent_id"]), span["name"]) for span in spans}
+
+
+@pytest.mark.asyncio
+async def test_spans_nest_down_to_the_statements(file_db):
+    exporter = MemoryExporter(max_traces=2)
+    root = Tracer(exporter, sample_rate=1.0).start_trace("request")
+    with trace(root):
+        with span("action", user="andrey"):
+            assert len(await create_and_list()) == 1
+    # not sampled
+    assert len(await create_and_list()) == 2
+
+    [spans] = exporter.traces()
+    assert spans[-1]["name"] == "request"
+    assert tree(spans) >= {
+        (None, "request"),
+        ("request", "action"),
+        ("action", "create_and_list"),
+        ("create_and_list", "UserRepo.create"),
+        ("UserRepo.insert_one", "session.connect"),
+        ("UserRepo.commit", "sql"),
+        ("create_and_list", "UnitOfWork.commit"),
+        ("UserRepo.find", "sql"),
+    }
+    assert {span["trace_id"] for span in spans} == {root.trace.trace_id}
+    assert any(span["attributes"].get("statement", "").startswith("SELECT test_user.id") for span in spans)
+
+
+@pytest.mark.asyncio
+async def test_failed_calls_are_recorded(file_db):
+    exporter = MemoryExporter()
+    with pytest.raises(ZeroDivisionError):
+        with trace(Tracer(exporter, sample_rate=1.0).start_trace("request")):
+            with span("action"):
+                1 / 0
+    assert [span["error"] for span in exporter.traces()[0]] == ["ZeroDivisionError('division by zero')"] * 2
+
+
+def test_file_exporter(tmp_path):
+    exporter = FileExporter(str(tmp_path / "traces.jsonl"))
+    with trace(Tracer(exporter, sample_rate=1.0).start_trace("request")):
+        with span("action"):
+            pass
+    with open(tmp_path / "traces.jsonl") as file:
+        assert [json.loads(line)["name"] for line in file] == ["action", "request"]
+
+
+@pytest.mark.asyncio
+async def test_middleware_continues_the_trace_of_the_caller():
+    sent = []
+
+    async def app(scope, receive, send):
+        with span("action"):
+            await send({"type": "http.response.start", "status": 200, "headers": []})
+            await send({"type": "http.response.body", "body": b"ok"})
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "method": "GET", "path": "/users/", "headers": [(b"traceparent", TRACEPARENT.encode())]}
+    exporter = MemoryExporter()
+    with mock.patch("tracing.tracer", return_value=Tracer(exporter, sample_rate=0.0, follow_caller=True)):
+        await TracingMiddleware(app)(scope, None, send)
+
+    [spans] = exporter.traces()
+    assert [span["name"] for span in spans] == ["action", "GET /users/"]
+    assert spans[-1]["parent_id"] == "b7ad6b7169203331"
+    assert spans[-1]["attributes"] == {"status": 200}
+    assert dict(sent[0]["headers"])[b"traceparent"] == f"00-{spans[-1]['trace_id']}-{spans[-1]['span_id']}-01".encode()
@@ -0,0 +1,307 @@
+"""Lightweight tracing of requests through the api, service and repository layers down to the SQL statements.
+
+A trace is started per sampled request by :class:`TracingMiddleware`, continuing the one of an incoming W3C
+``traceparent`` header. Within it, :func:`span` blocks and :func:`traced` functions record child spans of the
+current span; outside of a sampled trace they cost a context variable lookup. Traces are exported once their root
+span ends, to the exporter named by TRACE_EXPORTER: ``memory`` keeps the last TRACE_BUFFER_SIZE traces for
+``GET /admin/traces``, ``file`` appends their spans as JSON lines to TRACE_PATH. Tracing is off when it is not set.
+TRACE_SAMPLE_RATE is the share of the requests traced. The sampled flag of the callers is only followed with
+TRACE_FOLLOW_CALLER=true, for callers which are trusted not to have every request traced.
+"""
+import functools
+import inspect
+import json
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+
+from abc import ABC, abstractmethod
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import lru_cache
+from typing import Any, AsyncIterator, Callable, Deque, Dict, Iterator, List, Optional, Tuple, TypeVar
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from config import Config
+
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+TRACEPARENT = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+
+class Trace:
+    """Spans of a trace within the process, exported together when the root span ends."""
+
+    def __init__(self, trace_id: str, exporter: "SpanExporter"):
+        self.trace_id = trace_id
+        self.exporter = exporter
+        self.spans: List["Span"] = []
+        self.exported = False
+
+
+class Span:
+    def __init__(self, name: str, trace: Trace, parent_id: Optional[str], attributes: Dict[str, Any]):
+        self.name = name
+        self.trace = trace
+        self.span_id = f"{random.getrandbits(64):016x}"
+        # the span of the caller for a root span continuing a trace
+        self.parent_id = parent_id
+        self.attributes = attributes
+        self.error: Optional[str] = None
+        self.start = time.time()
+        self.duration: Optional[float] = None
+        self._started_at = time.perf_counter()
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace.trace_id}-{self.span_id}-01"
+
+    def child(self, name: str, attributes: Dict[str, Any]) -> "Span":
+        return Span(name, self.trace, self.span_id, attributes)
+
+    def end(self, duration: Optional[float] = None):
+        self.duration = duration if duration is not None else time.perf_counter() - self._started_at
+        # spans of background tasks outliving their request are dropped
+        if not self.trace.exported:
+            self.trace.spans.append(self)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": self.start,
+            "duration": self.duration,
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+class SpanExporter(ABC):
+    @abstractmethod
+    def export(self, spans: List[Dict[str, Any]]):
+        """Takes the spans of a trace, the root one last."""
+        pass
+
+
+class MemoryExporter(SpanExporter):
+    """Ring buffer of the last traces of the process."""
+
+    def __init__(self, max_traces: int = 100):
+        self._traces: Deque[List[Dict[str, Any]]] = deque(maxlen=max_traces)
+
+    def export(self, spans: List[Dict[str, Any]]):
+        self._traces.append(spans)
+
+    def traces(self) -> List[List[Dict[str, Any]]]:
+        """Traces from the latest one."""
+        return list(reversed(self._traces))
+
+
+class FileExporter(SpanExporter):
+    """Appends the spans to a file, a JSON object per line."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, spans: List[Dict[str, Any]]):
+        lines = "".join(json.dumps(span, default=str) + "\n" for span in spans)
+        # a single write per trace, from the worker processes sharing the file
+        with self._lock, open(self.path, "a") as file:
+            file.write(lines)
+
+
+class Tracer:
+    def __init__(self, exporter: SpanExporter, sample_rate: float, follow_caller: bool = False):
+        self.exporter = exporter
+        self.sample_rate = sample_rate
+        # whether the sampled flag of the traceparent header decides, instead of the sample rate
+        self.follow_caller = follow_caller
+
+    def start_trace(self, name: str, traceparent: Optional[str] = None, **attributes) -> Optional[Span]:
+        """Root span of a new trace, or of the trace of the ``traceparent`` header; None when it is not sampled."""
+        parent = parse_traceparent(traceparent)
+        if parent is not None:
+            trace_id, parent_id, caller_sampled = parent
+        else:
+            trace_id, parent_id, caller_sampled = f"{random.getrandbits(128):032x}", None, False
+        if parent is not None and self.follow_caller:
+            sampled = caller_sampled
+        else:
+            sampled = random.random() < self.sample_rate
+        if not sampled:
+            return None
+        return Span(name, Trace(trace_id, self.exporter), parent_id, attributes)
+
+
+def parse_traceparent(traceparent: Optional[str]) -> Optional[Tuple[str, str, bool]]:
+    """Trace id, parent span id and sampled flag of a W3C traceparent header."""
+    match = TRACEPARENT.match(traceparent.strip().lower()) if traceparent else None
+    if match is None:
+        return None
+    trace_id, parent_id, flags = match.groups()
+    if trace_id == "0" * 32 or parent_id == "0" * 16:
+        return None
+    return trace_id, parent_id, bool(int(flags, 16) & 1)
+
+
+span_exporters: Dict[str, Callable[[], SpanExporter]] = {
+    "memory": lambda: MemoryExporter(int(Config.get("TRACE_BUFFER_SIZE", 100))),
+    "file": lambda: FileExporter(
+        Config.get("TRACE_PATH", os.path.join(tempfile.gettempdir(), "fastapi-tryout-traces.jsonl"))
+    ),
+}
+
+
+@lru_cache
+def tracer() -> Optional[Tracer]:
+    """The tracer exporting to TRACE_EXPORTER, None when tracing is off."""
+    name = Config.get("TRACE_EXPORTER", "")
+    if not name:
+        return None
+    return Tracer(
+        span_exporters[name](),
+        float(Config.get("TRACE_SAMPLE_RATE", 0.01)),
+        Config.get("TRACE_FOLLOW_CALLER", "").lower() in ("1", "true", "yes"),
+    )
+
+
+current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+@contextmanager
+def trace(root: Span) -> Iterator[Span]:
+    """Makes the root span current within the block, exporting the trace when it ends."""
+    try:
+        with activate(root):
+            yield root
+    finally:
+        root.trace.exported = True
+        root.trace.exporter.export([span.to_dict() for span in root.trace.spans])
+
+
+@contextmanager
+def span(name: str, **attributes) -> Iterator[Optional[Span]]:
+    """Child span of the current one over the block, nothing when the request is not traced."""
+    parent = current_span.get()
+    if parent is None:
+        yield None
+        return
+    with activate(parent.child(name, attributes)) as child:
+        yield child
+
+
+@contextmanager
+def activate(span: Span) -> Iterator[Span]:
+    token = current_span.set(span)
+    try:
+        yield span
+    except BaseException as exc:
+        span.error = repr(exc)
+        raise
+    finally:
+        current_span.reset(token)
+        span.end()
+
+
+def record_span(name: str, duration: float, error: Optional[BaseException] = None, **attributes):
+    """Adds a child span which has already ended, such as a statement timed by the events of the engine."""
+    parent = current_span.get()
+    if parent is None:
+        return
+    child = parent.child(name, attributes)
+    child.start -= duration
+    if error is not None:
+        child.error = repr(error)
+    child.end(duration)
+
+
+def traced(func: F) -> F:
+    """Records the calls of a coroutine or async generator function in spans named after it."""
+    return trace_calls(func, lambda args: func.__qualname__)
+
+
+def traced_method(func: F) -> F:
+    """Records the calls of a classmethod in spans named after the class it is called on."""
+    return trace_calls(func, lambda args: f"{args[0].__name__}.{func.__name__}")
+
+
+def trace_calls(func: F, span_name: Callable[[Tuple[Any, ...]], str]) -> F:
+    if inspect.isasyncgenfunction(func):
+
+        @functools.wraps(func)
+        def generator_wrapper(*args, **kwargs):
+            # the items of generators outside of a sampled trace are not handed through one more generator
+            if current_span.get() is None:
+                return func(*args, **kwargs)
+            return traced_generator(span_name(args), func(*args, **kwargs))
+
+        return generator_wrapper  # type: ignore
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        if current_span.get() is None:
+            return await func(*args, **kwargs)
+        with span(span_name(args)):
+            return await func(*args, **kwargs)
+
+    return wrapper  # type: ignore
+
+
+async def traced_generator(name: str, generator: AsyncIterator[Any]) -> AsyncIterator[Any]:
+    # the span is current while the generator runs only, not while the caller handles the items
+    parent = current_span.get()
+    child = parent.child(name, {})  # type: ignore
+    try:
+        while True:
+            token = current_span.set(child)
+            try:
+                item = await generator.__anext__()
+            except StopAsyncIteration:
+                break
+            finally:
+                current_span.reset(token)
+            yield item
+    except BaseException as exc:
+        if not isinstance(exc, GeneratorExit):
+            child.error = repr(exc)
+        raise
+    finally:
+        await generator.aclose()  # type: ignore
+        child.end()
+
+
+class TracingMiddleware:
+    """Traces the sampled requests, replying with the ``traceparent`` of their root span."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        root = None
+        current_tracer = tracer()
+        if scope["type"] == "http" and current_tracer is not None:
+            root = current_tracer.start_trace(
+                f"{scope['method']} {scope['path']}", Headers(scope=scope).get("traceparent")
+            )
+        if root is None:
+            await self.app(scope, receive, send)
+            return
+
+        async def send_wrapper(message: Message):
+            if message["type"] == "http.response.start":
+                MutableHeaders(scope=message).append("traceparent", root.traceparent)  # type: ignore
+                root.attributes["status"] = message["status"]  # type: ignore
+            await send(message)
+
+        with trace(root):
+            await self.app(scope, receive, send_wrapper)